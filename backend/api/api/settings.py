@@ -301,3 +301,61 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# Shop catalog listings
+
+SHOP_PRODUCT_PAGE_SIZE = 50
+SHOP_PRODUCT_MAX_PAGE_SIZE = 500
+SHOP_PRODUCT_STREAM_CHUNK_SIZE = 2000
+
+SHOP_SEARCH_PAGE_SIZE = 20
+
+# Lower bounds of the price facet buckets, in UGX.
+SHOP_PRICE_BUCKETS = [0, 10000, 50000, 100000, 500000]
+
+# Each process keeps its own facet index; writes bump a version in this cache so the others rebuild theirs,
+# and the TTL bounds how stale a copy can get when that cache is per process or a write bypasses the signals.
+SHOP_FACET_INDEX_CACHE_ALIAS = "default"
+SHOP_FACET_INDEX_TTL = 300  # seconds
+
+# Cart storage: "shop.cart_store.ORMCartStore" writes through to the database,
+# "shop.cart_store.CacheCartStore" keeps carts in the cache below and writes them behind; that alias must be a
+# RedisCache running with maxmemory-policy noeviction, since it holds the only copy of unflushed carts.
+SHOP_CART_STORE = "shop.cart_store.ORMCartStore"
+SHOP_CART_CACHE_ALIAS = "default"
+SHOP_CART_FLUSH_BATCH_SIZE = 500
+SHOP_CART_ACTIVITY_RESOLUTION = 60  # seconds between Cart.updated_at writes
+
+SHOP_CATALOG_CACHE_SIZE = 256
+SHOP_CATALOG_CACHE_TTL = 300  # seconds
+
+# How long a checkout response is kept for replay under its Idempotency-Key.
+SHOP_IDEMPOTENCY_TTL = 24 * 60 * 60  # seconds
+
+# How long starting checkout holds the cart's stock before the sweeper releases it.
+SHOP_RESERVATION_TTL = 10 * 60  # seconds
+
+# Background job queue run by `manage.py run_workers`.
+SHOP_JOB_MAX_ATTEMPTS = 5
+SHOP_JOB_BACKOFF_BASE = 2  # seconds before the first retry, doubling per attempt
+SHOP_JOB_BACKOFF_MAX = 600  # seconds
+SHOP_JOB_VISIBILITY_TIMEOUT = 300  # seconds a claimed job stays hidden from other workers
+
+# Live top-selling products sketch: products tracked per sketch, and how often each process syncs it.
+SHOP_TOP_PRODUCTS_CAPACITY = 1000
+SHOP_SKETCH_PERSIST_INTERVAL = 60  # seconds
+
+# Daily unique customer HyperLogLog sketches: 2 ** precision registers each, about 1.04 / sqrt(2 ** precision) error.
+# Sketches of different precisions cannot be merged, so rebuild them with backfill_sales_rollups after changing it.
+SHOP_CUSTOMER_SKETCH_PRECISION = 12
+
+# Memoized analytics results; order writes invalidate this process's copy, other processes' age out after the TTL.
+SHOP_ANALYTICS_CACHE_SIZE = 256
+SHOP_ANALYTICS_CACHE_TTL = 60  # seconds
+
+# Rows fetched per round trip by order exports, and rows per CSV write or columnar row group.
+SHOP_EXPORT_CHUNK_SIZE = 5000
+
+# Most periods a revenue time series may return in one request.
+SHOP_TIME_SERIES_MAX_POINTS = 5000
@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from functools import wraps
+from typing import Any
+
+from django.conf import settings
+
+_MISSING = object()
+
+
+class LRUCache:
+    """ Bounded in-process cache with least-recently-used and time-to-live eviction. """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """ Returns the cached value for key, or default if it is missing or expired. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """ Stores value under key, evicting the least recently used entries beyond max_size. """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """ Returns the cached value for key, building and storing it on a miss. """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = build()
+            self.set(key, value)
+        return value
+
+    def discard(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """ Drops every entry whose key and value satisfy predicate; returns how many were dropped. """
+        with self._lock:
+            doomed = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            for key in doomed:
+                del self._entries[key]
+            return len(doomed)
+
+    def clear(self) -> None:
+        """ Drops every entry and resets the counters. """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """ Reports the current size and hit/miss counters. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CatalogCache(LRUCache):
+    """ Caches serialized catalog payloads under a version that is bumped whenever catalog data changes.
+
+    Entries written under an older version are never read again and age out through LRU/TTL eviction.
+    The version is per process, so the TTL bounds how stale another worker's copy can get.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.version = 0
+
+    def bump_version(self) -> None:
+        """ Invalidates every payload cached so far. """
+        with self._lock:
+            self.version += 1
+
+    def get_or_set(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        # Capture the version before building so a concurrent write can never be hidden behind a stale payload.
+        return super().get_or_set((self.version, key), build)
+
+    def discard_product(self, product_id: int) -> int:
+        """ Drops the cached product pages that list product_id, leaving every other payload in place. """
+        return self.discard(lambda key, value: key[1][0] == "products" and any(row["id"] == product_id for row in value[0]))
+
+    def stats(self) -> dict:
+        return {**super().stats(), "version": self.version}
+
+
+class AnalyticsCache(CatalogCache):
+    """ Memoizes analytics results under a version bumped by order writes, building each missing key only once at a time.
+
+    Concurrent callers that miss on the same key wait for the first caller's build instead of running the
+    same aggregate themselves; if that build raises, one of the waiters builds in its place.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self._building: dict[Hashable, threading.Event] = {}
+        self.collapsed = 0
+
+    def get_or_set(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        key = (self.version, key)
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            with self._lock:
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    break
+                self.collapsed += 1
+            building.wait()
+        try:
+            value = build()
+            self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._building[key]
+            building.set()
+
+    def memoize(self, func: Callable) -> Callable:
+        """ Caches func's results keyed by its name and arguments, which must be hashable. """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.get_or_set((func.__qualname__, args, tuple(sorted(kwargs.items()))), lambda: func(*args, **kwargs))
+        wrapper.uncached = func
+        return wrapper
+
+    def stats(self) -> dict:
+        return {**super().stats(), "collapsed": self.collapsed}
+
+
+catalog_cache = CatalogCache(
+    max_size=getattr(settings, "SHOP_CATALOG_CACHE_SIZE", 256),
+    ttl=getattr(settings, "SHOP_CATALOG_CACHE_TTL", 300),
+)
+
+analytics_cache = AnalyticsCache(
+    max_size=getattr(settings, "SHOP_ANALYTICS_CACHE_SIZE", 256),
+    ttl=getattr(settings, "SHOP_ANALYTICS_CACHE_TTL", 60),
+)
@@ -0,0 +1,415 @@
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, Sum, Window
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+from .money import MoneyField
+from .services import upsert_increment
+
+
+class BaseCartStore:
+    """ Storage behind the shop.services cart functions. Quantities are keyed by product id. """
+
+    def quantities(self, cart) -> dict[int, int]:
+        """ Returns the cart's lines as {product_id: quantity}. """
+        raise NotImplementedError
+
+    def add(self, cart, product_id: int, quantity: int) -> int:
+        """ Adds quantity to a line and returns the line's new quantity. """
+        raise NotImplementedError
+
+    def set(self, cart, product_id: int, quantity: int) -> None:
+        """ Sets a line's quantity, removing the line when quantity is 0. """
+        raise NotImplementedError
+
+    def remove(self, cart, product_id: int) -> None:
+        """ Removes a line. """
+        self.set(cart, product_id, 0)
+
+    def apply(self, cart, operations: list[tuple[str, int, int]]) -> None:
+        """ Applies validated (op, product_id, quantity) operations as one unit. """
+        raise NotImplementedError
+
+    def clear(self, cart) -> None:
+        """ Removes every line. """
+        raise NotImplementedError
+
+    def summary(self, user_id: int) -> dict:
+        """ Returns the user's cart lines with product fields, line totals and the cart total. """
+        raise NotImplementedError
+
+    def flush(self, cart=None) -> int:
+        """ Persists pending writes for one cart, or for one batch of dirty carts; returns how many carts were written. """
+        return 0
+
+    def discard(self, cart, lines: dict[int, int]) -> None:
+        """ Drops checked-out quantities from any pending state, once the checkout that deleted the cart's lines commits. """
+
+    def flush_all(self) -> int:
+        """ Flushes every dirty cart in batches; returns how many carts were written. """
+        total = 0
+        while written := self.flush():
+            total += written
+        return total
+
+    @staticmethod
+    def activity_due(cart) -> bool:
+        """ Returns whether the cart's last recorded activity is older than SHOP_CART_ACTIVITY_RESOLUTION seconds. """
+        resolution = timedelta(seconds=getattr(settings, "SHOP_CART_ACTIVITY_RESOLUTION", 60))
+        return cart.updated_at is None or timezone.now() - cart.updated_at >= resolution
+
+    def touch(self, cart) -> None:
+        """ Records activity on the cart, writing at most once per SHOP_CART_ACTIVITY_RESOLUTION seconds. """
+        if not self.activity_due(cart):
+            return
+        now = timezone.now()
+        Cart.objects.filter(pk=cart.pk).update(updated_at=now)
+        cart.updated_at = now
+
+    def recording_activity(self, cart):
+        """ Returns a transaction for a mutation followed by a touch that will write, so both commit together.
+
+        While the cart's activity is fresh the touch writes nothing and the mutation runs as its own statement.
+        """
+        return transaction.atomic() if self.activity_due(cart) else nullcontext()
+
+    @staticmethod
+    def fold(quantities: dict[int, int], operations: list[tuple[str, int, int]]) -> dict[int, int]:
+        """ Applies operations to a copy of quantities; lines that drop to 0 are kept with quantity 0. """
+        quantities = dict(quantities)
+        for op, product_id, quantity in operations:
+            if op == "add":
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            elif op == "set":
+                quantities[product_id] = quantity
+            else:
+                quantities[product_id] = 0
+        return quantities
+
+
+class ORMCartStore(BaseCartStore):
+    """ Writes every cart mutation straight to the CartItem table. """
+
+    def quantities(self, cart) -> dict[int, int]:
+        return dict(CartItem.objects.filter(cart=cart).values_list("product_id", "quantity"))
+
+    def add(self, cart, product_id: int, quantity: int) -> int:
+        with self.recording_activity(cart):
+            [(new_quantity,)] = upsert_increment(
+                CartItem,
+                [{"cart": cart.id, "product": product_id, "quantity": quantity}],
+                unique_fields=["cart", "product"],
+                increment_fields=["quantity"],
+                returning=("quantity",),
+            )
+            self.touch(cart)
+        return new_quantity
+
+    def set(self, cart, product_id: int, quantity: int) -> None:
+        with self.recording_activity(cart):
+            if quantity <= 0:
+                CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+            else:
+                CartItem.objects.bulk_create(
+                    [CartItem(cart=cart, product_id=product_id, quantity=quantity)],
+                    update_conflicts=True,
+                    unique_fields=["cart", "product"],
+                    update_fields=["quantity"],
+                )
+            self.touch(cart)
+
+    def apply(self, cart, operations: list[tuple[str, int, int]]) -> None:
+        product_ids = {product_id for _, product_id, _ in operations}
+        with transaction.atomic():
+            items = {item.product_id: item for item in CartItem.objects.filter(cart=cart, product_id__in=product_ids)}
+            quantities = self.fold({product_id: item.quantity for product_id, item in items.items()}, operations)
+
+            to_create, to_update, to_delete = [], [], []
+            for product_id, quantity in quantities.items():
+                item = items.get(product_id)
+                if item is None:
+                    if quantity > 0:
+                        to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+                elif quantity <= 0:
+                    to_delete.append(item.id)
+                elif quantity != item.quantity:
+                    item.quantity = quantity
+                    to_update.append(item)
+            if to_create:
+                CartItem.objects.bulk_create(to_create)
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ["quantity"])
+            if to_delete:
+                CartItem.objects.filter(id__in=to_delete).delete()
+            self.touch(cart)
+
+    def clear(self, cart) -> None:
+        with self.recording_activity(cart):
+            CartItem.objects.filter(cart=cart).delete()
+            self.touch(cart)
+
+    def summary(self, user_id: int) -> dict:
+        # One query: the lines, their products, each line total and the cart total as a window sum.
+        line_total = ExpressionWrapper(F("quantity") * F("product__price"), output_field=MoneyField())
+        items = list(
+            CartItem.objects.filter(cart__user__id=user_id)
+            .select_related("product")
+            .annotate(line_total=line_total, cart_total=Window(Sum(line_total)))
+            .order_by("id")
+        )
+        return {
+            "items": [
+                {
+                    "product_id": item.product_id,
+                    "name": item.product.name,
+                    "price": item.product.price,
+                    "quantity": item.quantity,
+                    "line_total": item.line_total,
+                }
+                for item in items
+            ],
+            "total_price": items[0].cart_total if items else 0,
+        }
+
+
+class _CacheLock:
+    """ A mutex held as a cache key whose value is a random token, so a holder whose lock expired cannot release another's. """
+
+    def __init__(self, cache, key: str, timeout: float):
+        self.cache = cache
+        self.key = key
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+
+    def acquire(self) -> None:
+        # cache.add is atomic on locmem and Redis alike, so it serves as a cross-thread and cross-process mutex.
+        deadline = time.monotonic() + self.timeout
+        while not self.cache.add(self.key, self.token, self.timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {self.key}")
+            time.sleep(0.001)
+
+    def held(self) -> bool:
+        """ Reports whether the lock is still ours, i.e. it has not expired and been taken by another caller. """
+        return self.cache.get(self.key) == self.token
+
+    def release(self) -> None:
+        if self.held():
+            self.cache.delete(self.key)
+
+
+class CacheCartStore(BaseCartStore):
+    """ Keeps carts in a Django cache and writes them behind to the database.
+
+    Mutations write the cart's state and, if the cart was clean, a dirty marker and an entry in an append-only
+    dirty log, so a write costs O(1) cache operations and only locks its own cart. flush() consumes the log in
+    batches and is run periodically by `manage.py flush_carts` and for the buyer's cart at checkout.
+
+    The cache holds the only copy of unflushed writes, so it must be shared by every process and never evict:
+    only a Redis alias is accepted, and Redis must run with maxmemory-policy noeviction.
+    """
+
+    LOCK_TIMEOUT = 5
+    FLUSH_LOCK_TIMEOUT = 60
+    # Bounds how long a writer that died between marking a cart and logging it keeps the cart from being logged again.
+    DIRTY_MARKER_TTL = 60
+    SEQ_KEY = "cart:dirty:seq"
+    HEAD_KEY = "cart:dirty:head"
+    FLUSH_LOCK = "cart:flush"
+
+    def __init__(self, cache=None):
+        if cache is None:
+            alias = getattr(settings, "SHOP_CART_CACHE_ALIAS", "default")
+            cache = caches[alias]
+            if not isinstance(cache, RedisCache):
+                raise ImproperlyConfigured(
+                    f"CacheCartStore needs a shared cache that never evicts, but SHOP_CART_CACHE_ALIAS '{alias}' is "
+                    f"{type(cache).__name__}. Point it at a RedisCache running with maxmemory-policy noeviction."
+                )
+        self.cache = cache
+        self.batch_size = getattr(settings, "SHOP_CART_FLUSH_BATCH_SIZE", 500)
+        self._gap = None
+
+    def _key(self, cart_id: int) -> str:
+        return f"cart:{cart_id}"
+
+    def _dirty_key(self, cart_id: int) -> str:
+        return f"cart:{cart_id}:dirty"
+
+    def _slot_key(self, seq: int) -> str:
+        return f"cart:dirty:{seq}"
+
+    @contextmanager
+    def _lock(self, name: str, timeout: float | None = None):
+        lock = _CacheLock(self.cache, f"{name}:lock", timeout or self.LOCK_TIMEOUT)
+        lock.acquire()
+        try:
+            yield lock
+        finally:
+            lock.release()
+
+    def _load(self, cart_id: int) -> dict[int, int]:
+        quantities = self.cache.get(self._key(cart_id))
+        if quantities is None:
+            quantities = dict(CartItem.objects.filter(cart_id=cart_id).values_list("product_id", "quantity"))
+            self.cache.set(self._key(cart_id), quantities, None)
+        return quantities
+
+    def _store(self, cart_id: int, quantities: dict[int, int], lock: _CacheLock) -> None:
+        if not lock.held():
+            raise TimeoutError(f"Lost the lock on cart {cart_id}; the write was not applied")
+        self.cache.set(self._key(cart_id), {pid: qty for pid, qty in quantities.items() if qty > 0}, None)
+        self._mark_dirty(cart_id)
+
+    def _mark_dirty(self, cart_id: int) -> None:
+        """ Logs the cart for the next flush unless it is already logged and unflushed.
+
+        The state is written before the marker is checked, and a flush deletes the marker before reading the
+        state, so every write is either read by the flush in progress or logged again for the next one.
+        """
+        if not self.cache.add(self._dirty_key(cart_id), 1, self.DIRTY_MARKER_TTL):
+            return
+        self.cache.add(self.SEQ_KEY, 0, None)
+        self.cache.set(self._slot_key(self.cache.incr(self.SEQ_KEY)), cart_id, None)
+
+    def quantities(self, cart) -> dict[int, int]:
+        return dict(self._load(cart.id))
+
+    def add(self, cart, product_id: int, quantity: int) -> int:
+        with self._lock(self._key(cart.id)) as lock:
+            quantities = self.fold(self._load(cart.id), [("add", product_id, quantity)])
+            self._store(cart.id, quantities, lock)
+        return quantities[product_id]
+
+    def set(self, cart, product_id: int, quantity: int) -> None:
+        self.apply(cart, [("set", product_id, quantity)])
+
+    def apply(self, cart, operations: list[tuple[str, int, int]]) -> None:
+        with self._lock(self._key(cart.id)) as lock:
+            self._store(cart.id, self.fold(self._load(cart.id), operations), lock)
+
+    def clear(self, cart) -> None:
+        with self._lock(self._key(cart.id)) as lock:
+            self._store(cart.id, {}, lock)
+
+    def discard(self, cart, lines: dict[int, int]) -> None:
+        # Writes made between checkout's flush and its commit are still in the state, so only the sold quantities
+        # go. The remainder is always logged: it replaces the emptied lines, and any state a background flush
+        # wrote back after the commit.
+        with self._lock(self._key(cart.id)) as lock:
+            quantities = self.cache.get(self._key(cart.id))
+            if quantities is None:
+                return
+            self._store(cart.id, {pid: qty - lines.get(pid, 0) for pid, qty in quantities.items()}, lock)
+
+    def summary(self, user_id: int) -> dict:
+        cart = Cart.objects.filter(user__id=user_id).first()
+        quantities = self._load(cart.id) if cart else {}
+        products = Product.objects.in_bulk(list(quantities))
+        items, total = [], 0
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            line_total = product.price * quantity
+            total += line_total
+            items.append({
+                "product_id": product_id,
+                "name": product.name,
+                "price": product.price,
+                "quantity": quantity,
+                "line_total": line_total,
+            })
+        return {"items": items, "total_price": total}
+
+    def _next_slots(self, head: int) -> dict[str, int | None]:
+        """ Returns the filled log slots after head, in order, stopping at one a writer has claimed but not filled yet.
+
+        A slot left empty for longer than LOCK_TIMEOUT belongs to a writer that died, and is skipped as None.
+        """
+        last = min(self.cache.get(self.SEQ_KEY, 0), head + self.batch_size)
+        keys = [self._slot_key(seq) for seq in range(head + 1, last + 1)]
+        found = self.cache.get_many(keys)
+        slots = {}
+        for seq, key in enumerate(keys, start=head + 1):
+            if key not in found:
+                if self._gap is None or self._gap[0] != seq:
+                    self._gap = (seq, time.monotonic())
+                if time.monotonic() - self._gap[1] < self.LOCK_TIMEOUT:
+                    break
+            slots[key] = found.get(key)
+        return slots
+
+    def _write(self, cart_ids: "set[int]", lock: _CacheLock) -> int:
+        """ Replaces the database lines of the given carts with their cached state. """
+        # Markers go before the state is read, so a write landing after the read is logged again.
+        self.cache.delete_many([self._dirty_key(cart_id) for cart_id in cart_ids])
+        states = self.cache.get_many([self._key(cart_id) for cart_id in cart_ids])
+        try:
+            with transaction.atomic():
+                # Skip carts that were deleted, or whose state is not cached, and lines of deleted products.
+                carts = set(Cart.objects.filter(id__in=cart_ids).values_list("id", flat=True)) & {
+                    cart_id for cart_id in cart_ids if self._key(cart_id) in states
+                }
+                product_ids = {product_id for state in states.values() for product_id in state}
+                products = set(Product.objects.filter(id__in=product_ids).values_list("id", flat=True))
+                rows = [
+                    CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                    for cart_id in carts
+                    for product_id, quantity in states[self._key(cart_id)].items()
+                    if product_id in products
+                ]
+                CartItem.objects.filter(cart_id__in=carts).delete()
+                CartItem.objects.bulk_create(rows)
+                # Activity is recorded at flush time, so it is accurate to within the flush interval.
+                Cart.objects.filter(id__in=carts).update(updated_at=timezone.now())
+                if not lock.held():
+                    raise TimeoutError("Lost the cart flush lock; another flush may have written newer state")
+        except Exception:
+            # Log the carts again so the next flush retries them.
+            for cart_id in cart_ids:
+                self._mark_dirty(cart_id)
+            raise
+        return len(carts)
+
+    def _flush_batch(self) -> tuple[int, int]:
+        """ Flushes the carts of one batch of log slots; returns (slots consumed, carts written). """
+        with self._lock(self.FLUSH_LOCK, self.FLUSH_LOCK_TIMEOUT) as lock:
+            head = self.cache.get(self.HEAD_KEY, 0)
+            slots = self._next_slots(head)
+            if not slots:
+                return 0, 0
+            try:
+                written = self._write({cart_id for cart_id in slots.values() if cart_id is not None}, lock)
+            finally:
+                # On failure the carts were logged again, so their old slots are consumed either way.
+                self.cache.set(self.HEAD_KEY, head + len(slots), None)
+                self.cache.delete_many(list(slots))
+            return len(slots), written
+
+    def flush(self, cart=None) -> int:
+        if cart is None:
+            return self._flush_batch()[1]
+        with self._lock(self.FLUSH_LOCK, self.FLUSH_LOCK_TIMEOUT) as lock:
+            # The dirty marker expires after DIRTY_MARKER_TTL, so any cached state is written, clean or not.
+            # The cart's log slot stays behind and costs the background flush one redundant write at most.
+            if self.cache.get(self._key(cart.id)) is None:
+                return 0
+            return self._write({cart.id}, lock)
+
+    def flush_all(self) -> int:
+        total = 0
+        while True:
+            slots, written = self._flush_batch()
+            if not slots:
+                return total
+            total += written
@@ -0,0 +1,134 @@
+import csv
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db.models import OuterRef, Subquery, Sum
+
+from .models import Payment
+from .services import _orders_in_days
+
+# One row per order line; an order without lines is one row with empty line columns. Payments are summed per
+# order, with the method and date of the latest one.
+ORDER_EXPORT_COLUMNS = (
+    ("order_id", "i8"),
+    ("user_id", "i8"),
+    ("created_at", "M8[us]"),
+    ("total_price", "i8"),
+    ("item_id", "i8"),
+    ("product_id", "i8"),
+    ("quantity", "i8"),
+    ("price", "i8"),
+    ("paid", "i8"),
+    ("payment_method", "U50"),
+    ("paid_at", "M8[us]"),
+)
+ORDER_EXPORT_DTYPE = np.dtype(list(ORDER_EXPORT_COLUMNS))
+
+# What NumPy exports store for a missing value; Parquet and CSV keep them null.
+_NPY_MISSING = {"i8": -1, "M8[us]": np.datetime64("NaT"), "U50": ""}
+
+
+def _resolve_chunk_size(chunk_size: int | None) -> int:
+    return chunk_size or getattr(settings, "SHOP_EXPORT_CHUNK_SIZE", 5000)
+
+def iter_order_export_rows(start_day=None, end_day=None, chunk_size: int | None = None) -> Iterator[tuple]:
+    """ Yields an export row per order line, for orders placed on the local days in [start_day, end_day].
+
+    The rows come from one query read in chunks of chunk_size, through a server-side cursor where the database
+    supports one, so memory stays flat however many orders there are.
+    """
+    payments = Payment.objects.filter(order=OuterRef("id")).order_by()
+    latest = payments.order_by("-payment_date", "-id")
+    rows = (
+        _orders_in_days(start_day, end_day)
+        .annotate(
+            paid=Subquery(payments.values("order").annotate(total=Sum("amount")).values("total")),
+            payment_method=Subquery(latest.values("payment_method")[:1]),
+            paid_at=Subquery(latest.values("payment_date")[:1]),
+        )
+        .order_by("id", "items__id")
+        .values_list(
+            "id", "user_id", "created_at", "total_price",
+            "items__id", "items__product_id", "items__quantity", "items__price",
+            "paid", "payment_method", "paid_at",
+        )
+    )
+    return rows.iterator(chunk_size=_resolve_chunk_size(chunk_size))
+
+def _chunks(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+class _Echo:
+    """ A write-only file whose write returns the text, so csv.writer can format rows for a generator. """
+
+    def write(self, value: str) -> str:
+        return value
+
+def iter_orders_csv(rows: Iterable[tuple], chunk_size: int | None = None) -> Iterator[str]:
+    """ Encodes export rows as CSV with a header line, yielding one chunk of lines at a time. """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in ORDER_EXPORT_COLUMNS])
+    for chunk in _chunks(rows, _resolve_chunk_size(chunk_size)):
+        yield "".join(writer.writerow(["" if value is None else value for value in row]) for row in chunk)
+
+def _utc(value: datetime | None) -> datetime | None:
+    """ Converts an aware datetime to naive UTC, the only form NumPy and the Parquet schema accept. """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+def _npy_header(rows: int) -> bytes:
+    """ Builds a version 1.0 .npy header whose length does not depend on rows, so it can be rewritten in place. """
+    def header(count):
+        return "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(ORDER_EXPORT_DTYPE), count)
+    size = -(-(10 + len(header(2 ** 63)) + 1) // 64) * 64
+    text = header(rows).ljust(size - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + (size - 10).to_bytes(2, "little") + text.encode("latin1")
+
+def write_orders_npy(file, rows: Iterable[tuple], chunk_size: int | None = None) -> int:
+    """ Writes export rows to a seekable binary file as a structured .npy array, a chunk at a time. Returns the row count.
+
+    The header is written first with a placeholder length and rewritten once the count is known, so the file
+    can be read back with numpy.load, memory-mapped or not. Missing values are -1, empty strings or NaT.
+    """
+    file.write(_npy_header(0))
+    count = 0
+    kinds = [kind for _, kind in ORDER_EXPORT_COLUMNS]
+    for chunk in _chunks(rows, _resolve_chunk_size(chunk_size)):
+        records = [
+            tuple(_NPY_MISSING[kind] if value is None else _utc(value) if kind == "M8[us]" else value for value, kind in zip(row, kinds))
+            for row in chunk
+        ]
+        file.write(np.array(records, dtype=ORDER_EXPORT_DTYPE).tobytes())
+        count += len(records)
+    end = file.tell()
+    file.seek(0)
+    file.write(_npy_header(count))
+    file.seek(end)
+    return count
+
+def write_orders_parquet(path: str, rows: Iterable[tuple], chunk_size: int | None = None) -> int:
+    """ Writes export rows to a Parquet file, one row group per chunk. Returns the row count. Requires pyarrow. """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow; install it or export to .npy instead.")
+    types = {"i8": pa.int64(), "M8[us]": pa.timestamp("us", tz="UTC"), "U50": pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in ORDER_EXPORT_COLUMNS])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(rows, _resolve_chunk_size(chunk_size)):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array([_utc(value) for value in column] if kind == "M8[us]" else column, type=types[kind])
+                 for column, (_, kind) in zip(columns, ORDER_EXPORT_COLUMNS)],
+                schema=schema,
+            ))
+            count += len(chunk)
+    return count
@@ -0,0 +1,277 @@
+import heapq
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from .models import Product, ProductCategory
+
+
+class FacetIndex:
+    """ In-process inverted index from facet values (category, price bucket, stock status) to product id sets.
+
+    A product is in stock while it has units that are not reserved by a cart's hold.
+
+    The index is loaded lazily with two queries and then kept current by signal handlers, so filtering
+    and facet counting are pure set operations that never touch the database. Every committed change also
+    bumps a version shared through the cache; a read that finds another process's bump, or a copy older
+    than ttl seconds, rebuilds the index first.
+    """
+
+    VERSION_KEY = "shop:facet_index:version"
+
+    def __init__(self, price_buckets: list[int], ttl: float = 300.0, cache=None):
+        self.price_buckets = sorted(price_buckets)
+        self.ttl = ttl
+        self._cache = cache
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = None
+        self._loaded_at = 0.0
+        self._reset()
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = caches[getattr(settings, "SHOP_FACET_INDEX_CACHE_ALIAS", "default")]
+        return self._cache
+
+    def _reset(self) -> None:
+        self.products: set[int] = set()
+        self.in_stock: set[int] = set()
+        self.by_category: defaultdict[int, set[int]] = defaultdict(set)
+        self.by_price_bucket: defaultdict[int, set[int]] = defaultdict(set)
+        self._prices: dict[int, int] = {}
+        self._buckets: dict[int, int] = {}
+        self._categories: defaultdict[int, set[int]] = defaultdict(set)
+
+    def bucket_for(self, price: int) -> int:
+        """ Returns the index of the price bucket containing price, or -1 below the first boundary. """
+        return bisect_right(self.price_buckets, price) - 1
+
+    def bucket_label(self, bucket: int) -> str:
+        """ Formats a bucket index as a human readable range. """
+        low = self.price_buckets[bucket]
+        if bucket + 1 < len(self.price_buckets):
+            return f"{low}-{self.price_buckets[bucket + 1]}"
+        return f"{low}+"
+
+    def _current(self, version) -> bool:
+        return self._loaded and self._version == version and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self) -> None:
+        # Read the version before loading, so a change committed during the load forces another one.
+        version = self.cache.get(self.VERSION_KEY, 0)
+        if self._current(version):
+            return
+        with self._lock:
+            if self._current(version):
+                return
+            self._reset()
+            for product_id, price, available in Product.objects.values_list("id", "price", F("stock") - F("reserved")).iterator():
+                self._set_product(product_id, price, available)
+            for product_id, category_id in ProductCategory.objects.values_list("product_id", "category_id").iterator():
+                self._link(product_id, category_id)
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self._loaded = True
+
+    def _publish(self) -> None:
+        """ Bumps the shared version once the current transaction commits, so other processes rebuild. """
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self) -> None:
+        self.cache.add(self.VERSION_KEY, 0, None)
+        version = self.cache.incr(self.VERSION_KEY)
+        with self._lock:
+            # This copy already holds its own change; it stays current unless another process bumped in between.
+            if self._loaded and self._version == version - 1:
+                self._version = version
+
+    def invalidate(self) -> None:
+        """ Drops the index, here and in every other process, so the next read rebuilds it from the database. """
+        with self._lock:
+            self._loaded = False
+            self._reset()
+        self._publish()
+
+    def _set_product(self, product_id: int, price: int, available: int) -> None:
+        old_bucket = self._buckets.get(product_id)
+        if old_bucket is not None:
+            self.by_price_bucket[old_bucket].discard(product_id)
+        bucket = self.bucket_for(price)
+        self.by_price_bucket[bucket].add(product_id)
+        self._buckets[product_id] = bucket
+        self._prices[product_id] = price
+        self.products.add(product_id)
+        self._set_available(product_id, available)
+
+    def _set_available(self, product_id: int, available: int) -> None:
+        if available > 0:
+            self.in_stock.add(product_id)
+        else:
+            self.in_stock.discard(product_id)
+
+    def _link(self, product_id: int, category_id: int) -> None:
+        self.by_category[category_id].add(product_id)
+        self._categories[product_id].add(category_id)
+
+    def update_product(self, product_id: int, price: int, available: int) -> None:
+        """ Records a product's current price and unreserved stock. """
+        with self._lock:
+            if self._loaded:
+                # Most stock changes leave the product's facets as they were, and need not rebuild other processes.
+                unchanged = self._prices.get(product_id) == price and (product_id in self.in_stock) == (available > 0)
+                self._set_product(product_id, price, available)
+                if unchanged:
+                    return
+        self._publish()
+
+    def update_available(self, available: dict[int, int]) -> None:
+        """ Records the unreserved stock of products whose price did not change, such as when holds are placed or released. """
+        with self._lock:
+            if self._loaded:
+                changed = [
+                    product_id for product_id, units in available.items()
+                    if product_id in self.products and (product_id in self.in_stock) != (units > 0)
+                ]
+                for product_id in changed:
+                    self._set_available(product_id, available[product_id])
+                if not changed:
+                    return
+        self._publish()
+
+    def remove_product(self, product_id: int) -> None:
+        """ Removes a product from every facet. """
+        with self._lock:
+            if self._loaded:
+                self._drop(product_id)
+        self._publish()
+
+    def _drop(self, product_id: int) -> None:
+        self.products.discard(product_id)
+        self.in_stock.discard(product_id)
+        bucket = self._buckets.pop(product_id, None)
+        if bucket is not None:
+            self.by_price_bucket[bucket].discard(product_id)
+        self._prices.pop(product_id, None)
+        for category_id in self._categories.pop(product_id, ()):
+            self.by_category[category_id].discard(product_id)
+
+    def link(self, product_id: int, category_id: int) -> None:
+        """ Records that a product belongs to a category. """
+        with self._lock:
+            if self._loaded:
+                self._link(product_id, category_id)
+        self._publish()
+
+    def unlink(self, product_id: int, category_id: int) -> None:
+        """ Records that a product left a category. """
+        with self._lock:
+            if self._loaded:
+                self.by_category[category_id].discard(product_id)
+                self._categories[product_id].discard(category_id)
+        self._publish()
+
+    def refresh_products(self, product_ids) -> None:
+        """ Reloads the facets of the given products from the database. """
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with self._lock:
+            if self._loaded:
+                for product_id in product_ids:
+                    self._drop(product_id)
+                for product_id, price, available in Product.objects.filter(id__in=product_ids).values_list("id", "price", F("stock") - F("reserved")):
+                    self._set_product(product_id, price, available)
+                for product_id, category_id in ProductCategory.objects.filter(product_id__in=product_ids).values_list("product_id", "category_id"):
+                    self._link(product_id, category_id)
+        self._publish()
+
+    def _price_range(self, min_price, max_price) -> set[int]:
+        """ Returns products priced within [min_price, max_price], reading whole buckets where they fit in the range. """
+        matched = set()
+        for bucket, members in self.by_price_bucket.items():
+            low = self.price_buckets[bucket] if bucket >= 0 else None
+            high = self.price_buckets[bucket + 1] if bucket + 1 < len(self.price_buckets) else None
+            if max_price is not None and low is not None and low > max_price:
+                continue
+            if min_price is not None and high is not None and high <= min_price:
+                continue
+            fully_inside = (
+                (min_price is None or (low is not None and low >= min_price))
+                and (max_price is None or (high is not None and high <= max_price))
+            )
+            if fully_inside:
+                matched |= members
+            else:
+                matched.update(
+                    product_id for product_id in members
+                    if (min_price is None or self._prices[product_id] >= min_price)
+                    and (max_price is None or self._prices[product_id] <= max_price)
+                )
+        return matched
+
+    def filter(self, category_ids=None, min_price=None, max_price=None, in_stock=None) -> tuple[set[int], dict]:
+        """ Returns the ids matching every requested facet, and the count of every facet value.
+
+        Categories are ORed together and the dimensions are intersected. Each dimension's counts are taken
+        against the other dimensions' selections, so choosing a category does not zero its siblings.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            everything = self.products
+            if category_ids:
+                by_category = set().union(*(self.by_category.get(category_id, ()) for category_id in category_ids))
+            else:
+                by_category = everything
+            if min_price is not None or max_price is not None:
+                by_price = self._price_range(min_price, max_price)
+            else:
+                by_price = everything
+            if in_stock is None:
+                by_stock = everything
+            elif in_stock:
+                by_stock = self.in_stock
+            else:
+                by_stock = everything - self.in_stock
+
+            not_category = by_price & by_stock
+            not_price = by_category & by_stock
+            not_stock = by_category & by_price
+            facets = {
+                "categories": {
+                    category_id: len(members & not_category)
+                    for category_id, members in self.by_category.items() if members
+                },
+                "price": {
+                    self.bucket_label(bucket): len(members & not_price)
+                    for bucket, members in sorted(self.by_price_bucket.items()) if members and bucket >= 0
+                },
+                "stock": {
+                    "in_stock": len(self.in_stock & not_stock),
+                    "out_of_stock": len(not_stock - self.in_stock),
+                },
+            }
+            return not_category & by_category, facets
+
+    @staticmethod
+    def page(product_ids: set[int], after_id: int | None, page_size: int) -> tuple[list[int], int | None]:
+        """ Returns the ids of one keyset page ordered by id, and the cursor of the next page. """
+        candidates = product_ids if after_id is None else (i for i in product_ids if i > after_id)
+        ids = heapq.nsmallest(page_size + 1, candidates)
+        if len(ids) > page_size:
+            ids = ids[:page_size]
+            return ids, ids[-1]
+        return ids, None
+
+
+facet_index = FacetIndex(
+    getattr(settings, "SHOP_PRICE_BUCKETS", [0, 10000, 50000, 100000, 500000]),
+    ttl=getattr(settings, "SHOP_FACET_INDEX_TTL", 300),
+)
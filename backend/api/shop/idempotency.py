@@ -0,0 +1,68 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def _fingerprint(request) -> str:
+    """ Hashes the method, path and body so a key reused for a different request can be rejected. """
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.body):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def idempotent(method):
+    """ Makes an APIView handler replay its first response for a repeated Idempotency-Key header.
+
+    The key row is claimed in the same transaction as the handler's work, so a concurrent duplicate blocks
+    on the unique (user, key) row until the first request commits and then replays its stored response.
+    If the handler raises, the transaction and the claim roll back together and the key can be retried.
+    Only successful responses are stored: an error response releases the key, so the client can fix the
+    request, say by filling its cart, and retry under the same key. Requests without the header run as before.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error": f"{HEADER} must be at most 255 characters"}, status=400)
+
+        fingerprint = _fingerprint(request)
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=getattr(settings, "SHOP_IDEMPOTENCY_TTL", 24 * 60 * 60))
+        with transaction.atomic():
+            record, created = IdempotencyKey.objects.get_or_create(
+                user=request.user, key=key, defaults={"fingerprint": fingerprint, "expires_at": expires_at},
+            )
+            if not created:
+                record = IdempotencyKey.objects.select_for_update().get(pk=record.pk)
+                if record.expires_at <= now:
+                    record.fingerprint, record.status_code, record.response, record.expires_at = fingerprint, None, None, expires_at
+                elif record.fingerprint != fingerprint:
+                    return Response({"error": f"{HEADER} was already used for a different request"}, status=422)
+                elif record.status_code is not None:
+                    return Response(record.response, status=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+            response = method(self, request, *args, **kwargs)
+            if not 200 <= response.status_code < 300:
+                record.delete()
+                return response
+            record.status_code, record.response = response.status_code, response.data
+            record.save(update_fields=["fingerprint", "status_code", "response", "expires_at"])
+        return response
+    return wrapper
+
+def purge_expired_idempotency_keys() -> int:
+    """ Deletes expired idempotency keys and returns how many were removed. """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,95 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+def task(name: str | None = None, max_attempts: int | None = None):
+    """ Registers a function as a job handler. Handlers take the job payload as keyword arguments.
+
+    Delivery is at least once, so a handler must be safe to run again for a payload it already handled.
+    """
+    def register(func):
+        TASKS[name or func.__name__] = (func, max_attempts)
+        return func
+    return register
+
+def enqueue(name: str, payload: dict | None = None, delay: float = 0) -> Job:
+    """ Queues a job. Called inside a transaction, the job is only visible to workers once that transaction commits. """
+    if name not in TASKS:
+        raise ValidationError(f"Unknown task: {name}")
+    _, max_attempts = TASKS[name]
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts or getattr(settings, "SHOP_JOB_MAX_ATTEMPTS", 5),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+def backoff_delay(attempts: int) -> float:
+    """ Returns the seconds to wait before retrying after the given number of attempts, doubling with jitter. """
+    base = getattr(settings, "SHOP_JOB_BACKOFF_BASE", 2)
+    cap = getattr(settings, "SHOP_JOB_BACKOFF_MAX", 600)
+    return min(base * 2 ** (attempts - 1), cap) * random.uniform(0.5, 1)
+
+def claim_jobs(limit: int) -> list[Job]:
+    """ Locks up to limit due jobs for this worker, including running jobs whose visibility timeout lapsed.
+
+    A claimed job stays invisible to other workers until locked_until; a worker that dies mid-job therefore
+    only delays it, and the job is delivered again once the timeout passes.
+    """
+    now = timezone.now()
+    visibility = timedelta(seconds=getattr(settings, "SHOP_JOB_VISIBILITY_TIMEOUT", 300))
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lte=now))
+            .order_by("run_at")[:limit]
+        )
+        exhausted = [job.id for job in jobs if job.attempts >= job.max_attempts]
+        if exhausted:
+            Job.objects.filter(id__in=exhausted).update(status=Job.FAILED, locked_until=None, last_error="Visibility timeout expired")
+        jobs = [job for job in jobs if job.id not in exhausted]
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=Job.RUNNING, attempts=F("attempts") + 1, locked_until=now + visibility,
+        )
+    for job in jobs:
+        job.status, job.attempts, job.locked_until = Job.RUNNING, job.attempts + 1, now + visibility
+    return jobs
+
+def run_job(job: Job) -> bool:
+    """ Runs one claimed job and records the outcome, rescheduling it with backoff on failure. Returns whether it succeeded. """
+    # Guarding on attempts leaves the row alone if the job timed out and was reclaimed by another worker.
+    claimed = Job.objects.filter(id=job.id, attempts=job.attempts)
+    try:
+        func, _ = TASKS[job.name]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s #%s failed on attempt %s", job.name, job.id, job.attempts)
+        if job.attempts >= job.max_attempts:
+            claimed.update(status=Job.FAILED, locked_until=None, last_error=error)
+        else:
+            run_at = timezone.now() + timedelta(seconds=backoff_delay(job.attempts))
+            claimed.update(status=Job.QUEUED, locked_until=None, run_at=run_at, last_error=error)
+        return False
+    claimed.update(status=Job.DONE, locked_until=None)
+    return True
+
+def run_due_jobs(limit: int = 100) -> int:
+    """ Claims and runs due jobs in the calling thread. Returns how many ran. """
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
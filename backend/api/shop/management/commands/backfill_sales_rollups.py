@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from shop.models import Order
+from shop.services import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily sales rollups and unique customer sketches from orders, a chunk of days per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat, help="First local day to rebuild (YYYY-MM-DD); defaults to the first order.")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last local day to rebuild (YYYY-MM-DD); defaults to the last order.")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be positive.")
+        bounds = Order.objects.aggregate(first=Min("created_at"), last=Max("created_at"))
+        if bounds["first"] is None:
+            self.stdout.write("No orders to roll up")
+            return
+        start = options["start"] or timezone.localdate(bounds["first"])
+        end = options["end"] or timezone.localdate(bounds["last"])
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+
+        days_with_sales = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options["chunk_days"] - 1), end)
+            days_with_sales += rebuild_sales_rollups(chunk_start, chunk_end)
+            self.stdout.write(f"Rebuilt {chunk_start} to {chunk_end}")
+            chunk_start = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {days_with_sales} days with sales"))
@@ -0,0 +1,48 @@
+import random
+import time
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.services import calculate_change, calculate_change_batch, change_counts_to_dict, validate_ugx_amount, validate_ugx_amounts
+
+
+class Command(BaseCommand):
+    help = "Compares the scalar and NumPy batch cash validation and change calculation on a synthetic day of payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payments", type=int, default=300000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["payments"] < 1:
+            raise CommandError("--payments must be positive.")
+        rng = random.Random(options["seed"])
+        costs = [rng.randrange(0, 500000, 50) for _ in range(options["payments"])]
+        paid = [cost + rng.randrange(0, 100000, 50) for cost in costs]
+
+        started = time.perf_counter()
+        scalar_valid = []
+        for amount in paid:
+            try:
+                validate_ugx_amount(amount)
+                scalar_valid.append(True)
+            except ValidationError:
+                scalar_valid.append(False)
+        scalar_change = [calculate_change(amount_paid, total_cost) for amount_paid, total_cost in zip(paid, costs)]
+        scalar_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        paid_array, cost_array = np.asarray(paid, dtype=np.int64), np.asarray(costs, dtype=np.int64)
+        batch_valid = validate_ugx_amounts(paid_array)
+        batch_change = calculate_change_batch(paid_array, cost_array)
+        batch_seconds = time.perf_counter() - started
+
+        if batch_valid.tolist() != scalar_valid or [change_counts_to_dict(row) for row in batch_change] != scalar_change:
+            raise CommandError("Batch results differ from the scalar functions.")
+        self.stdout.write(f"  scalar: {scalar_seconds:.3f}s")
+        self.stdout.write(f"   batch: {batch_seconds:.3f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['payments']} payments: batch is {scalar_seconds / batch_seconds:.0f}x faster with identical results"
+        ))
@@ -0,0 +1,64 @@
+import random
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.money import apply_percentage_discount
+
+
+def _decimal_path(carts, percentage: Decimal) -> Decimal:
+    """ Totals and discounts carts the way the services did before amounts were integer minor units. """
+    grand_total = Decimal("0")
+    for lines in carts:
+        total = sum((price * quantity for price, quantity in lines), Decimal("0"))
+        discount = (total * percentage / 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+        grand_total += total - discount
+    return grand_total
+
+def _integer_path(carts, percentage: Decimal) -> int:
+    """ Totals and discounts carts as integer minor units. """
+    grand_total = 0
+    for lines in carts:
+        total = sum(price * quantity for price, quantity in lines)
+        grand_total += apply_percentage_discount(total, percentage)
+    return grand_total
+
+
+class Command(BaseCommand):
+    help = "Compares cart totalling and discounting on Decimal amounts against integer minor units."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--carts", type=int, default=10000)
+        parser.add_argument("--lines", type=int, default=50, help="Lines per cart.")
+        parser.add_argument("--discount", default="12.5", help="Discount percentage applied to every cart.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per path; the fastest is reported.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["carts"] < 1 or options["lines"] < 1 or options["repeat"] < 1:
+            raise CommandError("--carts, --lines and --repeat must be positive.")
+        rng = random.Random(options["seed"])
+        percentage = Decimal(options["discount"])
+        integer_carts = [
+            [(rng.randrange(100, 2000000, 100), rng.randint(1, 10)) for _ in range(options["lines"])]
+            for _ in range(options["carts"])
+        ]
+        decimal_carts = [[(Decimal(price).quantize(Decimal("0.01")), quantity) for price, quantity in lines] for lines in integer_carts]
+
+        results = {}
+        for label, path, carts in (("decimal", _decimal_path, decimal_carts), ("integer", _integer_path, integer_carts)):
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                total = path(carts, percentage)
+                timings.append(time.perf_counter() - started)
+            results[label] = (min(timings), total)
+            self.stdout.write(f"{label:>8}: {min(timings):.3f}s  total {total}")
+
+        if results["decimal"][1] != results["integer"][1]:
+            raise CommandError("The two paths disagree on the grand total.")
+        speedup = results["decimal"][0] / results["integer"][0]
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['carts']} carts x {options['lines']} lines: integer minor units are {speedup:.1f}x faster"
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from shop.models import DailyProductSales
+from shop.sketches import top_products
+
+
+class Command(BaseCommand):
+    help = "Compares the live top products sketch with exact counts from the sales rollups, optionally reseeding it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="How many top products to compare.")
+        parser.add_argument("--rebuild", action="store_true", help="Replace the persisted sketch with the exact counts.")
+
+    def handle(self, *args, **options):
+        n = options["top"]
+        if n < 1:
+            raise CommandError("--top must be positive.")
+        totals = DailyProductSales.objects.values("product_id").annotate(orders=Sum("order_count"), quantity=Sum("quantity"))
+        exact = {
+            "orders": {row["product_id"]: row["orders"] for row in totals},
+            "quantity": {row["product_id"]: row["quantity"] for row in totals},
+        }
+        if options["rebuild"]:
+            top_products.replace(exact)
+            self.stdout.write(self.style.SUCCESS(f"Reseeded the sketch from {len(exact['orders'])} products"))
+            return
+
+        top_products.persist()
+        for name in top_products.SKETCHES:
+            ranked = top_products.top(name, n) or []
+            truth = sorted(exact[name].items(), key=lambda entry: (-entry[1], entry[0]))[:n]
+            expected = {product_id for product_id, _ in truth}
+            found = {product_id for product_id, _, _ in ranked}
+            overestimates = [count - exact[name].get(product_id, 0) for product_id, count, _ in ranked]
+            violations = sum(
+                1 for product_id, count, error in ranked
+                if not count - error <= exact[name].get(product_id, 0) <= count
+            )
+            recall = len(expected & found) / len(expected) if expected else 1.0
+            self.stdout.write(
+                f"{name}: top-{n} recall {recall:.1%}, max overestimate {max(overestimates, default=0)}, "
+                f"{violations} counts outside their error bounds"
+            )
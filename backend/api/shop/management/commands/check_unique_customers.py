@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.services import CUSTOMER_PERIODS, get_unique_customers_by_period
+
+
+class Command(BaseCommand):
+    help = "Audits the unique customer sketches against exact distinct counts from the order table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", choices=CUSTOMER_PERIODS, default="day")
+        parser.add_argument("--start", type=date.fromisoformat, help="First local day to audit (YYYY-MM-DD).")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last local day to audit (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        if options["start"] and options["end"] and options["start"] > options["end"]:
+            raise CommandError("--start must not be after --end.")
+        estimated = dict(get_unique_customers_by_period(options["period"], options["start"], options["end"]))
+        exact = dict(get_unique_customers_by_period(options["period"], options["start"], options["end"], exact=True))
+        worst = 0.0
+        for start in sorted(estimated.keys() | exact.keys()):
+            estimate, count = estimated.get(start, 0), exact.get(start, 0)
+            error = abs(estimate - count) / count if count else float(estimate > 0)
+            worst = max(worst, error)
+            self.stdout.write(f"{start}: estimated {estimate}, exact {count}, error {error:.2%}")
+        self.stdout.write(self.style.SUCCESS(f"{len(exact)} {options['period']} periods audited, worst error {worst:.2%}"))
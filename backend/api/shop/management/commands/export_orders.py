@@ -0,0 +1,51 @@
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.exports import iter_order_export_rows, iter_orders_csv, write_orders_npy, write_orders_parquet
+
+
+class Command(BaseCommand):
+    help = "Exports orders with their lines and payments to CSV, a NumPy .npy structured array or Parquet, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "npy", "parquet"], help="Output format; defaults to the output file extension, else csv.")
+        parser.add_argument("--output", default="-", help="Output file, or '-' to write CSV to stdout.")
+        parser.add_argument("--start", type=date.fromisoformat, help="First local day to export (YYYY-MM-DD).")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last local day to export (YYYY-MM-DD).")
+        parser.add_argument("--chunk-size", type=int, help="Rows fetched per database round trip and per row group; defaults to SHOP_EXPORT_CHUNK_SIZE.")
+
+    def handle(self, *args, **options):
+        output, chunk_size = options["output"], options["chunk_size"]
+        if chunk_size is not None and chunk_size < 1:
+            raise CommandError("--chunk-size must be positive.")
+        if options["start"] and options["end"] and options["start"] > options["end"]:
+            raise CommandError("--start must not be after --end.")
+        export_format = options["format"] or next((suffix for suffix in ("npy", "parquet") if output.endswith(f".{suffix}")), "csv")
+        if export_format != "csv" and output == "-":
+            raise CommandError(f"--output must name a file for {export_format} exports.")
+
+        rows = iter_order_export_rows(options["start"], options["end"], chunk_size=chunk_size)
+        started = time.monotonic()
+        if export_format == "csv":
+            stream = sys.stdout if output == "-" else open(output, "w", newline="", encoding="utf-8")
+            try:
+                count = -1
+                for text in iter_orders_csv(rows, chunk_size=chunk_size):
+                    stream.write(text)
+                    count += text.count("\n")
+            finally:
+                if stream is not sys.stdout:
+                    stream.close()
+        elif export_format == "npy":
+            with open(output, "wb") as stream:
+                count = write_orders_npy(stream, rows, chunk_size=chunk_size)
+        else:
+            try:
+                count = write_orders_parquet(output, rows, chunk_size=chunk_size)
+            except ImportError as e:
+                raise CommandError(str(e))
+        if output != "-":
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} rows to {output} in {time.monotonic() - started:.1f}s"))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.services import get_cart_store
+
+
+class Command(BaseCommand):
+    help = "Writes carts held by a write-behind cart store to the database in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0, help="Seconds between flushes; 0 flushes once and exits.")
+
+    def handle(self, *args, **options):
+        store = get_cart_store()
+        interval = options["interval"]
+        while True:
+            written = store.flush_all()
+            if written:
+                self.stdout.write(f"Flushed {written} carts")
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Supplier
+from shop.services import upsert_catalog_batch
+
+
+class Command(BaseCommand):
+    help = "Streams a CSV or JSONL supplier feed into the catalog in batches, upserting products by sku."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Feed file, or '-' to read from stdin.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Feed format; defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--supplier", type=int, help="Supplier id whose supply_price column the feed carries.")
+        parser.add_argument("--checkpoint", help="File recording how many rows were committed, used to resume an interrupted import.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+        feed_format = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+
+        supplier = None
+        if options["supplier"] is not None:
+            try:
+                supplier = Supplier.objects.get(id=options["supplier"])
+            except Supplier.DoesNotExist:
+                raise CommandError(f"Supplier {options['supplier']} does not exist.")
+
+        checkpoint = options["checkpoint"]
+        skip = self._read_checkpoint(checkpoint, path)
+        if skip:
+            self.stdout.write(f"Resuming after {skip} committed rows")
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            rows = csv.DictReader(stream) if feed_format == "csv" else self._read_jsonl(stream)
+            rows = islice(rows, skip, None)
+            committed = skip
+            imported = 0
+            started = time.monotonic()
+            while batch := list(islice(rows, batch_size)):
+                try:
+                    upsert_catalog_batch(batch, supplier=supplier)
+                except (ValidationError, ValueError) as e:
+                    raise CommandError(f"Batch starting at row {committed + 1} failed: {e}")
+                committed += len(batch)
+                imported += len(batch)
+                self._write_checkpoint(checkpoint, path, committed)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{committed} rows committed ({imported / elapsed:.0f} rows/s)")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} rows in {elapsed:.1f}s"))
+
+    def _read_jsonl(self, stream):
+        """ Yields the feed's rows, numbered as the checkpoint counts them, so a malformed one names its row. """
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Row {number}: invalid JSON ({e}).")
+            if not isinstance(row, dict):
+                raise CommandError(f"Row {number}: expected a JSON object.")
+            yield row
+
+    def _read_checkpoint(self, checkpoint, path) -> int:
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("path") != path:
+            raise CommandError(f"Checkpoint {checkpoint} belongs to {state.get('path')}, not {path}.")
+        return state["rows"]
+
+    def _write_checkpoint(self, checkpoint, path, rows) -> None:
+        # Written after each committed batch and swapped in atomically, so a crash never skips uncommitted rows.
+        if not checkpoint:
+            return
+        temporary = f"{checkpoint}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"path": path, "rows": rows}, f)
+        os.replace(temporary, checkpoint)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shop.idempotency import purge_expired_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Deletes idempotency keys whose replay window has expired."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_idempotency_keys()
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
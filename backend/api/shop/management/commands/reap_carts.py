@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.services import reap_inactive_carts
+
+
+class Command(BaseCommand):
+    help = "Deletes abandoned carts and their items in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=30, help="Reap carts inactive for this many days.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--pause", type=float, default=0.1, help="Seconds to sleep between batches.")
+        parser.add_argument("--interval", type=float, default=0, help="Seconds between runs; 0 runs once and exits.")
+
+    def handle(self, *args, **options):
+        while True:
+            threshold = timezone.now() - timedelta(days=options["days"])
+            result = reap_inactive_carts(threshold, batch_size=options["batch_size"], pause=options["pause"])
+            self.stdout.write(
+                f"Deleted {result['carts']} carts and {result['items']} cart items in {result['seconds']:.2f}s"
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
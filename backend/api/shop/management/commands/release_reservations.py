@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.services import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Releases expired stock reservations back to available stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--interval", type=float, default=0, help="Seconds between sweeps; 0 sweeps once and exits.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_reservations(batch_size=options["batch_size"])
+            if released:
+                self.stdout.write(f"Released {released} expired reservations")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
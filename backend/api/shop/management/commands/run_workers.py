@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from shop.jobs import claim_jobs, run_job
+
+
+def _run(job) -> bool:
+    # Each pool thread holds its own database connection; drop it if it went stale between jobs.
+    close_old_connections()
+    try:
+        return run_job(job)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs on a thread pool, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--poll-interval", type=float, default=1, help="Seconds to wait when no job is due.")
+        parser.add_argument("--once", action="store_true", help="Run the jobs due now and exit.")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be positive.")
+        running = set()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # Only claim as many jobs as there are idle threads, so claimed jobs never wait out their visibility timeout in the pool's queue.
+                jobs = claim_jobs(workers - len(running)) if len(running) < workers else []
+                running.update(pool.submit(_run, job) for job in jobs)
+                if running:
+                    done, running = wait(running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED)
+                    failed = sum(1 for future in done if future.exception() or not future.result())
+                    if failed:
+                        self.stdout.write(f"{failed} jobs failed and were rescheduled or given up")
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["poll_interval"])
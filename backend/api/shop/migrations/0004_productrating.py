@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    Review = apps.get_model('shop', 'Review')
+    ProductRating = apps.get_model('shop', 'ProductRating')
+    ratings = {}
+    rows = Review.objects.filter(rating__gte=1, rating__lte=5).values_list('product_id', 'rating').order_by().annotate(n=models.Count('id'))
+    for product_id, rating, n in rows:
+        aggregate = ratings.setdefault(product_id, ProductRating(product_id=product_id))
+        aggregate.count += n
+        aggregate.total += rating * n
+        setattr(aggregate, f'star_{rating}', n)
+    ProductRating.objects.bulk_create(ratings.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='shop.product')),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('star_1', models.IntegerField(default=0)),
+                ('star_2', models.IntegerField(default=0)),
+                ('star_3', models.IntegerField(default=0)),
+                ('star_4', models.IntegerField(default=0)),
+                ('star_5', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:00
+
+import shop.money
+from django.db import migrations
+from django.db.models import F, Q
+from django.db.models.functions import Floor
+
+MONEY_FIELDS = (
+    ('GiftCard', 'balance'),
+    ('Order', 'total_price'),
+    ('OrderItem', 'price'),
+    ('Payment', 'amount'),
+    ('Product', 'price'),
+    ('SupplierProduct', 'supply_price'),
+)
+
+
+def check_whole_amounts(apps, schema_editor):
+    """ Refuses to migrate while any amount has a fractional part, which the integer columns would round away. """
+    problems = []
+    for model_name, field in MONEY_FIELDS:
+        fractional = (
+            apps.get_model('shop', model_name).objects
+            .annotate(whole=Floor(field)).filter(~Q(**{field: F('whole')}))
+            .values_list('pk', flat=True)
+        )
+        count = fractional.count()
+        if count:
+            sample = ', '.join(str(pk) for pk in fractional.order_by('pk')[:10])
+            problems.append(f'{model_name}.{field}: {count} rows, e.g. ids {sample}')
+    if problems:
+        raise ValueError(
+            'UGX has no fractional unit, so these amounts must be rounded to whole shillings before migrating:\n'
+            + '\n'.join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_order_shop_order_user_created'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_whole_amounts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='giftcard',
+            name='balance',
+            field=shop.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=shop.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='price',
+            field=shop.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='amount',
+            field=shop.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=shop.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='supplierproduct',
+            name='supply_price',
+            field=shop.money.MoneyField(),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:05
+
+import django.db.models.deletion
+import shop.money
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_sales_rollups(apps, schema_editor):
+    """ Rolls up existing orders, so analytics read from the new tables do not start at zero. """
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    DailySales = apps.get_model('shop', 'DailySales')
+    DailyProductSales = apps.get_model('shop', 'DailyProductSales')
+    totals = {
+        row['day']: DailySales(date=row['day'], order_count=row['order_count'], revenue=row['revenue'] or 0)
+        for row in Order.objects.annotate(day=TruncDate('created_at')).values('day').annotate(order_count=Count('id'), revenue=Sum('total_price'))
+    }
+    item_days = OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+    for row in item_days.values('day').annotate(line_count=Count('id'), items_sold=Sum('quantity')):
+        totals[row['day']].line_count = row['line_count']
+        totals[row['day']].items_sold = row['items_sold']
+    DailySales.objects.bulk_create(totals.values(), batch_size=1000)
+    DailyProductSales.objects.bulk_create(
+        (
+            DailyProductSales(date=row['day'], product_id=row['product_id'], order_count=row['orders'], quantity=row['sold'], revenue=row['takings'])
+            for row in item_days.values('day', 'product_id').annotate(
+                orders=Count('order_id', distinct=True), sold=Sum('quantity'), takings=Sum(F('quantity') * F('price')),
+            ).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_till'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('line_count', models.IntegerField(default=0)),
+                ('items_sold', models.IntegerField(default=0)),
+                ('revenue', shop.money.MoneyField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', shop.money.MoneyField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='shop_order_created'),
+        ),
+        migrations.RunPython(backfill_sales_rollups, migrations.RunPython.noop),
+    ]
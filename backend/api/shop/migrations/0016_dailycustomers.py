@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+from shop.sketches import HyperLogLog
+
+
+def backfill_daily_customers(apps, schema_editor):
+    """ Sketches the customers of existing orders, so unique customer counts do not start at zero. """
+    Order = apps.get_model('shop', 'Order')
+    DailyCustomers = apps.get_model('shop', 'DailyCustomers')
+    precision = getattr(settings, 'SHOP_CUSTOMER_SKETCH_PRECISION', 12)
+    customers = {}
+    for day, user_id in Order.objects.annotate(day=TruncDate('created_at')).values_list('day', 'user_id').distinct().iterator():
+        customers.setdefault(day, HyperLogLog(precision)).add(user_id)
+    DailyCustomers.objects.bulk_create(
+        (DailyCustomers(date=day, registers=sketch.to_bytes()) for day, sketch in customers.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_sketchsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCustomers',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('registers', models.BinaryField()),
+            ],
+        ),
+        migrations.RunPython(backfill_daily_customers, migrations.RunPython.noop),
+    ]
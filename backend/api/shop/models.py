@@ -1,12 +1,21 @@
 from django.db import models
 from django.contrib.auth.models import User 
 
+from .money import MoneyField
+
 # Create your models here.
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
-    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price = MoneyField()
     stock = models.IntegerField()
+    # Units held by unexpired StockReservations; stock - reserved is what new checkouts may take.
+    reserved = models.IntegerField(default=0)
+
+    @property
+    def available(self) -> int:
+        return self.stock - self.reserved
 
     def __str__(self):
         return self.name
@@ -14,6 +23,7 @@ class Product(models.Model):
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Cart of {self.user.username} created on {self.created_at}"
@@ -23,14 +33,39 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} of {self.product.name} in cart {self.cart.id}"
     
+class StockReservation(models.Model):
+    cart = models.ForeignKey(Cart, related_name='reservations', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_reservation'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product.name} held for cart {self.cart.id} until {self.expires_at}"
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = MoneyField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='shop_order_user_created'),
+            models.Index(fields=['created_at'], name='shop_order_created'),
+        ]
+
     def __str__(self):
         return f"Order of {self.user.username} created on {self.created_at}"
     
@@ -38,7 +73,7 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField()
-    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price = MoneyField()
 
     def __str__(self):
         return f"{self.quantity} of {self.product.name} in order {self.order.id}"
@@ -66,6 +101,26 @@ class Review(models.Model):
 
     def __str__(self):
         return f"Review by {self.user.username} for {self.product.name}"    
+
+class ProductRating(models.Model):
+    product = models.OneToOneField(Product, related_name='rating', on_delete=models.CASCADE, primary_key=True)
+    count = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    star_1 = models.IntegerField(default=0)
+    star_2 = models.IntegerField(default=0)
+    star_3 = models.IntegerField(default=0)
+    star_4 = models.IntegerField(default=0)
+    star_5 = models.IntegerField(default=0)
+
+    @property
+    def average(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def histogram(self) -> dict[int, int]:
+        return {star: getattr(self, f"star_{star}") for star in range(1, 6)}
+
+    def __str__(self):
+        return f"Rating of {self.product.name}: {self.count} reviews"
     
 class Wishlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -83,7 +138,7 @@ class WishlistItem(models.Model):
     
 class Payment(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField()
     payment_date = models.DateTimeField(auto_now_add=True)
     payment_method = models.CharField(max_length=50)
 
@@ -136,7 +191,7 @@ class Supplier(models.Model):
 class SupplierProduct(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    supply_price = models.DecimalField(max_digits=10, decimal_places=2)
+    supply_price = MoneyField()
 
     def __str__(self):
         return f"{self.product.name} supplied by {self.supplier.name}"  
@@ -150,7 +205,7 @@ class TaxRate(models.Model):
     
 class GiftCard(models.Model):
     code = models.CharField(max_length=50, unique=True)
-    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    balance = MoneyField()
     issued_date = models.DateTimeField(auto_now_add=True)
     expiry_date = models.DateTimeField()
 
@@ -165,3 +220,99 @@ class ReturnRequest(models.Model):
 
     def __str__(self):
         return f"Return request for order {self.order.id} - Status: {self.status}"
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.IntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of {self.user.username}"
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='shop_job_status_run_at'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.name} #{self.id} - Status: {self.status}"
+
+class Till(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    # Note and coin counts keyed by denomination, e.g. {"50000": 3, "1000": 20}.
+    notes = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def counts(self) -> dict[int, int]:
+        return {int(denom): count for denom, count in self.notes.items() if count}
+
+    def __str__(self):
+        return f"Till {self.name}"
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    line_count = models.IntegerField(default=0)
+    items_sold = models.IntegerField(default=0)
+    revenue = MoneyField(default=0)
+
+    def __str__(self):
+        return f"Sales on {self.date}: {self.order_count} orders, {self.revenue} UGX"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE)
+    order_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"Sales of {self.product.name} on {self.date}: {self.quantity}"
+
+class DailyCustomers(models.Model):
+    date = models.DateField(unique=True)
+    # zlib-compressed HyperLogLog registers of the customers who ordered that day.
+    registers = models.BinaryField()
+
+    def __str__(self):
+        return f"Customers on {self.date}"
+
+class SketchSnapshot(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sketch {self.name} as of {self.updated_at}"
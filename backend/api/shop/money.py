@@ -0,0 +1,54 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+# UGX has no fractional unit, so one minor unit is one shilling.
+CURRENCY = "UGX"
+MINOR_UNITS = 0
+
+
+def to_minor(value) -> int:
+    """ Converts an amount given as int, Decimal, float or numeric string to integer minor units.
+
+    Amounts with a fractional part below the minor unit are rejected rather than silently rounded.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    try:
+        amount = Decimal(str(value)).scaleb(MINOR_UNITS)
+    except (InvalidOperation, ValueError):
+        raise ValidationError(f"{value!r} is not a valid {CURRENCY} amount.")
+    if not amount.is_finite() or amount != amount.to_integral_value():
+        raise ValidationError(f"{value!r} is not a whole number of {CURRENCY} minor units.")
+    return int(amount)
+
+def percent_of(amount: int, percentage) -> int:
+    """ Returns percentage of an integer amount, rounded half up to a whole minor unit, without floating point.
+
+    The product is taken exactly, whatever the percentage's precision, and rounded only once at the end.
+    """
+    share = Decimal(amount) * Decimal(str(percentage)) / 100
+    return int(share.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def apply_percentage_discount(amount: int, percentage) -> int:
+    """ Returns the amount less a percentage discount, validating the percentage is within 0-100. """
+    if not 0 <= Decimal(str(percentage)) <= 100:
+        raise ValidationError("Discount percentage must be between 0 and 100.")
+    return amount - percent_of(amount, percentage)
+
+
+class MoneyField(models.BigIntegerField):
+    """ An amount of money stored as a whole number of minor units, so sums and comparisons are exact integer math. """
+
+    description = "Amount of money in integer minor units"
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        return to_minor(value)
+
+    def get_prep_value(self, value):
+        if value is not None and not hasattr(value, "resolve_expression"):
+            value = to_minor(value)
+        return super().get_prep_value(value)
@@ -0,0 +1,99 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+from .services import product_values
+
+FTS_TABLE = "shop_product_fts"
+
+# Name matches should outrank description matches on both backends.
+SQLITE_RANK = f"bm25({FTS_TABLE}, 10.0, 1.0)"
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english', name), 'A') || "
+    "setweight(to_tsvector('english', description), 'B')"
+)
+
+def _fts5_query(query: str) -> str:
+    """ Turns free text into an FTS5 expression that ANDs quoted prefix terms, so user input is never parsed as syntax. """
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", query))
+
+def index_products(product_ids) -> None:
+    """ Refreshes the search index rows for the given products. """
+    product_ids = list(product_ids)
+    if not product_ids or connection.vendor != "sqlite":
+        # PostgreSQL maintains its expression index on every write.
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM {Product._meta.db_table} WHERE id IN ({placeholders})",
+            product_ids,
+        )
+
+def remove_products(product_ids) -> None:
+    """ Drops the search index rows for the given products. """
+    product_ids = list(product_ids)
+    if not product_ids or connection.vendor != "sqlite":
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+def rebuild_search_index() -> None:
+    """ Rebuilds the whole search index from the product table. """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM {Product._meta.db_table}"
+        )
+
+def _ranked_product_ids(query: str, limit: int, offset: int) -> list[int]:
+    """ Returns matching product ids ordered by relevance. """
+    if connection.vendor == "sqlite":
+        match = _fts5_query(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY {SQLITE_RANK}, rowid LIMIT %s OFFSET %s"
+        )
+        params = [match, limit, offset]
+    elif connection.vendor == "postgresql":
+        sql = (
+            f"SELECT id FROM {Product._meta.db_table}, plainto_tsquery('english', %s) query "
+            f"WHERE ({POSTGRES_DOCUMENT}) @@ query "
+            f"ORDER BY ts_rank({POSTGRES_DOCUMENT}, query) DESC, id LIMIT %s OFFSET %s"
+        )
+        params = [query, limit, offset]
+    else:
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        return list(Product.objects.filter(condition).order_by("id").values_list("id", flat=True)[offset:offset + limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+def search_products(query: str, page: int = 1, page_size: int | None = None) -> tuple[list[dict], bool]:
+    """ Returns one page of products matching the query ordered by relevance, and whether a next page exists. """
+    if page_size is None:
+        page_size = getattr(settings, "SHOP_SEARCH_PAGE_SIZE", 20)
+    page_size = min(page_size, getattr(settings, "SHOP_PRODUCT_MAX_PAGE_SIZE", 500))
+    ids = _ranked_product_ids(query, limit=page_size + 1, offset=(page - 1) * page_size)
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+
+    rows = {row["id"]: row for row in product_values(Product.objects.filter(id__in=ids))}
+    return [rows[product_id] for product_id in ids if product_id in rows], has_next
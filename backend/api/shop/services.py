@@ -1,12 +1,33 @@
-from functools import reduce
+import time
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache, reduce
+from math import gcd
+from operator import or_
+
+import numpy as np
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from .models import CartItem, Order
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Prefetch, Q, QuerySet, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+from .cache import analytics_cache, catalog_cache
+from .facets import facet_index
+from .jobs import enqueue
+from .money import apply_percentage_discount, to_minor
+from .models import CartItem, Category, Order, Product, ProductCategory, ProductImage, ProductRating, Review, StockReservation, SupplierProduct
+from .sketches import HyperLogLog, top_products
 
 _order = Order
 _cartItem = CartItem
 
 UGX_DENOMS = [50000, 20000, 10000, 5000, 2000, 1000, 500, 200, 100] # Ugandan Shillings
 
+PRODUCT_LIST_FIELDS = ("id", "name", "description", "price", "stock")
+REVIEW_LIST_FIELDS = ("id", "user_id", "rating", "comment", "created_at")
+
 def validate_ugx_amount(amount: int) -> None:
     """ Validates that the given amount can be represented using UGX denominations. """
     if amount < 0:
@@ -36,24 +57,151 @@ def calculate_change(amount_paid: int, total_cost: int) -> dict[int, int]:
     
     return change_distribution
 
-def calculate_order_total(order: _order) -> float:
-    """ Calculates the total amount for the given order. """
+def validate_ugx_amounts(amounts) -> np.ndarray:
+    """ Vectorized validate_ugx_amount: returns a boolean array marking which amounts are valid. """
+    amounts = np.asarray(amounts, dtype=np.int64)
+    remaining = amounts.copy()
+    for denom in UGX_DENOMS:
+        remaining %= denom
+    return (amounts >= 0) & (remaining == 0)
+
+def calculate_change_batch(amounts_paid, total_costs) -> np.ndarray:
+    """ Vectorized calculate_change: returns an (n, len(UGX_DENOMS)) array of note and coin counts per payment.
+
+    Row i holds the same counts calculate_change(amounts_paid[i], total_costs[i]) returns, with zeros for the
+    denominations it leaves out. Raises ValidationError if any payment is short.
+    """
+    change = np.asarray(amounts_paid, dtype=np.int64) - np.asarray(total_costs, dtype=np.int64)
+    short = np.flatnonzero(change < 0)
+    if short.size:
+        raise ValidationError(f"Amount paid is less than total cost for {short.size} payments, starting at index {short[0]}.")
+    counts = np.empty((change.size, len(UGX_DENOMS)), dtype=np.int64)
+    for column, denom in enumerate(UGX_DENOMS):
+        counts[:, column], change = np.divmod(change, denom)
+    return counts
+
+def change_counts_to_dict(counts) -> dict[int, int]:
+    """ Converts one row of calculate_change_batch into calculate_change's {denomination: count} form. """
+    return {denom: int(count) for denom, count in zip(UGX_DENOMS, counts) if count > 0}
+
+def make_change(amount: int, till: dict[int, int]) -> dict[int, int] | None:
+    """ Returns the fewest notes and coins from the till's counts that sum exactly to amount, or None if none do. """
+    if amount < 0:
+        raise ValidationError("Amount cannot be negative.")
+    counts = tuple(max(int(till.get(denom, 0)), 0) for denom in UGX_DENOMS)
+    solution = _make_change(amount, counts)
+    if solution is None:
+        return None
+    return {denom: count for denom, count in zip(UGX_DENOMS, solution) if count}
+
+@lru_cache(maxsize=4096)
+def _make_change(amount: int, counts: tuple[int, ...]) -> tuple[int, ...] | None:
+    """ Solves the bounded knapsack for make_change, memoized on the amount and the till state.
+
+    Each denomination's count is split into power-of-two bundles, turning the bounded problem into a 0/1
+    knapsack over O(sum log count) bundles; each bundle then relaxes the whole NumPy row of amounts at once.
+    """
+    unit = reduce(gcd, UGX_DENOMS)
+    # The DP row is sized by the amount, so an amount the till cannot cover must not get that far.
+    if amount % unit or amount > sum(denom * count for denom, count in zip(UGX_DENOMS, counts)):
+        return None
+    target = amount // unit
+    bundles = []
+    for index, (denom, count) in enumerate(zip(UGX_DENOMS, counts)):
+        count = min(count, target // (denom // unit))
+        size = 1
+        while count > 0:
+            bundles.append((index, min(size, count)))
+            count -= size
+            size *= 2
+
+    unreachable = np.iinfo(np.int64).max // 2
+    fewest = np.full(target + 1, unreachable, dtype=np.int64)
+    fewest[0] = 0
+    taken = np.zeros((len(bundles), target + 1), dtype=bool)
+    for row, (index, notes) in enumerate(bundles):
+        value = notes * UGX_DENOMS[index] // unit
+        candidate = fewest[:target + 1 - value] + notes
+        improved = candidate < fewest[value:]
+        taken[row, value:] = improved
+        fewest[value:] = np.where(improved, candidate, fewest[value:])
+    if fewest[target] >= unreachable:
+        return None
+
+    solution = [0] * len(UGX_DENOMS)
+    remaining = target
+    for row in range(len(bundles) - 1, -1, -1):
+        if taken[row, remaining]:
+            index, notes = bundles[row]
+            solution[index] += notes
+            remaining -= notes * UGX_DENOMS[index] // unit
+    return tuple(solution)
+
+def give_change(till_id: int, amount_paid, total_cost, tendered: dict | None = None) -> dict[int, int]:
+    """ Pays change for a cash sale out of a till, using the fewest notes the till actually holds.
+
+    The tendered notes, if given, go into the till first and must add up to amount_paid. Raises
+    ValidationError if the till cannot make exact change, leaving it untouched.
+    """
+    from .models import Till
+    amount_paid, total_cost = to_minor(amount_paid), to_minor(total_cost)
+    if amount_paid < total_cost:
+        raise ValidationError("Amount paid is less than total cost.")
+    try:
+        tendered = {int(denom): int(count) for denom, count in (tendered or {}).items()}
+    except (AttributeError, TypeError, ValueError):
+        raise ValidationError("Tendered notes must map denominations to counts.")
+    if any(denom not in UGX_DENOMS or count < 0 for denom, count in tendered.items()):
+        raise ValidationError(f"Tendered notes must be non-negative counts of {UGX_DENOMS}.")
+    if tendered and sum(denom * count for denom, count in tendered.items()) != amount_paid:
+        raise ValidationError("Tendered notes do not add up to the amount paid.")
+
+    with transaction.atomic():
+        till = Till.objects.select_for_update().get(id=till_id)
+        counts = till.counts()
+        for denom, count in tendered.items():
+            counts[denom] = counts.get(denom, 0) + count
+        change = make_change(amount_paid - total_cost, counts)
+        if change is None:
+            raise ValidationError(f"Till cannot make exact change of {amount_paid - total_cost} UGX.")
+        for denom, count in change.items():
+            counts[denom] -= count
+        till.notes = {str(denom): count for denom, count in sorted(counts.items(), reverse=True) if count}
+        till.save(update_fields=["notes", "updated_at"])
+    return change
+
+def calculate_order_total(order: _order) -> int:
+    """ Calculates the total amount for the given order in UGX. """
     total = sum(item.product.price * item.quantity for item in order.items.all())
     return total
 
-def calculate_cart_total(cart_items: list[_cartItem]) -> float:
-    """ Calculates the total amount for the given cart items. """
+def calculate_cart_total(cart_items: list[_cartItem]) -> int:
+    """ Calculates the total amount for the given cart items in UGX. """
     total = sum(item.product.price * item.quantity for item in cart_items)
     return total
 
 def clear_cart(cart_items: list[_cartItem]) -> None:
     """ Clears the given cart items. """
+    store = get_cart_store()
     for item in cart_items:
-        item.delete()
+        store.remove(item.cart, item.product_id)
 
 def get_cart_items_by_user(user_id: int) -> list[_cartItem]:
     """ Retrieves cart items for the given user ID. """
-    return list(CartItem.objects.filter(cart__user__id=user_id).select_related("product"))
+    cart = get_cart_by_user(user_id)
+    return list_cart_items(cart) if cart else []
+
+def get_cart_store():
+    """ Returns the cart storage backend configured by SHOP_CART_STORE. """
+    return _load_cart_store(getattr(settings, "SHOP_CART_STORE", "shop.cart_store.ORMCartStore"))
+
+@lru_cache
+def _load_cart_store(path: str):
+    return import_string(path)()
+
+def get_cart_summary(user_id: int) -> dict:
+    """ Returns the user's cart lines with their products, line totals and the cart total. """
+    return get_cart_store().summary(user_id)
 
 def get_order_by_id(order_id: int) -> _order | None:
     """ Retrieves an order by its ID. """
@@ -70,105 +218,608 @@ def get_cart_by_user(user_id: int):
     except Cart.DoesNotExist:
         return None
     
-def create_order(user, total_amount: float) -> _order:
-    """ Creates a new order for the given user with the specified total amount. """
-    order = Order.objects.create(user=user, total_amount=total_amount)
+def create_order(user, total_amount: int) -> _order:
+    """ Creates a new order for the given user with the specified total amount in UGX. """
+    # The order's post_save signal adds it to the sales rollups in the same transaction.
+    with transaction.atomic():
+        return Order.objects.create(user=user, total_price=to_minor(total_amount))
+
+def upsert_increment(model, rows: list[dict], unique_fields: list[str], increment_fields: list[str], returning: tuple[str, ...] = ()) -> list[tuple]:
+    """ Inserts rows, or adds their increment_fields onto the existing row on a unique conflict, in one statement.
+
+    Django's bulk_create(update_conflicts=True) can only overwrite columns, so the increment is written as
+    INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col, which SQLite and PostgreSQL both support.
+    """
+    if not rows:
+        return []
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    table = quote(model._meta.db_table)
+    columns = ", ".join(quote(field.column) for field in fields)
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * len(fields)) + ")"] * len(rows))
+    params = [field.get_db_prep_save(row[field.name], connection) for row in rows for field in fields]
+    conflict = ", ".join(quote(model._meta.get_field(name).column) for name in unique_fields)
+    increments = ", ".join(
+        f"{column} = {table}.{column} + excluded.{column}"
+        for column in (quote(model._meta.get_field(name).column) for name in increment_fields)
+    )
+    sql = f"INSERT INTO {table} ({columns}) VALUES {placeholders} ON CONFLICT ({conflict}) DO UPDATE SET {increments}"
+    if returning:
+        sql += " RETURNING " + ", ".join(quote(model._meta.get_field(name).column) for name in returning)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall() if returning else []
+
+def _reserved_delta(deltas: dict[int, int]) -> Case:
+    """ Builds a CASE expression adding each product's delta to its reserved counter. """
+    return Case(*(When(id=product_id, then=F("reserved") + delta) for product_id, delta in deltas.items()), default=F("reserved"))
+
+def _short_products(quantities: dict[int, int]) -> list[int]:
+    """ Returns the ids of products that cannot supply the given extra quantities from their available stock. """
+    available = dict(Product.objects.filter(id__in=quantities).values_list("id", F("stock") - F("reserved")))
+    return sorted(product_id for product_id, quantity in quantities.items() if available.get(product_id, 0) < quantity)
+
+def _refresh_available_facets(product_ids) -> None:
+    """ Moves products between the in and out of stock facets once the change to their holds commits. """
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: facet_index.update_available(
+        dict(Product.objects.filter(id__in=product_ids).values_list("id", F("stock") - F("reserved")))
+    ))
+
+def _release_reservations(reservations) -> int:
+    """ Deletes the given holds and returns their units to the products' available stock. """
+    reservations = list(reservations)
+    released: dict[int, int] = {}
+    for reservation in reservations:
+        released[reservation.product_id] = released.get(reservation.product_id, 0) - reservation.quantity
+    if released:
+        Product.objects.filter(id__in=released).update(reserved=_reserved_delta(released))
+        StockReservation.objects.filter(id__in=[reservation.id for reservation in reservations]).delete()
+        _refresh_available_facets(released)
+    return len(reservations)
+
+def reserve_cart(cart):
+    """ Holds stock for every line of the cart for SHOP_RESERVATION_TTL seconds and returns when the holds expire.
+
+    Holds are counted in Product.reserved, so each product is checked and adjusted with one conditional
+    UPDATE instead of locking it; calling this again resizes the holds to the current cart and renews them.
+    """
+    lines = {product_id: quantity for product_id, quantity in get_cart_store().quantities(cart).items() if quantity > 0}
+    if not lines:
+        raise ValidationError("Cart is empty")
+    expires_at = timezone.now() + timedelta(seconds=getattr(settings, "SHOP_RESERVATION_TTL", 600))
+
+    with transaction.atomic():
+        holds = dict(StockReservation.objects.select_for_update().filter(cart=cart).values_list("product_id", "quantity"))
+        deltas = {product_id: lines.get(product_id, 0) - holds.get(product_id, 0) for product_id in lines.keys() | holds.keys()}
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+        if deltas:
+            enough = reduce(or_, (
+                Q(id=product_id, stock__gte=F("reserved") + delta) if delta > 0 else Q(id=product_id)
+                for product_id, delta in deltas.items()
+            ))
+            if Product.objects.filter(enough).update(reserved=_reserved_delta(deltas)) != len(deltas):
+                short = _short_products({product_id: delta for product_id, delta in deltas.items() if delta > 0})
+                raise ValidationError(f"Insufficient stock for products: {short}")
+            _refresh_available_facets(deltas)
+
+        StockReservation.objects.filter(cart=cart).exclude(product_id__in=lines).delete()
+        StockReservation.objects.bulk_create(
+            [StockReservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at) for product_id, quantity in lines.items()],
+            update_conflicts=True,
+            unique_fields=["cart", "product"],
+            update_fields=["quantity", "expires_at"],
+        )
+    return expires_at
+
+def release_cart_reservations(cart) -> int:
+    """ Releases every hold of the cart. Returns how many holds were released. """
+    with transaction.atomic():
+        return _release_reservations(StockReservation.objects.select_for_update().filter(cart=cart))
+
+def release_expired_reservations(batch_size: int = 500) -> int:
+    """ Releases expired holds in batches, skipping holds a checkout is converting. Returns how many were released. """
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = _release_reservations(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=timezone.now())
+                .order_by("expires_at")[:batch_size]
+            )
+        if not batch:
+            return released
+        released += batch
+
+DAILY_SALES_FIELDS = ["order_count", "line_count", "items_sold", "revenue"]
+DAILY_PRODUCT_SALES_FIELDS = ["order_count", "quantity", "revenue"]
+
+def _record_daily_sales(day, order_count: int = 0, line_count: int = 0, items_sold: int = 0, revenue: int = 0) -> None:
+    from .models import DailySales
+    upsert_increment(
+        DailySales,
+        [{"date": day, "order_count": order_count, "line_count": line_count, "items_sold": items_sold, "revenue": revenue}],
+        unique_fields=["date"],
+        increment_fields=DAILY_SALES_FIELDS,
+    )
+
+def record_order_totals(order, sign: int = 1) -> None:
+    """ Adds an order's count and revenue to its day's rollup, or takes them out with sign=-1, and counts a new order's customer. """
+    day = timezone.localdate(order.created_at)
+    _record_daily_sales(day, order_count=sign, revenue=sign * to_minor(order.total_price))
+    # Distinct counts cannot be decremented; a deleted order's customer stays counted until the day is rebuilt.
+    if sign > 0:
+        record_customer(day, order.user_id)
+
+def record_order_repricing(order, old_total) -> None:
+    """ Moves the revenue of the order's day by the change from old_total to its current total. """
+    _record_daily_sales(timezone.localdate(order.created_at), revenue=to_minor(order.total_price) - to_minor(old_total))
+
+def record_order_lines(order, lines: dict[int, tuple[int, int]], sign: int = 1, count_orders: bool = True) -> None:
+    """ Adds lines of an order to the daily rollups, or takes them out with sign=-1.
+
+    lines maps each product id to its (quantity, unit price). count_orders=False leaves the per-product order
+    counts alone, for a line whose product already has, or still has, another line on the same order.
+    """
+    from .models import DailyProductSales
+    if not lines:
+        return
+    day = timezone.localdate(order.created_at)
+    _record_daily_sales(day, line_count=sign * len(lines), items_sold=sign * sum(quantity for quantity, _ in lines.values()))
+    upsert_increment(
+        DailyProductSales,
+        [
+            {"date": day, "product": product_id, "order_count": sign if count_orders else 0, "quantity": sign * quantity, "revenue": sign * quantity * price}
+            for product_id, (quantity, price) in lines.items()
+        ],
+        unique_fields=["date", "product"],
+        increment_fields=DAILY_PRODUCT_SALES_FIELDS,
+    )
+
+def record_order_sales(order, lines: dict[int, tuple[int, int]], sign: int = 1) -> None:
+    """ Adds an order and its lines to the daily sales rollups, or takes them out with sign=-1.
+
+    Order and OrderItem signals call the parts of this for writes made through the ORM, so only writes that
+    bypass signals, such as the bulk_create in checkout, call it or record_order_lines directly.
+    """
+    record_order_totals(order, sign)
+    record_order_lines(order, lines, sign)
+
+def rebuild_sales_rollups(start_day=None, end_day=None) -> int:
+    """ Recomputes the daily sales rollups from the order tables for an inclusive range of local days.
+
+    Returns how many days had sales. Orders placed on those days while the rebuild runs may be counted twice
+    or not at all, so rebuild closed days or run it while checkout is quiet.
+    """
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+    from .models import DailyCustomers, DailyProductSales, DailySales, OrderItem
+    orders = _orders_in_days(start_day, end_day)
+    items = OrderItem.objects.all()
+    days = DailySales.objects.all()
+    product_days = DailyProductSales.objects.all()
+    customer_days = DailyCustomers.objects.all()
+    if start_day is not None:
+        items = items.filter(order__created_at__gte=_day_start(start_day))
+        days, product_days, customer_days = days.filter(date__gte=start_day), product_days.filter(date__gte=start_day), customer_days.filter(date__gte=start_day)
+    if end_day is not None:
+        items = items.filter(order__created_at__lt=_day_start(end_day + timedelta(days=1)))
+        days, product_days, customer_days = days.filter(date__lte=end_day), product_days.filter(date__lte=end_day), customer_days.filter(date__lte=end_day)
+
+    with transaction.atomic():
+        days.delete()
+        product_days.delete()
+        customer_days.delete()
+        totals = {
+            row["day"]: DailySales(date=row["day"], order_count=row["order_count"], revenue=row["revenue"] or 0)
+            for row in orders.annotate(day=TruncDate("created_at")).values("day").annotate(order_count=Count("id"), revenue=Sum("total_price"))
+        }
+        item_days = items.annotate(day=TruncDate("order__created_at"))
+        for row in item_days.values("day").annotate(line_count=Count("id"), items_sold=Sum("quantity")):
+            totals[row["day"]].line_count = row["line_count"]
+            totals[row["day"]].items_sold = row["items_sold"]
+        DailySales.objects.bulk_create(totals.values(), batch_size=1000)
+        DailyProductSales.objects.bulk_create(
+            (
+                DailyProductSales(date=row["day"], product_id=row["product_id"], order_count=row["orders"], quantity=row["sold"], revenue=row["takings"])
+                for row in item_days.values("day", "product_id").annotate(
+                    orders=Count("order_id", distinct=True), sold=Sum("quantity"), takings=Sum(F("quantity") * F("price")),
+                ).iterator()
+            ),
+            batch_size=1000,
+        )
+        customers = {}
+        for day, user_id in orders.annotate(day=TruncDate("created_at")).values_list("day", "user_id").distinct().iterator():
+            customers.setdefault(day, HyperLogLog(_customer_precision())).add(user_id)
+        DailyCustomers.objects.bulk_create(
+            (DailyCustomers(date=day, registers=sketch.to_bytes()) for day, sketch in customers.items()),
+            batch_size=1000,
+        )
+        transaction.on_commit(analytics_cache.bump_version)
+    return len(totals)
+
+def _customer_precision() -> int:
+    return getattr(settings, "SHOP_CUSTOMER_SKETCH_PRECISION", 12)
+
+def record_customer(day, user_id: int) -> None:
+    """ Adds a customer to the day's unique customer sketch.
+
+    Most orders come from customers the sketch already accounts for, so the row is first read without a lock
+    and is only locked and rewritten when the customer raises one of its registers.
+    """
+    from .models import DailyCustomers
+    stored = DailyCustomers.objects.filter(date=day).values_list("registers", flat=True).first()
+    if stored is not None and not HyperLogLog.from_bytes(stored).add(user_id):
+        return
+    with transaction.atomic():
+        row, _ = DailyCustomers.objects.select_for_update().get_or_create(
+            date=day, defaults={"registers": HyperLogLog(_customer_precision()).to_bytes()},
+        )
+        sketch = HyperLogLog.from_bytes(row.registers)
+        if sketch.add(user_id):
+            row.registers = sketch.to_bytes()
+            row.save(update_fields=["registers"])
+
+def _orders_in_days(start_day=None, end_day=None) -> QuerySet:
+    """ Returns the orders placed on the local days in the inclusive range [start_day, end_day]; None leaves a side open. """
+    orders = Order.objects.all()
+    if start_day is not None:
+        orders = orders.filter(created_at__gte=_day_start(start_day))
+    if end_day is not None:
+        orders = orders.filter(created_at__lt=_day_start(end_day + timedelta(days=1)))
+    return orders
+
+def _customer_sketches(start_day=None, end_day=None) -> list[tuple[date, HyperLogLog]]:
+    """ Loads the daily unique customer sketches of the inclusive range [start_day, end_day]. """
+    from .models import DailyCustomers
+    rows = DailyCustomers.objects.order_by("date")
+    if start_day is not None:
+        rows = rows.filter(date__gte=start_day)
+    if end_day is not None:
+        rows = rows.filter(date__lte=end_day)
+    return [(day, HyperLogLog.from_bytes(registers)) for day, registers in rows.values_list("date", "registers")]
+
+CUSTOMER_PERIODS = ("day", "week", "month")
+
+def _period_start(day: date, period: str) -> date:
+    """ Returns the first day of the day, week (starting Monday) or month containing day. """
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+@analytics_cache.memoize
+def count_unique_customers(start_day=None, end_day=None, exact: bool = False) -> int:
+    """ Counts the distinct customers who ordered on the local days in [start_day, end_day]; None leaves a side open.
+
+    By default the days' HyperLogLog sketches are merged, which reads one small row per day and is accurate to
+    about 1.6% at the default precision. exact=True counts distinct users on the order table instead, for audits.
+    """
+    if exact:
+        return _orders_in_days(start_day, end_day).values("user_id").distinct().count()
+    return HyperLogLog.union((sketch for _, sketch in _customer_sketches(start_day, end_day)), _customer_precision()).count()
+
+@analytics_cache.memoize
+def get_unique_customers_by_period(period: str, start_day=None, end_day=None, exact: bool = False) -> list[tuple[date, int]]:
+    """ Counts distinct customers per day, week or month as (first day of period, count), oldest first.
+
+    Periods cut by the range only count their days inside it, and periods without orders are left out.
+    exact=True counts from the order table instead of merging the daily sketches.
+    """
+    from django.db.models import Count, DateField
+    from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+    if period not in CUSTOMER_PERIODS:
+        raise ValidationError(f"Period must be one of: {', '.join(CUSTOMER_PERIODS)}")
+    if exact:
+        truncate = {"day": TruncDate, "week": TruncWeek, "month": TruncMonth}[period]
+        rows = (
+            _orders_in_days(start_day, end_day)
+            .annotate(period=truncate("created_at", output_field=DateField()))
+            .values("period").annotate(customers=Count("user_id", distinct=True)).order_by("period")
+        )
+        return [(row["period"], row["customers"]) for row in rows]
+    periods = {}
+    for day, sketch in _customer_sketches(start_day, end_day):
+        periods.setdefault(_period_start(day, period), []).append(sketch)
+    return [(start, HyperLogLog.union(sketches).count()) for start, sketches in periods.items()]
+
+def _day_start(day) -> datetime:
+    """ Returns the aware datetime at which a local day begins. """
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+def _as_datetime(value) -> datetime:
+    """ Interprets a range bound the way a DateTimeField lookup does: dates mean local midnight, naive times are local. """
+    if not isinstance(value, datetime):
+        return _day_start(value)
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+def _sales_in_range(start, end) -> tuple[int, int]:
+    """ Returns (revenue, order count) of orders placed within the inclusive range [start, end].
+
+    Whole local days inside the range are read from the daily rollup; only the partial days at either edge
+    are read from the order table, so the cost grows with the number of days rather than of orders.
+    """
+    from django.db.models import Count, Sum
+    from .models import DailySales
+    start, end = _as_datetime(start), _as_datetime(end)
+    if start > end:
+        return 0, 0
+    first_day = timezone.localdate(start)
+    if _day_start(first_day) < start:
+        first_day += timedelta(days=1)
+    last_day = timezone.localdate(end + timedelta(microseconds=1)) - timedelta(days=1)
+    if first_day > last_day:
+        edges = Q(created_at__range=(start, end))
+        revenue = orders = 0
+    else:
+        edges = Q(created_at__gte=start, created_at__lt=_day_start(first_day)) | Q(created_at__gte=_day_start(last_day + timedelta(days=1)), created_at__lte=end)
+        totals = DailySales.objects.filter(date__range=(first_day, last_day)).aggregate(revenue=Sum("revenue"), orders=Sum("order_count"))
+        revenue, orders = totals["revenue"] or 0, totals["orders"] or 0
+    totals = Order.objects.filter(edges).aggregate(revenue=Sum("total_price"), orders=Count("id"))
+    return revenue + (totals["revenue"] or 0), orders + totals["orders"]
+
+def checkout_cart(user, payment_method: str = "cash") -> _order:
+    """ Turns the user's cart into an order in one transaction with a fixed number of queries.
+
+    Stock is taken with one conditional UPDATE that converts the cart's holds into sales: each line needs
+    stock >= reserved + quantity - held, so other carts' holds are respected without locking the products.
+    Order items are bulk-created and the cart is emptied with one DELETE. Any shortfall rolls the whole
+    checkout back. Payment, shipment, inventory records and notifications are left to a process_order job
+    that commits with the order.
+    """
+    from .models import Cart, OrderItem
+    if not isinstance(payment_method, str) or not 0 < len(payment_method) <= 50:
+        raise ValidationError("Payment method must be a name of at most 50 characters.")
+    cart = Cart.objects.filter(user=user).first()
+    if cart is None:
+        raise ValidationError("Cart is empty")
+    store = get_cart_store()
+    store.flush(cart)
+
+    with transaction.atomic():
+        holds = dict(StockReservation.objects.select_for_update().filter(cart=cart).values_list("product_id", "quantity"))
+        lines = dict(CartItem.objects.filter(cart=cart).values_list("product_id", "quantity"))
+        if not lines:
+            raise ValidationError("Cart is empty")
+
+        product_ids = lines.keys() | holds.keys()
+        enough = reduce(or_, (
+            Q(id=product_id, stock__gte=F("reserved") + lines[product_id] - holds.get(product_id, 0)) if product_id in lines else Q(id=product_id)
+            for product_id in product_ids
+        ))
+        changes = {"stock": Case(*(When(id=product_id, then=F("stock") - quantity) for product_id, quantity in lines.items()), default=F("stock"))}
+        if holds:
+            changes["reserved"] = _reserved_delta({product_id: -quantity for product_id, quantity in holds.items()})
+        if Product.objects.filter(enough).update(**changes) != len(product_ids):
+            short = _short_products({product_id: quantity - holds.get(product_id, 0) for product_id, quantity in lines.items()})
+            raise ValidationError(f"Insufficient stock for products: {short}")
+
+        # Products whose holds were released without a line are read too, as their unreserved stock changed.
+        products = {
+            product_id: (price, stock, available)
+            for product_id, price, stock, available in Product.objects.filter(id__in=product_ids).values_list("id", "price", "stock", F("stock") - F("reserved"))
+        }
+        total_price = sum(products[product_id][0] * quantity for product_id, quantity in lines.items())
+        order = Order.objects.create(user=user, total_price=total_price)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=products[product_id][0])
+            for product_id, quantity in lines.items()
+        )
+        # Order.objects.create recorded the order's totals through its signal; bulk_create sends none for the lines.
+        record_order_lines(order, {product_id: (quantity, products[product_id][0]) for product_id, quantity in lines.items()})
+        CartItem.objects.filter(cart=cart).delete()
+        if holds:
+            StockReservation.objects.filter(cart=cart).delete()
+        enqueue("process_order", {"order_id": order.id, "payment_method": payment_method})
+
+        transaction.on_commit(lambda: _after_checkout(store, cart, products, lines))
     return order
 
+def _after_checkout(store, cart, products, lines) -> None:
+    """ Syncs in-process state that the bulk checkout writes bypass. """
+    store.discard(cart, lines)
+    top_products.record(lines)
+    # The order's commit-time bump ran before this callback, so a read in between cached a sketch without this sale.
+    analytics_cache.bump_version()
+    for product_id, (price, _, available) in products.items():
+        facet_index.update_product(product_id, price, available)
+    # Listings tolerate stock that is stale by up to the cache TTL, but a sell-out must show at once.
+    if any(stock <= 0 for _, stock, _ in products.values()):
+        catalog_cache.bump_version()
+
 def add_item_to_cart(cart, product, quantity: int) -> _cartItem:
-    """ Adds an item to the cart or updates its quantity if it already exists. """
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    if not created:
-        cart_item.quantity += quantity
-    else:
-        cart_item.quantity = quantity
-    cart_item.save()
-    return cart_item
+    """ Adds quantity of a product to the cart with a single atomic upsert, so concurrent adds never lose updates. """
+    if quantity < 1:
+        raise ValidationError("Quantity must be at least 1.")
+    new_quantity = get_cart_store().add(cart, product.id, quantity)
+    return CartItem(cart=cart, product=product, quantity=new_quantity)
 
 def remove_item_from_cart(cart, product) -> None:
     """ Removes an item from the cart. """
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product=product)
-        cart_item.delete()
-    except CartItem.DoesNotExist:
-        pass
+    get_cart_store().remove(cart, product.id)
 
 def update_item_quantity(cart, product, quantity: int) -> _cartItem:
-    """ Updates the quantity of an item in the cart. """
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    cart_item.quantity = quantity
-    cart_item.save()
-    return cart_item
+    """ Updates the quantity of an item in the cart; a quantity of 0 removes it. """
+    if quantity < 0:
+        raise ValidationError("Quantity cannot be negative.")
+    get_cart_store().set(cart, product.id, quantity)
+    return CartItem(cart=cart, product=product, quantity=quantity)
+
+CART_OPERATIONS = ("add", "set", "remove")
+
+def _parse_cart_operation(operation) -> tuple[str, int, int]:
+    """ Validates one batch cart operation and returns its (op, product_id, quantity). """
+    if not isinstance(operation, dict) or operation.get("op") not in CART_OPERATIONS:
+        raise ValidationError(f"Each operation needs an 'op' of {', '.join(CART_OPERATIONS)}.")
+    op = operation["op"]
+    try:
+        product_id = int(operation.get("product_id"))
+        quantity = int(operation.get("quantity", 1 if op == "add" else 0))
+    except (TypeError, ValueError):
+        raise ValidationError("Operation product_id and quantity must be integers.")
+    if (op == "add" and quantity < 1) or (op == "set" and quantity < 0):
+        raise ValidationError("Operation quantity is out of range.")
+    return op, product_id, quantity
+
+def apply_cart_operations(cart, operations: list[dict]) -> None:
+    """ Applies a batch of add/set/remove operations to the cart as one unit with a fixed number of queries. """
+    if not isinstance(operations, list) or not operations:
+        raise ValidationError("Operations must be a non-empty list.")
+    parsed = [_parse_cart_operation(operation) for operation in operations]
+    product_ids = {product_id for _, product_id, _ in parsed}
+
+    found = set(Product.objects.filter(id__in=product_ids).values_list("id", flat=True))
+    missing = product_ids - found
+    if missing:
+        raise ValidationError(f"Products do not exist: {sorted(missing)}")
+    get_cart_store().apply(cart, parsed)
 
 def list_cart_items(cart) -> list[_cartItem]:
     """ Lists all items in the cart. """
-    return list(CartItem.objects.filter(cart=cart).select_related("product"))
+    quantities = get_cart_store().quantities(cart)
+    products = Product.objects.in_bulk(list(quantities))
+    return [
+        CartItem(cart=cart, product=products[product_id], quantity=quantity)
+        for product_id, quantity in quantities.items() if product_id in products
+    ]
 
 def list_orders_by_user(user_id: int) -> list[_order]:
     """ Lists all orders for the given user ID. """
-    return list(Order.objects.filter(user__id=user_id).order_by('-created_at'))
+    return list(_order_history(user_id))
+
+def _order_history(user_id: int) -> QuerySet:
+    """ Returns the user's orders newest first with their items and products prefetched in one extra query. """
+    from .models import OrderItem
+    items = OrderItem.objects.select_related("product").only("order_id", "product_id", "product__name", "quantity", "price").order_by("id")
+    return Order.objects.filter(user__id=user_id).order_by("-created_at", "-id").prefetch_related(Prefetch("items", queryset=items))
+
+ORDER_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+def encode_order_cursor(order) -> str:
+    """ Encodes an order's (created_at, id) sort key as a URL-safe keyset cursor of microseconds and id. """
+    return f"{(order.created_at - ORDER_CURSOR_EPOCH) // timedelta(microseconds=1)}_{order.id}"
+
+def decode_order_cursor(cursor: str) -> tuple:
+    """ Decodes a cursor from encode_order_cursor, raising ValidationError if it is malformed. """
+    try:
+        microseconds, order_id = (int(part) for part in cursor.split("_"))
+        created_at = ORDER_CURSOR_EPOCH + timedelta(microseconds=microseconds)
+    except (ValueError, OverflowError):
+        raise ValidationError("Invalid cursor.")
+    return created_at, order_id
+
+def list_order_history_page(user_id: int, cursor: str | None = None, page_size: int | None = None) -> tuple[list[dict], str | None]:
+    """ Returns one page of the user's orders with their items, newest first, and the cursor of the next page.
+
+    Pages are keyed on (created_at, id) so they are served from the (user, created_at) index, and each page
+    costs two queries however many orders or items it holds.
+    """
+    page_size = resolve_product_page_size(page_size)
+    queryset = _order_history(user_id)
+    if cursor:
+        created_at, order_id = decode_order_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id))
+    orders = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        next_cursor = encode_order_cursor(orders[-1])
+    return [
+        {
+            "id": order.id,
+            "total_price": order.total_price,
+            "created_at": order.created_at,
+            "items": [
+                {"product_id": item.product_id, "name": item.product.name, "quantity": item.quantity, "price": item.price}
+                for item in order.items.all()
+            ],
+        }
+        for order in orders
+    ], next_cursor
 
 def delete_order(order_id: int) -> bool:
     """ Deletes an order by its ID. Returns True if deleted, False if not found. """
     try:
-        order = Order.objects.get(id=order_id)
-        order.delete()
+        with transaction.atomic():
+            # The delete signals of the order and its cascaded lines take them out of the sales rollups.
+            Order.objects.select_for_update().get(id=order_id).delete()
         return True
     except Order.DoesNotExist:
         return False
 
 def clear_user_cart(user_id: int) -> None:
     """ Clears the cart for the given user ID. """
-    CartItem.objects.filter(cart__user__id=user_id).delete()
+    from .models import Cart
+    store = get_cart_store()
+    for cart in Cart.objects.filter(user__id=user_id):
+        store.clear(cart)
 
 def get_total_items_in_cart(cart) -> int:
     """ Gets the total number of items in the cart. """
-    return sum(item.quantity for item in CartItem.objects.filter(cart=cart))
+    return sum(get_cart_store().quantities(cart).values())
 
+@analytics_cache.memoize
 def get_total_orders_count() -> int:
     """ Gets the total number of orders in the system. """
-    return Order.objects.count()
+    from django.db.models import Sum
+    from .models import DailySales
+    return DailySales.objects.aggregate(Sum('order_count'))['order_count__sum'] or 0
+
+def _ranked_products(ranked: list[tuple[int, int, int]]) -> list[tuple]:
+    """ Attaches product names to (product_id, count, error) sketch rows, dropping products deleted since. """
+    names = dict(Product.objects.filter(id__in=[product_id for product_id, _, _ in ranked]).values_list('id', 'name'))
+    return [(product_id, names[product_id], count) for product_id, count, _ in ranked if product_id in names]
 
+@analytics_cache.memoize
 def get_most_ordered_products(top_n: int) -> list[tuple]:
-    """ Gets the top N most ordered products. """
-    from django.db.models import Count
+    """ Gets the top N most ordered products, approximately, from the live top products sketch. """
+    from django.db.models import Sum
     from .models import Product
 
+    ranked = top_products.top("orders", top_n)
+    if ranked is not None:
+        return _ranked_products(ranked)
     return list(
-        Product.objects.annotate(order_count=Count('cartitem__cart__order'))
+        Product.objects.annotate(order_count=Coalesce(Sum('daily_sales__order_count'), 0))
         .order_by('-order_count')[:top_n]
         .values_list('id', 'name', 'order_count')
     )
+@analytics_cache.memoize
 def get_least_ordered_products(top_n: int) -> list[tuple]:
     """ Gets the top N least ordered products. """
-    from django.db.models import Count
+    from django.db.models import Sum
     from .models import Product
 
     return list(
-        Product.objects.annotate(order_count=Count('cartitem__cart__order'))
+        Product.objects.annotate(order_count=Coalesce(Sum('daily_sales__order_count'), 0))
         .order_by('order_count')[:top_n]
         .values_list('id', 'name', 'order_count')
     )
 
+@analytics_cache.memoize
 def get_average_order_value() -> float:
     """ Calculates the average order value across all orders. """
-    from django.db.models import Avg
-    average = Order.objects.aggregate(Avg('total_amount'))['total_amount__avg']
-    return average if average is not None else 0.0
+    from django.db.models import Sum
+    from .models import DailySales
+    totals = DailySales.objects.aggregate(revenue=Sum('revenue'), orders=Sum('order_count'))
+    return totals['revenue'] / totals['orders'] if totals['orders'] else 0.0
 
-def get_total_revenue() -> float:
+@analytics_cache.memoize
+def get_total_revenue() -> int:
     """ Calculates the total revenue from all orders. """
     from django.db.models import Sum
-    total = Order.objects.aggregate(Sum('total_amount'))['total_amount__sum']
-    return total if total is not None else 0.0
+    from .models import DailySales
+    total = DailySales.objects.aggregate(Sum('revenue'))['revenue__sum']
+    return total if total is not None else 0
 
 def get_user_order_history(user_id: int) -> list[_order]:
     """ Retrieves the order history for a specific user. """
-    return list(Order.objects.filter(user__id=user_id).order_by('-created_at'))
+    return list(_order_history(user_id))
 
-def get_cart_total_items_and_amount(cart) -> tuple[int, float]:
+def get_cart_total_items_and_amount(cart) -> tuple[int, int]:
     """ Gets the total number of items and total amount in the cart. """
-    cart_items = CartItem.objects.filter(cart=cart)
+    cart_items = list_cart_items(cart)
     total_items = sum(item.quantity for item in cart_items)
     total_amount = sum(item.product.price * item.quantity for item in cart_items)
     return total_items, total_amount
@@ -187,13 +838,14 @@ def get_orders_within_date_range(start_date, end_date) -> list[_order]:
     """ Retrieves orders placed within a specific date range. """
     return list(Order.objects.filter(created_at__range=(start_date, end_date)).order_by('-created_at'))
 
+@analytics_cache.memoize
 def get_top_customers(top_n: int) -> list[tuple]:
     """ Gets the top N customers based on total order amount. """
     from django.db.models import Sum
     from django.contrib.auth.models import User
 
     return list(
-        User.objects.annotate(total_spent=Sum('order__total_amount'))
+        User.objects.annotate(total_spent=Sum('order__total_price'))
         .order_by('-total_spent')[:top_n]
         .values_list('id', 'username', 'total_spent')
     )
@@ -203,70 +855,87 @@ def get_inactive_carts(threshold_date) -> list:
     from .models import Cart
     return list(Cart.objects.filter(updated_at__lt=threshold_date))
 
+def reap_inactive_carts(threshold_date, batch_size: int = 500, pause: float = 0.1) -> dict:
+    """ Deletes carts inactive since the threshold date and their items in bounded batches, pausing between batches.
+
+    Each batch is its own short transaction, so other writers are never locked out for long.
+    Returns the number of carts and cart items deleted and the elapsed seconds.
+    """
+    from .models import Cart
+    started = time.monotonic()
+    carts_deleted = items_deleted = 0
+    while True:
+        with transaction.atomic():
+            cart_ids = list(
+                Cart.objects.select_for_update(skip_locked=True)
+                .filter(updated_at__lt=threshold_date)
+                .order_by("updated_at")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not cart_ids:
+                break
+            _release_reservations(StockReservation.objects.filter(cart_id__in=cart_ids))
+            items_deleted += CartItem.objects.filter(cart_id__in=cart_ids).delete()[0]
+            carts_deleted += Cart.objects.filter(id__in=cart_ids).delete()[0]
+        if pause:
+            time.sleep(pause)
+    return {"carts": carts_deleted, "items": items_deleted, "seconds": time.monotonic() - started}
+
 def delete_inactive_carts(threshold_date) -> int:
     """ Deletes carts that have not been updated since the threshold date. Returns the number of deleted carts. """
-    from .models import Cart
-    inactive_carts = Cart.objects.filter(updated_at__lt=threshold_date)
-    count = inactive_carts.count()
-    inactive_carts.delete()
-    return count
+    return reap_inactive_carts(threshold_date)["carts"]
 
-def get_total_cart_value_by_user(user_id: int) -> float:
+def get_total_cart_value_by_user(user_id: int) -> int:
     """ Calculates the total value of the cart for a specific user. """
-    cart_items = CartItem.objects.filter(cart__user__id=user_id)
+    cart_items = get_cart_items_by_user(user_id)
     total_value = sum(item.product.price * item.quantity for item in cart_items)
     return total_value  
 
-def apply_discount_to_order(order: _order, discount_percentage: float) -> float:
-    """ Applies a discount to the order and returns the new total amount. """
-    if not (0 <= discount_percentage <= 100):
-        raise ValidationError("Discount percentage must be between 0 and 100.")
-    
-    discount_amount = (discount_percentage / 100) * order.total_amount
-    new_total = order.total_amount - discount_amount
-    order.total_amount = new_total
-    order.save()
+def apply_discount_to_order(order: _order, discount_percentage) -> int:
+    """ Applies a discount to the order and returns the new total amount, rounded half up to a whole shilling. """
+    new_total = apply_percentage_discount(to_minor(order.total_price), discount_percentage)
+    # The order's save signal moves the day's revenue by the discount.
+    order.total_price = new_total
+    order.save(update_fields=["total_price"])
     return new_total
 
 def get_cart_items_count(cart) -> int:
     """ Gets the count of distinct items in the cart. """
-    return CartItem.objects.filter(cart=cart).count()
+    return len(get_cart_store().quantities(cart))
 
-def get_orders_exceeding_amount(amount: float) -> list[_order]:
+def get_orders_exceeding_amount(amount: int) -> list[_order]:
     """ Retrieves orders that exceed a specific total amount. """
-    return list(Order.objects.filter(total_amount__gt=amount).order_by('-total_amount'))
+    return list(Order.objects.filter(total_price__gt=amount).order_by('-total_price'))
 
+@analytics_cache.memoize
 def get_average_items_per_order() -> float:
     """ Calculates the average number of items per order. """
-    from django.db.models import Avg, Count
-    average = Order.objects.annotate(item_count=Count('items')).aggregate(Avg('item_count'))['item_count__avg']
-    return average if average is not None else 0.0
+    from django.db.models import Sum
+    from .models import DailySales
+    totals = DailySales.objects.aggregate(lines=Sum('line_count'), orders=Sum('order_count'))
+    return totals['lines'] / totals['orders'] if totals['orders'] else 0.0
 
 def get_most_expensive_order() -> _order | None:
     """ Retrieves the most expensive order based on total amount. """
     try:
-        return Order.objects.order_by('-total_amount').first()
+        return Order.objects.order_by('-total_price').first()
     except Order.DoesNotExist:
         return None
     
 def get_least_expensive_order() -> _order | None:
     """ Retrieves the least expensive order based on total amount. """
     try:
-        return Order.objects.order_by('total_amount').first()
+        return Order.objects.order_by('total_price').first()
     except Order.DoesNotExist:
         return None
     
+@analytics_cache.memoize
 def get_total_quantity_sold_of_product(product_id: int) -> int:
     """ Calculates the total quantity sold of a specific product across all orders. """
-    from .models import Product
-    try:
-        product = Product.objects.get(id=product_id)
-        total_quantity = sum(
-            item.quantity for item in CartItem.objects.filter(product=product)
-        )
-        return total_quantity
-    except Product.DoesNotExist:
-        return 0    
+    from django.db.models import Sum
+    from .models import DailyProductSales
+    total_quantity = DailyProductSales.objects.filter(product_id=product_id).aggregate(Sum('quantity'))['quantity__sum']
+    return total_quantity or 0
     
 def get_orders_containing_product(product_id: int) -> list[_order]:
     """ Retrieves orders that contain a specific product. """
@@ -278,48 +947,330 @@ def get_orders_containing_product(product_id: int) -> list[_order]:
     except Product.DoesNotExist:
         return []
     
-def get_total_revenue_within_date_range(start_date, end_date) -> float:
+@analytics_cache.memoize
+def get_total_revenue_within_date_range(start_date, end_date) -> int:
     """ Calculates the total revenue from orders placed within a specific date range. """
-    from django.db.models import Sum
-    total = Order.objects.filter(created_at__range=(start_date, end_date)).aggregate(Sum('total_amount'))['total_amount__sum']
-    return total if total is not None else 0.0
+    revenue, _ = _sales_in_range(start_date, end_date)
+    return revenue
 
+@analytics_cache.memoize
 def get_average_order_value_within_date_range(start_date, end_date) -> float:
     """ Calculates the average order value for orders placed within a specific date range. """
-    from django.db.models import Avg
-    average = Order.objects.filter(created_at__range=(start_date, end_date)).aggregate(Avg('total_amount'))['total_amount__avg']
-    return average if average is not None else 0.0
+    revenue, orders = _sales_in_range(start_date, end_date)
+    return revenue / orders if orders else 0.0
+
+TIME_SERIES_INTERVALS = ("hour", "day", "week")
+
+def _series_periods(start: datetime, end: datetime, interval: str, limit: int) -> list[datetime]:
+    """ Returns the start of every hour, day or week (from Monday) in local time that overlaps [start, end).
+
+    Raises ValidationError rather than building more than limit periods.
+    """
+    first = timezone.localtime(start).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    if interval != "hour":
+        first = first.replace(hour=0)
+    if interval == "week":
+        first -= timedelta(days=first.weekday())
+    step = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}[interval]
+    periods = []
+    current = first
+    while (period := timezone.make_aware(current)) < end:
+        if len(periods) == limit:
+            raise ValidationError(f"The range spans more than {limit} {interval}s.")
+        periods.append(period)
+        current += step
+    return periods
 
+@analytics_cache.memoize
+def get_revenue_time_series(start, end, interval: str = "day") -> list[dict]:
+    """ Returns revenue, order count and average order value per hour, day or week of a range, oldest first.
+
+    Dates bound the range by whole local days with end inclusive; datetimes bound it exactly, end exclusive.
+    Every period in the range is present, with zeros where no orders were placed, and the totals come from
+    one GROUP BY over the truncated created_at, which the created_at index lets the database range-scan.
+    """
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDay, TruncHour, TruncWeek
+    if interval not in TIME_SERIES_INTERVALS:
+        raise ValidationError(f"Interval must be one of: {', '.join(TIME_SERIES_INTERVALS)}")
+    start = _as_datetime(start)
+    end = _day_start(end + timedelta(days=1)) if not isinstance(end, datetime) else _as_datetime(end)
+    if start >= end:
+        raise ValidationError("The range must end after it starts.")
+    periods = _series_periods(start, end, interval, getattr(settings, "SHOP_TIME_SERIES_MAX_POINTS", 5000))
+
+    truncate = {"hour": TruncHour, "day": TruncDay, "week": TruncWeek}[interval]
+    totals = {
+        row["period"]: (row["revenue"], row["orders"])
+        for row in Order.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(period=truncate("created_at")).values("period")
+        .annotate(revenue=Sum("total_price"), orders=Count("id")).order_by()
+    }
+    series = []
+    for period in periods:
+        revenue, orders = totals.get(period, (0, 0))
+        series.append({
+            "period": period,
+            "revenue": revenue,
+            "orders": orders,
+            "average_order_value": revenue / orders if orders else 0.0,
+        })
+    return series
+
+@analytics_cache.memoize
 def get_top_selling_products(top_n: int) -> list[tuple]:
-    """ Gets the top N selling products based on quantity sold. """
+    """ Gets the top N selling products based on quantity sold, approximately, from the live top products sketch. """
     from django.db.models import Sum
     from .models import Product
 
+    ranked = top_products.top("quantity", top_n)
+    if ranked is not None:
+        return _ranked_products(ranked)
     return list(
-        Product.objects.annotate(total_sold=Sum('cartitem__quantity'))
+        Product.objects.annotate(total_sold=Coalesce(Sum('daily_sales__quantity'), 0))
         .order_by('-total_sold')[:top_n]
         .values_list('id', 'name', 'total_sold')
     )
 
+@analytics_cache.memoize
 def get_least_selling_products(top_n: int) -> list[tuple]:
     """ Gets the top N least selling products based on quantity sold. """
     from django.db.models import Sum
     from .models import Product
 
     return list(
-        Product.objects.annotate(total_sold=Sum('cartitem__quantity'))
+        Product.objects.annotate(total_sold=Coalesce(Sum('daily_sales__quantity'), 0))
         .order_by('total_sold')[:top_n]
         .values_list('id', 'name', 'total_sold')
     )
 
+@analytics_cache.memoize
 def get_total_products_sold() -> int:
     """ Calculates the total number of products sold across all orders. """
     from django.db.models import Sum
-    total = CartItem.objects.aggregate(Sum('quantity'))['quantity__sum']
+    from .models import DailySales
+    total = DailySales.objects.aggregate(Sum('items_sold'))['items_sold__sum']
     return total if total is not None else 0
 
-def get_total_unique_customers() -> int:
-    """ Gets the total number of unique customers who have placed orders. """
-    from django.contrib.auth.models import User
-    return User.objects.filter(order__isnull=False).distinct().count()  
+@analytics_cache.memoize
+def get_total_unique_customers(exact: bool = False) -> int:
+    """ Gets the total number of unique customers who have placed orders, approximately unless exact is set. """
+    return count_unique_customers(exact=exact)
+
+def product_values(queryset: QuerySet) -> QuerySet:
+    """ Selects the serialized product listing columns, joining the rating aggregate so each row costs O(1). """
+    return queryset.values(
+        *PRODUCT_LIST_FIELDS,
+        available=F("stock") - F("reserved"),
+        rating_count=Coalesce("rating__count", 0),
+        rating_average=Cast("rating__total", FloatField()) / NullIf("rating__count", 0),
+    )
+
+def resolve_product_page_size(requested: int | None = None) -> int:
+    """ Clamps a requested page size to the configured product listing bounds. """
+    default = getattr(settings, "SHOP_PRODUCT_PAGE_SIZE", 50)
+    maximum = getattr(settings, "SHOP_PRODUCT_MAX_PAGE_SIZE", 500)
+    if requested is None:
+        return default
+    if requested < 1:
+        raise ValidationError("Page size must be a positive integer.")
+    return min(requested, maximum)
+
+def list_products_page(after_id: int | None = None, page_size: int | None = None) -> tuple[list[dict], int | None]:
+    """ Returns one page of products ordered by id after the given cursor, and the cursor of the next page. """
+    page_size = resolve_product_page_size(page_size)
+    queryset = Product.objects.order_by("id")
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+
+    # Fetch one extra row to learn whether another page exists without a COUNT query.
+    rows = list(product_values(queryset)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = rows[-1]["id"]
+    return rows, next_cursor
+
+def iter_products(after_id: int | None = None, chunk_size: int | None = None) -> Iterator[dict]:
+    """ Yields every product after the given cursor, reading rows from the database in fixed-size chunks. """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "SHOP_PRODUCT_STREAM_CHUNK_SIZE", 2000)
+    queryset = Product.objects.order_by("id")
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    yield from product_values(queryset).iterator(chunk_size=chunk_size)
+
+def get_catalog_product_page(after_id: int | None = None, page_size: int | None = None) -> tuple[list[dict], int | None]:
+    """ Returns a product page from the catalog cache, querying the database only on a miss. """
+    page_size = resolve_product_page_size(page_size)
+    return catalog_cache.get_or_set(
+        ("products", after_id, page_size),
+        lambda: list_products_page(after_id=after_id, page_size=page_size),
+    )
+
+def list_categories() -> list[dict]:
+    """ Lists all categories as serialized rows. """
+    return list(Category.objects.order_by("id").values("id", "name", "description"))
+
+def get_catalog_categories() -> list[dict]:
+    """ Returns the category listing from the catalog cache, querying the database only on a miss. """
+    return catalog_cache.get_or_set(("categories",), list_categories)
+
+def filter_products(category_ids=None, min_price=None, max_price=None, in_stock=None, after_id: int | None = None, page_size: int | None = None) -> dict:
+    """ Filters products through the facet index and returns one keyset page with the count of every facet value. """
+    page_size = resolve_product_page_size(page_size)
+    matched, facets = facet_index.filter(category_ids=category_ids, min_price=min_price, max_price=max_price, in_stock=in_stock)
+    page_ids, next_cursor = facet_index.page(matched, after_id, page_size)
+    rows = list(product_values(Product.objects.filter(id__in=page_ids).order_by("id"))) if page_ids else []
+    return {"results": rows, "count": len(matched), "next_cursor": next_cursor, "facets": facets}
+
+def apply_review_rating(product_id: int, rating: int, delta: int) -> None:
+    """ Adds (delta=1) or removes (delta=-1) one rating from the product's aggregate using F() expressions. """
+    if not 1 <= rating <= 5:
+        return
+    updates = {
+        "count": F("count") + delta,
+        "total": F("total") + delta * rating,
+        f"star_{rating}": F(f"star_{rating}") + delta,
+    }
+    if ProductRating.objects.filter(product_id=product_id).update(**updates) or delta < 0:
+        return
+    # First review of this product: create the aggregate, tolerating a concurrent first review.
+    _, created = ProductRating.objects.get_or_create(product_id=product_id, defaults={"count": 1, "total": rating, f"star_{rating}": 1})
+    if not created:
+        ProductRating.objects.filter(product_id=product_id).update(**updates)
+
+def create_review(product, user, rating, comment: str = "") -> Review:
+    """ Creates a review after validating its rating; signals keep the rating aggregate in the same transaction. """
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        raise ValidationError("Rating must be an integer between 1 and 5.")
+    if not 1 <= rating <= 5:
+        raise ValidationError("Rating must be an integer between 1 and 5.")
+    with transaction.atomic():
+        return Review.objects.create(product=product, user=user, rating=rating, comment=comment)
+
+def get_product_rating_summary(product_id: int) -> dict:
+    """ Returns the review count, average and 1-5 histogram of a product from its rating aggregate. """
+    aggregate = ProductRating.objects.filter(product_id=product_id).first() or ProductRating(product_id=product_id)
+    return {"count": aggregate.count, "average": aggregate.average, "histogram": aggregate.histogram()}
+
+def list_reviews_page(product_id: int, before_id: int | None = None, page_size: int | None = None) -> tuple[list[dict], int | None]:
+    """ Returns one page of a product's reviews, newest first, and the cursor of the next page. """
+    page_size = resolve_product_page_size(page_size)
+    queryset = Review.objects.filter(product_id=product_id).order_by("-id")
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    rows = list(queryset.values(*REVIEW_LIST_FIELDS)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = rows[-1]["id"]
+    return rows, next_cursor
+
+def _split_list(value) -> list[str]:
+    """ Normalizes a feed list column, given either as a JSON list or a '|' separated string. """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split("|")
+    return [item.strip() for item in value if item and item.strip()]
+
+def _parse_catalog_row(row: dict) -> dict:
+    """ Validates one supplier feed row and converts its columns to model values. """
+    sku = str(row.get("sku") or "").strip()
+    name = str(row.get("name") or "").strip()
+    if not sku or not name:
+        raise ValidationError("Every catalog row needs a sku and a name.")
+    try:
+        price = to_minor(row.get("price"))
+        supply_price = to_minor(row["supply_price"]) if row.get("supply_price") not in (None, "") else None
+        stock = int(row.get("stock") or 0)
+    except (ValidationError, ValueError):
+        raise ValidationError(f"Row for sku {sku} has a malformed price, supply price or stock.")
+    return {
+        "sku": sku,
+        "name": name,
+        "description": row.get("description") or "",
+        "price": price,
+        "stock": stock,
+        "categories": _split_list(row.get("categories")),
+        "images": _split_list(row.get("images")),
+        "supply_price": supply_price,
+    }
+
+def upsert_catalog_batch(rows: list[dict], supplier=None) -> list[int]:
+    """ Upserts one batch of feed rows keyed by sku, with their categories, images and supplier prices, using bulk queries.
+
+    Bulk writes bypass model signals, so the search index, facet index and catalog cache are refreshed explicitly.
+    Returns the ids of the products touched.
+    """
+    from .search import index_products
+
+    parsed = {}
+    for row in rows:
+        item = _parse_catalog_row(row)
+        parsed[item["sku"]] = item  # The last row for a sku wins.
+
+    with transaction.atomic():
+        products = {p.sku: p for p in Product.objects.filter(sku__in=parsed).only("id", "sku")}
+        to_create, to_update = [], []
+        for sku, item in parsed.items():
+            product = products.get(sku)
+            if product is None:
+                product = Product(sku=sku)
+                to_create.append(product)
+                products[sku] = product
+            else:
+                to_update.append(product)
+            product.name = item["name"]
+            product.description = item["description"]
+            product.price = item["price"]
+            product.stock = item["stock"]
+        Product.objects.bulk_create(to_create)
+        Product.objects.bulk_update(to_update, ["name", "description", "price", "stock"])
+        product_ids = [product.id for product in products.values()]
+
+        category_names = {name for item in parsed.values() for name in item["categories"]}
+        categories = dict(Category.objects.filter(name__in=category_names).values_list("name", "id"))
+        new_categories = [Category(name=name, description="") for name in category_names if name not in categories]
+        for category in Category.objects.bulk_create(new_categories):
+            categories[category.name] = category.id
+
+        links = set(ProductCategory.objects.filter(product_id__in=product_ids).values_list("product_id", "category_id"))
+        images = set(ProductImage.objects.filter(product_id__in=product_ids).values_list("product_id", "image_url"))
+        new_links, new_images = [], []
+        for sku, item in parsed.items():
+            product_id = products[sku].id
+            for name in item["categories"]:
+                if (product_id, categories[name]) not in links:
+                    links.add((product_id, categories[name]))
+                    new_links.append(ProductCategory(product_id=product_id, category_id=categories[name]))
+            for url in item["images"]:
+                if (product_id, url) not in images:
+                    images.add((product_id, url))
+                    new_images.append(ProductImage(product_id=product_id, image_url=url))
+        ProductCategory.objects.bulk_create(new_links)
+        ProductImage.objects.bulk_create(new_images)
+
+        if supplier is not None:
+            supplied = {sp.product_id: sp for sp in SupplierProduct.objects.filter(supplier=supplier, product_id__in=product_ids)}
+            new_supplied, changed_supplied = [], []
+            for sku, item in parsed.items():
+                if item["supply_price"] is None:
+                    continue
+                product_id = products[sku].id
+                if product_id in supplied:
+                    supplied[product_id].supply_price = item["supply_price"]
+                    changed_supplied.append(supplied[product_id])
+                else:
+                    new_supplied.append(SupplierProduct(supplier=supplier, product_id=product_id, supply_price=item["supply_price"]))
+            SupplierProduct.objects.bulk_create(new_supplied)
+            SupplierProduct.objects.bulk_update(changed_supplied, ["supply_price"])
+
+        index_products(product_ids)
 
+    facet_index.refresh_products(product_ids)
+    catalog_cache.bump_version()
+    return product_ids
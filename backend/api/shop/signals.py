@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .cache import analytics_cache, catalog_cache
+from .facets import facet_index
+from .models import Category, Order, OrderItem, Product, ProductCategory, ProductImage, Review
+from .search import index_products, remove_products
+from .services import apply_review_rating, record_order_lines, record_order_repricing, record_order_totals
+from .sketches import top_products
+
+CATALOG_MODELS = (Product, Category, ProductCategory, ProductImage)
+
+def invalidate_catalog_cache(sender, **kwargs) -> None:
+    """ Bumps the catalog cache version whenever a catalog row is written or deleted. """
+    catalog_cache.bump_version()
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog_cache, sender=model, dispatch_uid=f"catalog_cache_save_{model.__name__}")
+    post_delete.connect(invalidate_catalog_cache, sender=model, dispatch_uid=f"catalog_cache_delete_{model.__name__}")
+
+def index_product(sender, instance, **kwargs) -> None:
+    """ Keeps the product's search index row in sync with its name and description. """
+    index_products([instance.pk])
+
+def unindex_product(sender, instance, **kwargs) -> None:
+    """ Removes a deleted product from the search index. """
+    remove_products([instance.pk])
+
+post_save.connect(index_product, sender=Product, dispatch_uid="search_index_save_product")
+post_delete.connect(unindex_product, sender=Product, dispatch_uid="search_index_delete_product")
+
+def update_product_facets(sender, instance, **kwargs) -> None:
+    """ Moves a saved product into its current price bucket and stock facet. """
+    price = Product._meta.get_field("price").to_python(instance.price)
+    stock = Product._meta.get_field("stock").to_python(instance.stock)
+    reserved = Product._meta.get_field("reserved").to_python(instance.reserved)
+    facet_index.update_product(instance.pk, price, stock - reserved)
+
+def remove_product_facets(sender, instance, **kwargs) -> None:
+    """ Drops a deleted product from every facet. """
+    facet_index.remove_product(instance.pk)
+
+def link_product_category(sender, instance, created, **kwargs) -> None:
+    """ Adds a new category membership to the facet index. """
+    if created:
+        facet_index.link(instance.product_id, instance.category_id)
+    else:
+        # The previous product/category pair is unknown, so rebuild on next read.
+        facet_index.invalidate()
+
+def unlink_product_category(sender, instance, **kwargs) -> None:
+    """ Removes a deleted category membership from the facet index. """
+    facet_index.unlink(instance.product_id, instance.category_id)
+
+post_save.connect(update_product_facets, sender=Product, dispatch_uid="facet_index_save_product")
+post_delete.connect(remove_product_facets, sender=Product, dispatch_uid="facet_index_delete_product")
+post_save.connect(link_product_category, sender=ProductCategory, dispatch_uid="facet_index_save_product_category")
+post_delete.connect(unlink_product_category, sender=ProductCategory, dispatch_uid="facet_index_delete_product_category")
+
+def remember_previous_rating(sender, instance, **kwargs) -> None:
+    """ Stashes the stored rating of an edited review so post_save can move it between histogram buckets. """
+    instance._previous_rating = None
+    if instance.pk is not None:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list("rating", flat=True).first()
+
+def add_review_rating(sender, instance, created, **kwargs) -> None:
+    """ Counts a saved review in its product's rating aggregate. """
+    previous = getattr(instance, "_previous_rating", None)
+    if not created and previous is not None:
+        apply_review_rating(instance.product_id, previous, -1)
+    apply_review_rating(instance.product_id, int(instance.rating), 1)
+
+def remove_review_rating(sender, instance, **kwargs) -> None:
+    """ Removes a deleted review from its product's rating aggregate. """
+    apply_review_rating(instance.product_id, int(instance.rating), -1)
+
+def refresh_rated_product(sender, instance, **kwargs) -> None:
+    """ Drops the cached listing pages showing a reviewed product once its new rating is committed. """
+    product_id = instance.product_id
+    transaction.on_commit(lambda: catalog_cache.discard_product(product_id))
+
+pre_save.connect(remember_previous_rating, sender=Review, dispatch_uid="product_rating_pre_save_review")
+post_save.connect(add_review_rating, sender=Review, dispatch_uid="product_rating_save_review")
+post_delete.connect(remove_review_rating, sender=Review, dispatch_uid="product_rating_delete_review")
+post_save.connect(refresh_rated_product, sender=Review, dispatch_uid="catalog_cache_save_review")
+post_delete.connect(refresh_rated_product, sender=Review, dispatch_uid="catalog_cache_delete_review")
+
+def count_order_item(sender, instance, created, **kwargs) -> None:
+    """ Feeds an order line saved outside the bulk checkout into the top products sketch once it commits. """
+    if created:
+        lines = {instance.product_id: instance.quantity}
+        transaction.on_commit(lambda: top_products.record(lines))
+
+post_save.connect(count_order_item, sender=OrderItem, dispatch_uid="top_products_save_order_item")
+
+def remember_previous_total(sender, instance, update_fields=None, **kwargs) -> None:
+    """ Stashes the stored total of an edited order so post_save can move the day's revenue by the difference. """
+    instance._previous_total = None
+    if instance.pk is not None and (update_fields is None or "total_price" in update_fields):
+        instance._previous_total = Order.objects.filter(pk=instance.pk).values_list("total_price", flat=True).first()
+
+def record_saved_order(sender, instance, created, **kwargs) -> None:
+    """ Keeps the daily sales rollups in step with orders created or repriced through the ORM, the admin included. """
+    if created:
+        record_order_totals(instance)
+    elif instance._previous_total is not None and instance._previous_total != instance.total_price:
+        record_order_repricing(instance, instance._previous_total)
+
+def record_deleted_order(sender, instance, **kwargs) -> None:
+    """ Takes a deleted order, including one deleted by cascade from its user, out of the daily sales rollups. """
+    record_order_totals(instance, -1)
+
+def _line_on_other_items(item) -> bool:
+    return OrderItem.objects.filter(order_id=item.order_id, product_id=item.product_id).exclude(pk=item.pk).exists()
+
+def remember_previous_line(sender, instance, **kwargs) -> None:
+    """ Stashes the stored state of an edited order line so post_save can swap it for the new one in the rollups. """
+    instance._previous_line = None
+    if instance.pk is not None:
+        instance._previous_line = OrderItem.objects.filter(pk=instance.pk).first()
+
+def record_saved_line(sender, instance, created, **kwargs) -> None:
+    """ Keeps the daily sales rollups in step with order lines saved one at a time; checkout's bulk lines are recorded by checkout. """
+    previous = getattr(instance, "_previous_line", None)
+    if previous is not None:
+        record_order_lines(previous.order, {previous.product_id: (previous.quantity, previous.price)}, -1, count_orders=not _line_on_other_items(previous))
+    record_order_lines(instance.order, {instance.product_id: (instance.quantity, instance.price)}, count_orders=not _line_on_other_items(instance))
+
+def record_deleted_line(sender, instance, **kwargs) -> None:
+    """ Takes a deleted order line out of the daily sales rollups; its order still exists while cascades delete its lines. """
+    order = Order.objects.filter(pk=instance.order_id).first()
+    if order is not None:
+        record_order_lines(order, {instance.product_id: (instance.quantity, instance.price)}, -1, count_orders=not _line_on_other_items(instance))
+
+pre_save.connect(remember_previous_total, sender=Order, dispatch_uid="sales_rollups_pre_save_order")
+post_save.connect(record_saved_order, sender=Order, dispatch_uid="sales_rollups_save_order")
+post_delete.connect(record_deleted_order, sender=Order, dispatch_uid="sales_rollups_delete_order")
+pre_save.connect(remember_previous_line, sender=OrderItem, dispatch_uid="sales_rollups_pre_save_order_item")
+post_save.connect(record_saved_line, sender=OrderItem, dispatch_uid="sales_rollups_save_order_item")
+post_delete.connect(record_deleted_line, sender=OrderItem, dispatch_uid="sales_rollups_delete_order_item")
+
+def invalidate_analytics_cache(sender, **kwargs) -> None:
+    """ Bumps the analytics cache version when an order or order line is written, and again once the write commits.
+
+    The second bump drops anything another thread computed from the pre-commit data in between.
+    """
+    analytics_cache.bump_version()
+    transaction.on_commit(analytics_cache.bump_version)
+
+for model in (Order, OrderItem):
+    post_save.connect(invalidate_analytics_cache, sender=model, dispatch_uid=f"analytics_cache_save_{model.__name__}")
+    post_delete.connect(invalidate_analytics_cache, sender=model, dispatch_uid=f"analytics_cache_delete_{model.__name__}")
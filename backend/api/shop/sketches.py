@@ -0,0 +1,285 @@
+import heapq
+import math
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import DailyProductSales, SketchSnapshot
+
+
+class SpaceSaving:
+    """ Space-Saving heavy-hitters summary: approximate counts of the most frequent items in O(capacity) memory.
+
+    Every monitored item's count overestimates its true count by at most its recorded error, and any item
+    whose true count exceeds total / capacity is guaranteed to be monitored.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[int, int] = {}
+        self.errors: dict[int, int] = {}
+        # Min-heap of (count, item); entries go stale when a count changes and are skipped lazily.
+        self._heap: list[tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _floor(self) -> tuple[int, int]:
+        while True:
+            count, item = self._heap[0]
+            if self.counts.get(item) == count:
+                return item, count
+            heapq.heappop(self._heap)
+
+    def add(self, item: int, weight: int = 1) -> None:
+        """ Counts weight more occurrences of item, evicting the least counted item if the summary is full. """
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+        else:
+            evicted, floor = self._floor()
+            heapq.heappop(self._heap)
+            del self.counts[evicted], self.errors[evicted]
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def min_count(self) -> int:
+        """ Returns the count any unmonitored item could at most have. """
+        return self._floor()[1] if len(self.counts) >= self.capacity else 0
+
+    def top(self, n: int) -> list[tuple[int, int, int]]:
+        """ Returns the n most counted items as (item, count, error), highest first. """
+        return [
+            (item, count, self.errors[item])
+            for item, count in heapq.nlargest(n, self.counts.items(), key=lambda entry: (entry[1], -entry[0]))
+        ]
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """ Returns a summary of both streams, keeping the overestimate guarantee of each input. """
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        floor, other_floor = self.min_count(), other.min_count()
+        combined = {}
+        for item in self.counts.keys() | other.counts.keys():
+            count = self.counts.get(item, floor) + other.counts.get(item, other_floor)
+            error = self.errors.get(item, floor) + other.errors.get(item, other_floor)
+            combined[item] = (count, error)
+        for item, (count, error) in heapq.nlargest(merged.capacity, combined.items(), key=lambda entry: entry[1][0]):
+            merged.counts[item], merged.errors[item] = count, error
+        merged._heap = [(count, item) for item, count in merged.counts.items()]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def to_dict(self) -> dict:
+        return {"capacity": self.capacity, "counters": [[item, count, self.errors[item]] for item, count in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data: dict, capacity: int | None = None) -> "SpaceSaving":
+        sketch = cls(capacity or data.get("capacity") or 1)
+        for item, count, error in heapq.nlargest(sketch.capacity, data.get("counters", []), key=lambda counter: counter[1]):
+            sketch.counts[item], sketch.errors[item] = count, error
+        sketch._heap = [(count, item) for item, count in sketch.counts.items()]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+
+_MASK64 = (1 << 64) - 1
+
+def _mix64(value: int) -> int:
+    """ Scrambles an integer id into a uniformly distributed 64-bit hash (the SplitMix64 finalizer). """
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """ HyperLogLog distinct counter over integer ids: 2 ** precision one-byte registers, about 1.04 / sqrt(2 ** precision) relative error.
+
+    Sketches of the same precision merge by taking the register-wise maximum, which counts the union of their ids.
+    """
+
+    def __init__(self, precision: int = 12, registers: np.ndarray | None = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16.")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def position(self, item: int) -> tuple[int, int]:
+        """ Returns the register an item falls in and the rank it would set there. """
+        hashed = _mix64(item)
+        rest_bits = 64 - self.precision
+        return hashed >> rest_bits, rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+
+    def add(self, item: int) -> bool:
+        """ Counts an item. Returns whether a register changed, i.e. whether the sketch needs saving. """
+        index, rank = self.position(item)
+        if self.registers[index] >= rank:
+            return False
+        self.registers[index] = rank
+        return True
+
+    def count(self) -> int:
+        """ Returns the estimated number of distinct items added. """
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / float(np.ldexp(1.0, -self.registers.astype(np.int32)).sum())
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """ Returns a sketch of the union of both sketches' items. """
+        if other.precision != self.precision:
+            raise ValueError("Only HyperLogLog sketches of the same precision can be merged.")
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    @classmethod
+    def union(cls, sketches, precision: int = 12) -> "HyperLogLog":
+        """ Merges any number of sketches; no sketches give an empty one of the given precision. """
+        sketches = list(sketches)
+        if not sketches:
+            return cls(precision)
+        if any(sketch.precision != sketches[0].precision for sketch in sketches):
+            raise ValueError("Only HyperLogLog sketches of the same precision can be merged.")
+        return cls(sketches[0].precision, np.maximum.reduce([sketch.registers for sketch in sketches]))
+
+    def to_bytes(self) -> bytes:
+        """ Serializes the registers compressed, so sparse days take a few dozen bytes. """
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data) -> "HyperLogLog":
+        registers = np.frombuffer(zlib.decompress(bytes(data)), dtype=np.uint8).copy()
+        return cls(len(registers).bit_length() - 1, registers)
+
+
+class TopProducts:
+    """ Live top-K products by orders and by units sold, fed from checkout and persisted to SketchSnapshot rows.
+
+    Each process counts its own sales in a pending summary and, at most every SHOP_SKETCH_PERSIST_INTERVAL
+    seconds, merges it into the shared snapshot as it records a sale. Reads only write nothing: they reload the
+    snapshot at most as often, which picks up other processes' sales.
+    """
+
+    SKETCHES = ("orders", "quantity")
+
+    def __init__(self, capacity: int, persist_interval: float):
+        self.capacity = capacity
+        self.persist_interval = persist_interval
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self) -> None:
+        """ Forgets all in-process state; the next read reloads the persisted snapshot. """
+        with self._lock:
+            self._persisted = {name: SpaceSaving(self.capacity) for name in self.SKETCHES}
+            self._pending = {name: SpaceSaving(self.capacity) for name in self.SKETCHES}
+            self._merged: dict[str, SpaceSaving] = {}
+            self._persisted_at = None
+            self._loaded_at = None
+
+    def record(self, lines: dict[int, int]) -> None:
+        """ Counts one committed order: each product on it is ordered once and sold in its line quantity. """
+        with self._lock:
+            for product_id, quantity in lines.items():
+                self._pending["orders"].add(product_id, 1)
+                self._pending["quantity"].add(product_id, quantity)
+            self._merged.clear()
+        self.maybe_persist()
+
+    def _due(self, synced_at) -> bool:
+        return synced_at is None or time.monotonic() - synced_at >= self.persist_interval
+
+    def maybe_persist(self) -> None:
+        """ Persists pending counts if the last persist is older than the persist interval. """
+        if self._due(self._persisted_at):
+            self.persist()
+
+    def _seed(self, name: str) -> SpaceSaving:
+        """ Returns exact counts of the capacity top products from the daily rollups, to start a missing snapshot from. """
+        field = "order_count" if name == "orders" else "quantity"
+        ranked = (
+            DailyProductSales.objects.values("product_id").annotate(total=Sum(field))
+            .filter(total__gt=0).order_by("-total")[:self.capacity]
+        )
+        return SpaceSaving.from_dict({"counters": [[row["product_id"], row["total"], 0] for row in ranked]}, self.capacity)
+
+    def persist(self) -> None:
+        """ Merges this process's pending counts into the shared snapshots and reloads them.
+
+        A snapshot that does not exist yet, as on the first load after deploy, starts from the exact counts in
+        the daily rollups, so the sketch ranks all past sales rather than only those made since.
+        """
+        with self._lock, transaction.atomic():
+            for name in self.SKETCHES:
+                snapshot, created = SketchSnapshot.objects.select_for_update().get_or_create(name=f"top_products:{name}", defaults={"data": {}})
+                if created:
+                    stored = self._seed(name)
+                    # The rollups already count the committed sales pending here.
+                    self._pending[name] = SpaceSaving(self.capacity)
+                else:
+                    stored = SpaceSaving.from_dict(snapshot.data, self.capacity)
+                if created or len(self._pending[name]):
+                    stored = stored.merge(self._pending[name])
+                    snapshot.data = stored.to_dict()
+                    snapshot.save(update_fields=["data", "updated_at"])
+                self._persisted[name] = stored
+                self._pending[name] = SpaceSaving(self.capacity)
+            self._merged.clear()
+            self._persisted_at = self._loaded_at = time.monotonic()
+
+    def reload(self) -> None:
+        """ Reads the shared snapshots without writing, starting a missing one from the daily rollups in memory only. """
+        with self._lock:
+            snapshots = dict(SketchSnapshot.objects.filter(name__in=[f"top_products:{name}" for name in self.SKETCHES]).values_list("name", "data"))
+            for name in self.SKETCHES:
+                data = snapshots.get(f"top_products:{name}")
+                if data is None:
+                    self._persisted[name] = self._seed(name)
+                    # As in persist, the rollups already count the committed sales pending here.
+                    self._pending[name] = SpaceSaving(self.capacity)
+                else:
+                    self._persisted[name] = SpaceSaving.from_dict(data, self.capacity)
+            self._merged.clear()
+            self._loaded_at = time.monotonic()
+
+    def replace(self, exact: dict[str, dict[int, int]]) -> None:
+        """ Overwrites the snapshots with exact counts, keeping the capacity largest of each. """
+        with self._lock, transaction.atomic():
+            for name in self.SKETCHES:
+                sketch = SpaceSaving.from_dict({"counters": [[item, count, 0] for item, count in exact[name].items()]}, self.capacity)
+                SketchSnapshot.objects.update_or_create(name=f"top_products:{name}", defaults={"data": sketch.to_dict()})
+            self.reset()
+
+    def top(self, name: str, n: int) -> list[tuple[int, int, int]] | None:
+        """ Returns the n top products of a sketch as (product_id, count, error), or None if it cannot answer exactly enough.
+
+        None means the sketch is empty or n exceeds its capacity, and the caller should compute the answer exactly.
+        """
+        if n > self.capacity:
+            return None
+        if self._due(self._loaded_at):
+            self.reload()
+        with self._lock:
+            merged = self._merged.get(name)
+            if merged is None:
+                merged = self._merged[name] = self._persisted[name].merge(self._pending[name])
+            return merged.top(n) if len(merged) else None
+
+
+top_products = TopProducts(
+    capacity=getattr(settings, "SHOP_TOP_PRODUCTS_CAPACITY", 1000),
+    persist_interval=getattr(settings, "SHOP_SKETCH_PERSIST_INTERVAL", 60),
+)
@@ -0,0 +1,29 @@
+from django.db import transaction
+
+from accounts.models import User as AccountUser, UserNotification
+
+from .jobs import task
+from .models import InventoryRecord, Order, Payment, Shipment
+
+
+@task()
+def process_order(order_id: int, payment_method: str = "cash") -> None:
+    """ Captures payment, opens the shipment, records the stock movements and notifies the buyer of a placed order. """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().select_related("user").filter(id=order_id).first()
+        # A redelivered job finds the payment of its earlier run, since all four writes commit together.
+        if order is None or Payment.objects.filter(order=order).exists():
+            return
+        Payment.objects.create(order=order, amount=order.total_price, payment_method=payment_method)
+        Shipment.objects.create(order=order, tracking_number=f"UG{order.id:010d}")
+        InventoryRecord.objects.bulk_create(
+            InventoryRecord(product_id=product_id, quantity_changed=-quantity, reason=f"Sold in order {order.id}")
+            for product_id, quantity in order.items.values_list("product_id", "quantity")
+        )
+        account = AccountUser.objects.filter(username=order.user.username).first()
+        if account is not None:
+            UserNotification.objects.create(
+                user=account,
+                notification_type="order_placed",
+                message=f"Your order #{order.id} of {order.total_price} UGX has been placed.",
+            )
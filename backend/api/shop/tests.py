@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import csv
+import io
+import itertools
+import json
+import os
+import tempfile
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User as AccountUser, UserNotification
+
+from .cache import AnalyticsCache, CatalogCache, LRUCache, catalog_cache
+from .exports import iter_order_export_rows, write_orders_npy
+from .facets import FacetIndex
+from .cart_store import CacheCartStore, _CacheLock
+from .jobs import TASKS, claim_jobs, enqueue, run_due_jobs
+from .money import percent_of, to_minor
+from .models import (
+    Cart, CartItem, Category, DailyCustomers, DailyProductSales, DailySales, InventoryRecord, Job, Order, OrderItem, Payment, Product,
+    ProductCategory, ProductImage, Review, Shipment, SketchSnapshot, StockReservation, Supplier, SupplierProduct, Till,
+)
+from .services import (
+    DAILY_PRODUCT_SALES_FIELDS, DAILY_SALES_FIELDS, UGX_DENOMS, add_item_to_cart, apply_discount_to_order, calculate_change,
+    calculate_change_batch, change_counts_to_dict, checkout_cart, count_unique_customers, create_order, create_review, delete_order,
+    get_average_items_per_order, get_average_order_value, get_average_order_value_within_date_range, get_catalog_categories,
+    get_catalog_product_page, get_most_ordered_products, get_product_rating_summary, iter_products, list_products_page,
+    get_revenue_time_series, get_top_selling_products, get_total_orders_count, get_total_products_sold, get_total_unique_customers, get_unique_customers_by_period, get_total_quantity_sold_of_product, get_total_revenue, get_total_revenue_within_date_range, give_change,
+    list_order_history_page, make_change, reap_inactive_carts, rebuild_sales_rollups, record_order_sales, release_cart_reservations, release_expired_reservations,
+    reserve_cart, upsert_catalog_batch, validate_ugx_amount, validate_ugx_amounts,
+)
+from .search import rebuild_search_index, search_products
+from .sketches import HyperLogLog, SpaceSaving, top_products
 
 # Create your tests here.
+class CartViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, size: int) -> None:
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", description="", price=1500, stock=10) for i in range(size)
+        )
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, product=product, quantity=2) for product in products)
+
+    def test_get_uses_one_query_regardless_of_cart_size(self):
+        for size in (1, 25):
+            CartItem.objects.all().delete()
+            self.fill_cart(size)
+            with self.assertNumQueries(1):
+                response = self.client.get("/shop/cart/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["items"]), size)
+            self.assertEqual(response.data["total_price"], 3000 * size)
+
+    def test_get_returns_line_totals(self):
+        self.fill_cart(1)
+        item = self.client.get("/shop/cart/").data["items"][0]
+        self.assertEqual(item["quantity"], 2)
+        self.assertEqual(item["line_total"], 3000)
+
+    def test_get_empty_cart(self):
+        response = self.client.get("/shop/cart/")
+        self.assertEqual(response.data, {"items": [], "total_price": 0})
+
+    def test_batch_uses_the_same_queries_regardless_of_batch_size(self):
+        products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1500, stock=10) for i in range(24))
+        for size in (3, 12):
+            CartItem.objects.all().delete()
+            CartItem.objects.bulk_create(CartItem(cart=self.cart, product=product, quantity=2) for product in products[:12])
+            # Adds update lines in the cart, sets create new ones and removes delete them.
+            operations = [
+                {"op": op, "product_id": products[i + 12 if op == "set" else i].id, "quantity": 1}
+                for i, op in zip(range(size), itertools.cycle(("add", "set", "remove")))
+            ]
+            with self.assertNumQueries(9):
+                response = self.client.post("/shop/cart/batch/", {"operations": operations}, format="json")
+            self.assertEqual(response.status_code, 200)
+            # Each set line replaces a removed one.
+            self.assertEqual(len(response.data["items"]), 12)
+
+    def test_batch_applies_every_operation(self):
+        products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1500, stock=10) for i in range(3))
+        CartItem.objects.create(cart=self.cart, product=products[0], quantity=2)
+        CartItem.objects.create(cart=self.cart, product=products[1], quantity=2)
+        operations = [
+            {"op": "add", "product_id": products[0].id, "quantity": 3},
+            {"op": "remove", "product_id": products[1].id},
+            {"op": "set", "product_id": products[2].id, "quantity": 4},
+        ]
+        response = self.client.post("/shop/cart/batch/", {"operations": operations}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(CartItem.objects.values_list("product_id", "quantity")), {products[0].id: 5, products[2].id: 4})
+
+    def test_batch_rejects_malformed_bodies(self):
+        product = Product.objects.create(name="Mug", description="", price=1500, stock=10)
+        for body in ([{"op": "add", "product_id": product.id, "quantity": 1}], {"operations": []}, {"operations": [{"op": "add", "product_id": 999, "quantity": 1}]}):
+            response = self.client.post("/shop/cart/batch/", body, format="json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("error", response.data)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CacheCartStoreTests(TestCase):
+    def setUp(self):
+        self.cache = LocMemCache(f"carts-{self.id()}", {})
+        self.store = CacheCartStore(cache=self.cache)
+        self.user = User.objects.create_user("shopper")
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000, stock=10) for i in range(3))
+
+    def lines(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list("product_id", "quantity"))
+
+    def test_writes_stay_in_the_cache_until_flushed(self):
+        self.assertEqual(self.store.add(self.cart, self.products[0].id, 2), 2)
+        self.assertEqual(self.store.add(self.cart, self.products[0].id, 1), 3)
+        self.store.set(self.cart, self.products[1].id, 4)
+        self.assertEqual(self.lines(), {})
+        self.assertEqual(self.store.flush_all(), 1)
+        self.assertEqual(self.lines(), {self.products[0].id: 3, self.products[1].id: 4})
+        self.assertEqual(self.store.flush_all(), 0)
+
+        self.store.remove(self.cart, self.products[0].id)
+        self.assertEqual(self.store.flush(self.cart), 1)
+        self.assertEqual(self.lines(), {self.products[1].id: 4})
+        # The background flush still finds the cart's log slot, but has nothing new to write.
+        self.store.flush_all()
+        self.assertEqual(self.lines(), {self.products[1].id: 4})
+
+    def test_discard_drops_only_the_checked_out_quantities(self):
+        self.store.add(self.cart, self.products[0].id, 2)
+        self.store.add(self.cart, self.products[1].id, 1)
+        self.store.discard(self.cart, {self.products[0].id: 2})
+        self.assertEqual(self.store.quantities(self.cart), {self.products[1].id: 1})
+        self.store.discard(self.cart, {self.products[1].id: 1})
+        self.assertEqual(self.store.quantities(self.cart), {})
+        self.store.flush_all()
+        self.assertEqual(self.lines(), {})
+
+    def test_an_add_during_checkout_survives_it(self):
+        self.store.add(self.cart, self.products[0].id, 2)
+        flush = self.store.flush
+
+        def flush_then_add(cart=None):
+            written = flush(cart)
+            # Another request adds to the cart after checkout flushed it, before the order commits.
+            self.store.add(self.cart, self.products[0].id, 1)
+            self.store.add(self.cart, self.products[1].id, 3)
+            return written
+
+        with mock.patch("shop.services.get_cart_store", return_value=self.store), mock.patch.object(self.store, "flush", side_effect=flush_then_add):
+            with self.captureOnCommitCallbacks(execute=True):
+                order = checkout_cart(self.user)
+        self.assertEqual(list(order.items.values_list("product_id", "quantity")), [(self.products[0].id, 2)])
+        self.assertEqual(self.store.quantities(self.cart), {self.products[0].id: 1, self.products[1].id: 3})
+        self.store.flush_all()
+        self.assertEqual(self.lines(), {self.products[0].id: 1, self.products[1].id: 3})
+
+    def test_checkout_writes_a_cart_whose_dirty_marker_expired(self):
+        self.store.add(self.cart, self.products[0].id, 2)
+        # The marker outlived DIRTY_MARKER_TTL before any flush ran.
+        self.cache.delete(f"cart:{self.cart.id}:dirty")
+        with mock.patch("shop.services.get_cart_store", return_value=self.store):
+            with self.captureOnCommitCallbacks(execute=True):
+                order = checkout_cart(self.user)
+        self.assertEqual(list(order.items.values_list("product_id", "quantity")), [(self.products[0].id, 2)])
+        self.assertEqual(self.store.quantities(self.cart), {})
+
+    def test_a_failed_flush_logs_the_carts_again(self):
+        self.store.add(self.cart, self.products[0].id, 2)
+        with mock.patch.object(CartItem.objects, "bulk_create", side_effect=OperationalError("disk full")):
+            with self.assertRaises(OperationalError):
+                self.store.flush_all()
+        self.assertEqual(self.store.flush_all(), 1)
+        self.assertEqual(self.lines(), {self.products[0].id: 2})
+
+    def test_a_lost_lock_is_not_released_and_its_write_is_refused(self):
+        lock = _CacheLock(self.cache, "cart:1:lock", 5)
+        lock.acquire()
+        # The lock expired and another caller took it.
+        self.cache.set(lock.key, "someone else", 5)
+        self.assertFalse(lock.held())
+        lock.release()
+        self.assertEqual(self.cache.get(lock.key), "someone else")
+        self.cache.delete(lock.key)
+
+        def fold_while_losing_the_lock(quantities, operations):
+            self.cache.set(f"cart:{self.cart.id}:lock", "someone else", 5)
+            return CacheCartStore.fold(quantities, operations)
+
+        with mock.patch.object(self.store, "fold", side_effect=fold_while_losing_the_lock):
+            with self.assertRaises(TimeoutError):
+                self.store.add(self.cart, self.products[0].id, 2)
+        self.assertEqual(self.store.quantities(self.cart), {})
+        self.assertEqual(self.cache.get(f"cart:{self.cart.id}:lock"), "someone else")
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_refuses_an_evicting_per_process_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheCartStore()
+
+
+class FacetIndexTests(TestCase):
+    def setUp(self):
+        # Two indexes sharing one version cache stand in for two worker processes.
+        self.shared = LocMemCache(f"facets-{self.id()}", {})
+        self.workers = [FacetIndex([0, 10000], cache=self.shared) for _ in range(2)]
+        self.product = Product.objects.create(name="Mug", description="", price=5000, stock=3)
+        for index in self.workers:
+            self.assertEqual(index.filter(in_stock=True)[0], {self.product.id})
+
+    def test_a_change_in_one_process_rebuilds_the_others(self):
+        first, second = self.workers
+        Product.objects.filter(id=self.product.id).update(stock=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.update_product(self.product.id, 5000, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(first.filter(in_stock=True)[0], set())
+        with self.assertNumQueries(2):
+            self.assertEqual(second.filter(in_stock=True)[0], set())
+        with self.assertNumQueries(0):
+            second.filter(in_stock=True)
+
+    def test_a_change_within_the_same_facets_is_not_published(self):
+        first, second = self.workers
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            first.update_product(self.product.id, 5000, 2)
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            second.filter(in_stock=True)
+
+    def test_a_fully_reserved_product_is_out_of_stock(self):
+        first, second = self.workers
+        cart = Cart.objects.create(user=User.objects.create_user("shopper"))
+        CartItem.objects.create(cart=cart, product=self.product, quantity=3)
+        with mock.patch("shop.services.facet_index", first):
+            with self.captureOnCommitCallbacks(execute=True):
+                reserve_cart(cart)
+            for index in self.workers:
+                self.assertEqual(index.filter(in_stock=True)[0], set())
+                self.assertEqual(index.filter(in_stock=False)[0], {self.product.id})
+
+            with self.captureOnCommitCallbacks(execute=True):
+                release_cart_reservations(cart)
+            for index in self.workers:
+                self.assertEqual(index.filter(in_stock=True)[0], {self.product.id})
+
+    def test_view_names_the_malformed_parameter(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("shopper"))
+        for params, message in [
+            ({"category": "kitchen"}, "Category ids must be integers"),
+            ({"min_price": "cheap"}, "'min_price' must be a whole UGX amount"),
+            ({"cursor": "next"}, "'cursor' must be an integer"),
+            ({"page_size": "ten"}, "'page_size' must be an integer"),
+        ]:
+            response = client.get("/shop/products/filter/", params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(message, response.data["error"])
+
+    def test_a_copy_older_than_the_ttl_is_rebuilt(self):
+        index = FacetIndex([0, 10000], ttl=60, cache=self.shared)
+        self.assertEqual(index.filter(min_price=6000)[0], set())
+        # A queryset update bypasses the signals, so only the TTL catches it.
+        Product.objects.update(price=8000)
+        self.assertEqual(index.filter(min_price=6000)[0], set())
+        with mock.patch("shop.facets.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(index.filter(min_price=6000)[0], {self.product.id})
+
+
+class CatalogCacheTests(TestCase):
+    def test_least_recently_used_entries_are_evicted_first(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["evictions"]), (2, 3, 1, 1))
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        now = time.monotonic()
+        with mock.patch("shop.cache.time.monotonic", return_value=now):
+            cache.set("a", 1)
+        with mock.patch("shop.cache.time.monotonic", return_value=now + 59):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("shop.cache.time.monotonic", return_value=now + 60):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_bumping_the_version_rebuilds_every_payload(self):
+        cache = CatalogCache(max_size=8, ttl=60)
+        builds = []
+
+        def build():
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual(cache.get_or_set("page", build), 1)
+        self.assertEqual(cache.get_or_set("page", build), 1)
+        cache.bump_version()
+        self.assertEqual(cache.get_or_set("page", build), 2)
+        self.assertEqual(cache.stats()["version"], 1)
+
+    def test_catalog_writes_invalidate_the_cached_listings(self):
+        catalog_cache.clear()
+        Category.objects.create(name="Kitchen", description="")
+        self.assertEqual([row["name"] for row in get_catalog_categories()], ["Kitchen"])
+        with self.assertNumQueries(0):
+            get_catalog_categories()
+        category = Category.objects.create(name="Garden", description="")
+        with self.assertNumQueries(1):
+            self.assertEqual([row["name"] for row in get_catalog_categories()], ["Kitchen", "Garden"])
+        category.delete()
+        self.assertEqual([row["name"] for row in get_catalog_categories()], ["Kitchen"])
+
+
+class ProductListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("shopper"))
+        self.products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000, stock=10) for i in range(7))
+        self.ids = [product.id for product in self.products]
+        catalog_cache.clear()
+
+    def test_cursors_walk_every_product_once_in_id_order(self):
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 3} if cursor is None else {"page_size": 3, "cursor": cursor}
+            response = self.client.get("/shop/products/", params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 3)
+            seen += [row["id"] for row in response.data["results"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.ids)
+
+    def test_a_full_last_page_has_no_next_cursor(self):
+        rows, cursor = list_products_page(after_id=self.ids[3], page_size=3)
+        self.assertEqual([row["id"] for row in rows], self.ids[4:])
+        self.assertIsNone(cursor)
+        self.assertEqual(list_products_page(after_id=self.ids[-1]), ([], None))
+
+    def test_malformed_cursors_and_page_sizes_are_rejected(self):
+        for params in ({"cursor": "abc"}, {"cursor": "1.5"}, {"page_size": "ten"}, {"page_size": 0}, {"page_size": -3}):
+            response = self.client.get("/shop/products/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.data)
+
+    @override_settings(SHOP_PRODUCT_PAGE_SIZE=2, SHOP_PRODUCT_MAX_PAGE_SIZE=5)
+    def test_page_size_defaults_and_is_capped(self):
+        response = self.client.get("/shop/products/")
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.get("/shop/products/", {"page_size": 1000})
+        self.assertEqual([row["id"] for row in response.data["results"]], self.ids[:5])
+        self.assertEqual(response.data["next_cursor"], self.ids[4])
+
+    def test_stream_returns_every_product_after_the_cursor(self):
+        response = self.client.get("/shop/products/", {"stream": "1", "cursor": self.ids[1]})
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["id"] for row in rows], self.ids[2:])
+        self.assertEqual([row["id"] for row in iter_products(after_id=self.ids[4], chunk_size=1)], self.ids[5:])
+        self.assertEqual([row["id"] for row in iter_products(chunk_size=2)], self.ids)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.mug = Product.objects.create(name="Enamel mug", description="Holds coffee", price=1000, stock=10)
+        self.jug = Product.objects.create(name="Water jug", description="Pairs with any mug", price=3000, stock=10)
+
+    def names(self, query, **kwargs) -> list[str]:
+        return [row["name"] for row in search_products(query, **kwargs)[0]]
+
+    def test_name_matches_outrank_description_matches(self):
+        self.assertEqual(self.names("mug"), ["Enamel mug", "Water jug"])
+        self.assertEqual(self.names("coffee"), ["Enamel mug"])
+
+    def test_terms_match_as_prefixes_and_stems_and_are_anded(self):
+        self.assertEqual(self.names("enam"), ["Enamel mug"])
+        self.assertEqual(self.names("mugs"), ["Enamel mug", "Water jug"])
+        self.assertEqual(self.names("water mug"), ["Water jug"])
+
+    def test_query_syntax_in_user_input_is_treated_as_text(self):
+        for query in ('mug" OR "jug', "NEAR(mug jug)", "mug*", "-mug", "*"):
+            search_products(query)
+        self.assertEqual(self.names('"; DROP TABLE shop_product; --'), [])
+        self.assertTrue(Product.objects.exists())
+
+    def test_saves_and_deletes_keep_the_index_current(self):
+        self.mug.name = "Enamel cup"
+        self.mug.save()
+        self.assertEqual(self.names("cup"), ["Enamel cup"])
+        self.assertEqual(self.names("enamel mug"), [])
+        self.jug.delete()
+        self.assertEqual(self.names("mug"), [])
+
+    def test_bulk_writes_are_found_after_a_rebuild(self):
+        Product.objects.bulk_create([Product(name="Teapot", description="", price=5000, stock=1)])
+        self.assertEqual(self.names("teapot"), [])
+        rebuild_search_index()
+        self.assertEqual(self.names("teapot"), ["Teapot"])
+
+    def test_pages_follow_relevance_order(self):
+        first, has_next = search_products("mug", page=1, page_size=1)
+        self.assertEqual(([row["id"] for row in first], has_next), ([self.mug.id], True))
+        second, has_next = search_products("mug", page=2, page_size=1)
+        self.assertEqual(([row["id"] for row in second], has_next), ([self.jug.id], False))
+
+    def test_view_requires_a_query_and_positive_pages(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("shopper"))
+        self.assertEqual(client.get("/shop/products/search/").status_code, 400)
+        self.assertEqual(client.get("/shop/products/search/", {"q": "mug", "page": 0}).status_code, 400)
+        response = client.get("/shop/products/search/", {"q": "mug", "page_size": 1})
+        self.assertEqual(([row["id"] for row in response.data["results"]], response.data["next_page"]), ([self.mug.id], 2))
+
+
+class CatalogImportTests(TestCase):
+    FEED = [
+        {"sku": "MUG-1", "name": "Mug", "price": "1500", "stock": "4", "categories": "Kitchen|Gifts", "images": "https://img.example/mug.png"},
+        {"sku": "JUG-1", "name": "Jug", "price": "3000", "stock": "2", "categories": "Kitchen"},
+        {"sku": "CUP-1", "name": "Cup", "price": "900", "stock": "0"},
+        {"sku": "MUG-1", "name": "Large mug", "price": "1800", "stock": "5", "categories": "Kitchen"},
+        {"sku": "POT-1", "name": "Teapot", "price": "5000", "stock": "1", "supply_price": "3500"},
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.feed = os.path.join(directory.name, "feed.jsonl")
+        self.checkpoint = os.path.join(directory.name, "feed.checkpoint")
+        with open(self.feed, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(row) + "\n" for row in self.FEED)
+        self.supplier = Supplier.objects.create(name="Potters", contact_email="sales@potters.example", phone_number="0700000000")
+
+    def run_import(self):
+        call_command(
+            "import_catalog", self.feed, "--batch-size", "2", "--checkpoint", self.checkpoint,
+            "--supplier", str(self.supplier.id), stdout=io.StringIO(),
+        )
+
+    def catalog(self) -> dict:
+        return {
+            sku: (name, price, stock, sorted(Category.objects.filter(productcategory__product__sku=sku).values_list("name", flat=True)))
+            for sku, name, price, stock in Product.objects.values_list("sku", "name", "price", "stock")
+        }
+
+    def test_import_upserts_by_sku_and_is_idempotent(self):
+        self.run_import()
+        expected = {
+            "MUG-1": ("Large mug", 1800, 5, ["Gifts", "Kitchen"]),
+            "JUG-1": ("Jug", 3000, 2, ["Kitchen"]),
+            "CUP-1": ("Cup", 900, 0, []),
+            "POT-1": ("Teapot", 5000, 1, []),
+        }
+        self.assertEqual(self.catalog(), expected)
+        self.assertEqual(SupplierProduct.objects.get().supply_price, 3500)
+        self.run_import()
+        self.assertEqual(self.catalog(), expected)
+        self.assertEqual((Category.objects.count(), ProductCategory.objects.count(), ProductImage.objects.count()), (2, 3, 1))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_a_second_feed_updates_rows_in_place(self):
+        self.run_import()
+        ids = dict(Product.objects.values_list("sku", "id"))
+        upsert_catalog_batch([{"sku": "JUG-1", "name": "Jug", "price": "3200", "stock": "7", "categories": ["Garden"]}], supplier=self.supplier)
+        upsert_catalog_batch([{"sku": "POT-1", "name": "Teapot", "price": "5000", "supply_price": "3300"}], supplier=self.supplier)
+        self.assertEqual(dict(Product.objects.values_list("sku", "id")), ids)
+        self.assertEqual(self.catalog()["JUG-1"], ("Jug", 3200, 7, ["Garden", "Kitchen"]))
+        self.assertEqual(SupplierProduct.objects.get().supply_price, 3300)
+
+    def test_an_interrupted_import_resumes_after_the_last_committed_batch(self):
+        upsert = upsert_catalog_batch
+        batches = []
+
+        def crash_on_second_batch(rows, supplier=None):
+            batches.append([row["sku"] for row in rows])
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+            return upsert(rows, supplier=supplier)
+
+        with mock.patch("shop.management.commands.import_catalog.upsert_catalog_batch", side_effect=crash_on_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import()
+        self.assertEqual(set(Product.objects.values_list("sku", flat=True)), {"MUG-1", "JUG-1"})
+        with open(self.checkpoint, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"path": self.feed, "rows": 2})
+
+        batches.clear()
+        with mock.patch("shop.management.commands.import_catalog.upsert_catalog_batch", side_effect=upsert) as resumed:
+            self.run_import()
+        self.assertEqual([[row["sku"] for row in call.args[0]] for call in resumed.call_args_list], [["CUP-1", "MUG-1"], ["POT-1"]])
+        self.assertEqual(self.catalog()["MUG-1"], ("Large mug", 1800, 5, ["Gifts", "Kitchen"]))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_a_bad_row_stops_the_import_at_its_batch(self):
+        with open(self.feed, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"sku": "BAD-1", "name": "Bad", "price": "n/a"}) + "\n")
+        with self.assertRaisesMessage(CommandError, "Batch starting at row 5 failed"):
+            self.run_import()
+        with open(self.checkpoint, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["rows"], 4)
+        self.assertFalse(Product.objects.filter(sku__in=["POT-1", "BAD-1"]).exists())
+
+    def test_a_malformed_json_line_stops_the_import_at_its_row(self):
+        with open(self.feed, "a", encoding="utf-8") as f:
+            f.write("\n" + '{"sku": "BAD-1", "name": ' + "\n")
+        with self.assertRaisesMessage(CommandError, "Row 6: invalid JSON"):
+            self.run_import()
+        with open(self.checkpoint, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["rows"], 4)
+        self.assertFalse(Product.objects.filter(sku="POT-1").exists())
+
+    def test_a_checkpoint_from_another_feed_is_refused(self):
+        with open(self.checkpoint, "w", encoding="utf-8") as f:
+            json.dump({"path": "other.jsonl", "rows": 3}, f)
+        with self.assertRaisesMessage(CommandError, "belongs to other.jsonl"):
+            self.run_import()
+        self.assertFalse(Product.objects.exists())
+
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        self.products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000, stock=10) for i in range(3))
+        self.users = [User.objects.create_user(f"reviewer{i}") for i in range(2)]
+        catalog_cache.clear()
+
+    def test_reviews_are_counted_moved_and_removed_in_the_aggregate(self):
+        product = self.products[0]
+        first = create_review(product, self.users[0], 5)
+        create_review(product, self.users[1], "3")
+        summary = get_product_rating_summary(product.id)
+        self.assertEqual((summary["count"], summary["average"]), (2, 4.0))
+        self.assertEqual(summary["histogram"], {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+        first.rating = 1
+        first.save()
+        summary = get_product_rating_summary(product.id)
+        self.assertEqual((summary["count"], summary["average"]), (2, 2.0))
+        self.assertEqual(summary["histogram"], {1: 1, 2: 0, 3: 1, 4: 0, 5: 0})
+
+        first.delete()
+        summary = get_product_rating_summary(product.id)
+        self.assertEqual((summary["count"], summary["average"]), (1, 3.0))
+        self.assertEqual(summary["histogram"], {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+        Review.objects.all().delete()
+        self.assertEqual(get_product_rating_summary(product.id)["count"], 0)
+        self.assertEqual(get_product_rating_summary(self.products[1].id), {"count": 0, "average": None, "histogram": {star: 0 for star in range(1, 6)}})
+
+    def test_out_of_range_ratings_are_rejected(self):
+        for rating in (0, 6, "five"):
+            with self.assertRaises(ValidationError):
+                create_review(self.products[0], self.users[0], rating)
+        self.assertFalse(Review.objects.exists())
+
+    def test_a_review_drops_only_the_cached_pages_listing_its_product(self):
+        first_page, cursor = get_catalog_product_page(page_size=2)
+        get_catalog_product_page(after_id=cursor, page_size=2)
+        get_catalog_categories()
+        version = catalog_cache.version
+        with self.captureOnCommitCallbacks(execute=True):
+            create_review(self.products[2], self.users[0], 4)
+        self.assertEqual(catalog_cache.version, version)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_product_page(page_size=2)[0], first_page)
+            get_catalog_categories()
+        with self.assertNumQueries(1):
+            [row] = get_catalog_product_page(after_id=cursor, page_size=2)[0]
+        self.assertEqual((row["id"], row["rating_count"], row["rating_average"]), (self.products[2].id, 1, 4.0))
+
+
+class AddItemToCartTests(TestCase):
+    def setUp(self):
+        self.cart = Cart.objects.create(user=User.objects.create_user("shopper"))
+        self.product = Product.objects.create(name="Mug", description="", price=1000, stock=10)
+
+    def test_new_line_takes_the_added_quantity(self):
+        self.assertEqual(add_item_to_cart(self.cart, self.product, 3).quantity, 3)
+
+    def test_existing_line_is_incremented_in_one_query(self):
+        add_item_to_cart(self.cart, self.product, 3)
+        with self.assertNumQueries(1):
+            item = add_item_to_cart(self.cart, self.product, 2)
+        self.assertEqual(item.quantity, 5)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper")
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, size: int, stock: int = 10) -> list[Product]:
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", description="", price=1500, stock=stock) for i in range(size)
+        )
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, product=product, quantity=2) for product in products)
+        return products
+
+    def test_checkout_creates_order_decrements_stock_and_empties_cart(self):
+        products = self.fill_cart(3)
+        order = checkout_cart(self.user)
+        self.assertEqual(order.total_price, 9000)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)), {8})
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.assertEqual(products[0].orderitem_set.get().price, 1500)
+
+    def test_query_count_is_constant_in_cart_size(self):
+        # The first order of the day also writes the customer into the day's sketch, so measure from the second.
+        self.fill_cart(1)
+        checkout_cart(self.user)
+        counts = []
+        for size in (1, 20):
+            self.fill_cart(size)
+            with CaptureQueriesContext(connection) as context:
+                checkout_cart(self.user)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_insufficient_stock_rolls_back(self):
+        products = self.fill_cart(2)
+        Product.objects.filter(id=products[1].id).update(stock=1)
+        with self.assertRaises(ValidationError):
+            checkout_cart(self.user)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(id=products[0].id).stock, 10)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Mug", description="", price=1500, stock=5)
+        self.carts = []
+        for name in ("first", "second"):
+            cart = Cart.objects.create(user=User.objects.create_user(name))
+            self.carts.append(cart)
+
+    def hold(self, cart, quantity: int):
+        CartItem.objects.update_or_create(cart=cart, product=self.product, defaults={"quantity": quantity})
+        return reserve_cart(cart)
+
+    def test_holds_are_counted_against_available_stock(self):
+        self.hold(self.carts[0], 4)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved, self.product.available), (5, 4, 1))
+        with self.assertRaises(ValidationError):
+            self.hold(self.carts[1], 2)
+        with self.assertRaises(ValidationError):
+            checkout_cart(self.carts[1].user)
+        self.assertEqual(Product.objects.get().reserved, 4)
+
+    def test_rereserving_resizes_the_hold(self):
+        self.hold(self.carts[0], 4)
+        self.hold(self.carts[0], 1)
+        self.assertEqual(Product.objects.get().reserved, 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+    def test_checkout_converts_hold_into_sale(self):
+        self.hold(self.carts[0], 5)
+        checkout_cart(self.carts[0].user)
+        product = Product.objects.get()
+        self.assertEqual((product.stock, product.reserved), (0, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_sweeper_releases_only_expired_holds(self):
+        self.hold(self.carts[0], 2)
+        self.hold(self.carts[1], 1)
+        StockReservation.objects.filter(cart=self.carts[0]).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(Product.objects.get().reserved, 1)
+
+    def test_starting_checkout_holds_the_cart_checkout_will_sell(self):
+        user = self.carts[0].user
+        Cart.objects.create(user=user)
+        CartItem.objects.create(cart=self.carts[0], product=self.product, quantity=2)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post("/shop/checkout/start/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StockReservation.objects.get().cart_id, Cart.objects.filter(user=user).first().id)
+        self.assertEqual(client.post("/shop/checkout/start/").status_code, 200)
+        self.assertEqual(Product.objects.get().reserved, 2)
+
+
+class ReapInactiveCartsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Mug", description="", price=1000, stock=10)
+        self.carts = [Cart.objects.create(user=User.objects.create_user(f"shopper{i}")) for i in range(3)]
+        for cart in self.carts:
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        self.cutoff = timezone.now() - timedelta(days=30)
+
+    def age(self, cart):
+        Cart.objects.filter(id=cart.id).update(updated_at=self.cutoff - timedelta(days=1))
+        cart.refresh_from_db()
+
+    def test_deletes_only_expired_carts_in_batches_and_releases_their_holds(self):
+        reserve_cart(self.carts[0])
+        reserve_cart(self.carts[2])
+        self.age(self.carts[0])
+        self.age(self.carts[1])
+        result = reap_inactive_carts(self.cutoff, batch_size=1, pause=0)
+        self.assertEqual((result["carts"], result["items"]), (2, 2))
+        self.assertEqual(list(Cart.objects.values_list("id", flat=True)), [self.carts[2].id])
+        self.assertEqual(list(CartItem.objects.values_list("cart_id", flat=True)), [self.carts[2].id])
+        self.assertEqual(Product.objects.get().reserved, 1)
+        self.assertEqual(reap_inactive_carts(self.cutoff, pause=0)["carts"], 0)
+
+    def test_adding_to_an_idle_cart_keeps_it_alive(self):
+        self.age(self.carts[0])
+        with self.assertNumQueries(4):
+            # Savepoint, upsert, activity write, release.
+            add_item_to_cart(self.carts[0], self.product, 1)
+        self.assertEqual(reap_inactive_carts(self.cutoff, pause=0)["carts"], 0)
+        self.assertEqual(CartItem.objects.get(cart=self.carts[0]).quantity, 2)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper")
+        self.account = AccountUser.objects.create(username="shopper", email="shopper@example.com")
+        cart = Cart.objects.create(user=self.user)
+        self.product = Product.objects.create(name="Mug", description="", price=1500, stock=5)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+
+    def test_checkout_enqueues_order_processing(self):
+        order = checkout_cart(self.user, payment_method="mobile money")
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(run_due_jobs(), 1)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(Payment.objects.get(order=order).payment_method, "mobile money")
+        self.assertEqual(Shipment.objects.filter(order=order).count(), 1)
+        self.assertEqual(InventoryRecord.objects.get(product=self.product).quantity_changed, -2)
+        self.assertEqual(UserNotification.objects.filter(user=self.account).count(), 1)
+
+    def test_redelivery_does_not_repeat_side_effects(self):
+        order = checkout_cart(self.user)
+        run_due_jobs()
+        Job.objects.update(status=Job.QUEUED)
+        run_due_jobs()
+        self.assertEqual(Payment.objects.filter(order=order).count(), 1)
+        self.assertEqual(InventoryRecord.objects.count(), 1)
+
+    def test_failures_back_off_then_give_up(self):
+        calls = []
+        TASKS["flaky"] = (lambda: calls.append(1) or 1 / 0, 2)
+        self.addCleanup(TASKS.pop, "flaky")
+        job = enqueue("flaky")
+        run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(run_due_jobs(), 0)
+
+        Job.objects.update(run_at=timezone.now())
+        run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, len(calls)), (Job.FAILED, 2, 2))
+        self.assertIn("ZeroDivisionError", job.last_error)
+
+    def test_job_of_a_dead_worker_is_redelivered_after_visibility_timeout(self):
+        checkout_cart(self.user)
+        [job] = claim_jobs(10)
+        self.assertEqual(claim_jobs(10), [])
+        Job.objects.update(locked_until=timezone.now())
+        [job] = claim_jobs(10)
+        self.assertEqual(job.attempts, 2)
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", description="", price=1500, stock=10) for i in range(3)
+        )
+
+    def place_orders(self, count: int, created_at=None):
+        orders = Order.objects.bulk_create(Order(user=self.user, total_price=4500) for _ in range(count))
+        if created_at is not None:
+            Order.objects.filter(id__in=[order.id for order in orders]).update(created_at=created_at)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=product.price) for order in orders for product in self.products
+        )
+
+    def test_page_costs_two_queries_with_items_attached(self):
+        self.place_orders(12)
+        with self.assertNumQueries(2):
+            orders, next_cursor = list_order_history_page(self.user.id, page_size=10)
+        self.assertEqual(len(orders), 10)
+        self.assertEqual([item["name"] for item in orders[0]["items"]], ["Product 0", "Product 1", "Product 2"])
+        self.assertIsNotNone(next_cursor)
+
+    def test_cursor_walks_orders_sharing_a_timestamp_exactly_once(self):
+        self.place_orders(5, created_at=timezone.now())
+        self.place_orders(2)
+        seen, cursor = [], None
+        while True:
+            response = self.client.get("/shop/orders/", {"page_size": 2, "cursor": cursor or ""})
+            seen += [order["id"] for order in response.data["results"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                break
+        expected = list(Order.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_is_rejected(self):
+        response = self.client.get("/shop/orders/", {"cursor": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+
+class MoneyTests(TestCase):
+    def test_amounts_convert_to_whole_minor_units(self):
+        self.assertEqual(to_minor("1500.00"), 1500)
+        self.assertEqual(to_minor(Decimal("2000")), 2000)
+        for value in ("1500.50", "abc", "NaN", None):
+            with self.assertRaises(ValidationError):
+                to_minor(value)
+
+    def test_discount_is_exact_integer_math(self):
+        order = Order.objects.create(user=User.objects.create_user("shopper"), total_price="10005")
+        self.assertEqual(apply_discount_to_order(order, Decimal("12.5")), 8754)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 8754)
+        with self.assertRaises(ValidationError):
+            apply_discount_to_order(order, 101)
+
+    def test_percentages_keep_their_full_precision_until_rounding(self):
+        self.assertEqual(percent_of(10000, "12.345"), 1235)
+        self.assertEqual(percent_of(10000, Decimal("12.3449")), 1234)
+        self.assertEqual(percent_of(3, "33.333"), 1)
+        self.assertEqual(percent_of(1, 50), 1)
+
+    def test_fractional_price_is_rejected_on_save(self):
+        with self.assertRaises(ValidationError):
+            Product.objects.create(name="Mug", description="", price=Decimal("999.99"), stock=1)
+
+
+class CashBatchTests(SimpleTestCase):
+    def test_batch_functions_match_scalar_versions(self):
+        rng = random.Random(0)
+        amounts = [rng.choice([-100, 0, 50, 150, 100]) + rng.randrange(0, 500000, 50) for _ in range(2000)]
+        valid = validate_ugx_amounts(amounts)
+        for amount, is_valid in zip(amounts, valid):
+            try:
+                validate_ugx_amount(amount)
+                expected = True
+            except ValidationError:
+                expected = False
+            self.assertEqual(bool(is_valid), expected, amount)
+
+        costs = [rng.randrange(0, 300000, 50) for _ in range(2000)]
+        paid = [cost + rng.randrange(0, 200000, 50) for cost in costs]
+        counts = calculate_change_batch(paid, costs)
+        for row, amount_paid, total_cost in zip(counts, paid, costs):
+            self.assertEqual(change_counts_to_dict(row), calculate_change(amount_paid, total_cost))
+
+    def test_short_payment_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            calculate_change_batch([1000, 500], [1000, 1000])
+
+
+class TillChangeTests(TestCase):
+    def brute_force(self, amount, till):
+        best = None
+        denoms = sorted(till)
+        for counts in itertools.product(*(range(till[denom] + 1) for denom in denoms)):
+            if sum(denom * count for denom, count in zip(denoms, counts)) == amount:
+                if best is None or sum(counts) < best:
+                    best = sum(counts)
+        return best
+
+    def test_uses_other_notes_when_greedy_would_run_out(self):
+        till = {5000: 1, 2000: 3, 500: 1}
+        self.assertEqual(make_change(6000, till), {2000: 3})
+        self.assertIsNone(make_change(1500, {1000: 2}))
+
+    def test_amount_beyond_the_till_is_refused_without_allocating(self):
+        self.assertIsNone(make_change(10 ** 12, {50000: 1}))
+        self.assertEqual(make_change(50000, {50000: 1}), {50000: 1})
+
+    def test_solutions_are_minimal_and_within_the_till(self):
+        rng = random.Random(1)
+        for _ in range(150):
+            till = {denom: rng.randint(0, 3) for denom in rng.sample(UGX_DENOMS, 4)}
+            amount = rng.randrange(0, 60000, 100)
+            change = make_change(amount, till)
+            expected = self.brute_force(amount, till)
+            if expected is None:
+                self.assertIsNone(change)
+            else:
+                self.assertEqual(sum(denom * count for denom, count in change.items()), amount)
+                self.assertEqual(sum(change.values()), expected)
+                self.assertTrue(all(count <= till[denom] for denom, count in change.items()))
+
+    def test_give_change_takes_notes_out_of_the_till(self):
+        till = Till.objects.create(name="Counter 1", notes={"2000": 3, "500": 2})
+        change = give_change(till.id, 20000, 14000, tendered={"20000": 1})
+        self.assertEqual(change, {2000: 3})
+        till.refresh_from_db()
+        self.assertEqual(till.counts(), {20000: 1, 500: 2})
+        with self.assertRaises(ValidationError):
+            give_change(till.id, 20000, 18500)
+        till.refresh_from_db()
+        self.assertEqual(till.counts(), {20000: 1, 500: 2})
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper")
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", description="", price=1000 * (i + 1), stock=1000) for i in range(4)
+        )
+        # Three checkouts a day, eight hours apart, over five days.
+        self.start = timezone.make_aware(datetime(2026, 3, 1, 2))
+        rng = random.Random(2)
+        for index in range(15):
+            for product in rng.sample(self.products, rng.randint(1, 3)):
+                CartItem.objects.create(cart=self.cart, product=product, quantity=rng.randint(1, 4))
+            order = checkout_cart(self.user)
+            Order.objects.filter(id=order.id).update(created_at=self.start + timedelta(hours=8 * index))
+        # Move the rollups to the backdated days as a backfill would.
+        rebuild_sales_rollups()
+
+    def rollup_rows(self):
+        return (
+            list(DailySales.objects.order_by("date").values_list("date", *DAILY_SALES_FIELDS)),
+            list(DailyProductSales.objects.order_by("date", "product_id").values_list("date", "product_id", *DAILY_PRODUCT_SALES_FIELDS)),
+        )
+
+    def test_checkout_increments_match_a_rebuild(self):
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        Order.objects.update(created_at=timezone.now())
+        for order in Order.objects.all():
+            lines = {product_id: (quantity, price) for product_id, quantity, price in order.items.values_list("product_id", "quantity", "price")}
+            record_order_sales(order, lines)
+        incremental = self.rollup_rows()
+        rebuild_sales_rollups()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_totals_match_the_order_tables(self):
+        orders = list(Order.objects.all())
+        self.assertEqual(get_total_revenue(), sum(order.total_price for order in orders))
+        self.assertEqual(get_total_orders_count(), len(orders))
+        self.assertAlmostEqual(get_average_order_value(), sum(order.total_price for order in orders) / len(orders))
+        self.assertAlmostEqual(get_average_items_per_order(), OrderItem.objects.count() / len(orders))
+        self.assertEqual(get_total_products_sold(), sum(OrderItem.objects.values_list("quantity", flat=True)))
+        product = self.products[0]
+        self.assertEqual(get_total_quantity_sold_of_product(product.id), sum(OrderItem.objects.filter(product=product).values_list("quantity", flat=True)))
+
+    def test_date_ranges_are_exact_on_partial_edge_days(self):
+        bounds = [
+            (self.start, self.start + timedelta(days=4)),
+            (self.start + timedelta(hours=5), self.start + timedelta(days=2, hours=7)),
+            (self.start - timedelta(hours=2), self.start + timedelta(days=2, hours=22) - timedelta(microseconds=1)),
+            (date(2026, 3, 2), date(2026, 3, 4)),
+            (self.start + timedelta(hours=1), self.start + timedelta(hours=3)),
+        ]
+        for start, end in bounds:
+            # Dates bound the range at local midnight, as they would in a created_at__range lookup.
+            aware = [value if isinstance(value, datetime) else timezone.make_aware(datetime.combine(value, datetime.min.time())) for value in (start, end)]
+            orders = Order.objects.filter(created_at__range=aware)
+            expected = sum(orders.values_list("total_price", flat=True))
+            self.assertEqual(get_total_revenue_within_date_range(start, end), expected, (start, end))
+            count = orders.count()
+            self.assertAlmostEqual(get_average_order_value_within_date_range(start, end), expected / count if count else 0.0)
+
+    def test_orm_edits_and_cascades_keep_the_rollups_exact(self):
+        order = Order.objects.order_by("id").first()
+        extra = OrderItem.objects.create(order=order, product=self.products[3], quantity=2, price=4000)
+        extra.quantity = 5
+        extra.save()
+        order.items.exclude(pk=extra.pk).first().delete()
+        order.total_price = 1234
+        order.save()
+        other = User.objects.create_user("other")
+        Order.objects.filter(id=create_order(other, 9000).id).update(created_at=self.start)
+        rebuild_sales_rollups()
+        create_order(other, 3000)
+        other.delete()
+
+        def nonzero(rows):
+            # Incremental upkeep leaves all-zero rows for days whose orders were all deleted; a rebuild drops them.
+            return tuple([row for row in table if any(row[-3:])] for table in rows)
+
+        maintained = nonzero(self.rollup_rows())
+        rebuild_sales_rollups()
+        self.assertEqual(nonzero(self.rollup_rows()), maintained)
+
+    def test_discount_and_deletion_update_the_rollups(self):
+        order = Order.objects.order_by("id").first()
+        revenue = get_total_revenue()
+        old_total = order.total_price
+        apply_discount_to_order(order, 10)
+        self.assertEqual(get_total_revenue(), revenue - (old_total - order.total_price))
+        delete_order(order.id)
+        self.assertEqual(get_total_revenue(), sum(Order.objects.values_list("total_price", flat=True)))
+        self.assertEqual(get_total_orders_count(), 14)
+
+
+class TopProductsSketchTests(TestCase):
+    def test_space_saving_finds_heavy_hitters_within_error_bounds(self):
+        rng = random.Random(3)
+        stream = [rng.choice(range(10)) if rng.random() < 0.6 else rng.randrange(10, 5000) for _ in range(20000)]
+        sketch = SpaceSaving(100)
+        for item in stream:
+            sketch.add(item)
+        exact = Counter(stream)
+        self.assertEqual({item for item, _, _ in sketch.top(10)}, set(range(10)))
+        for item, count, error in sketch.top(50):
+            self.assertTrue(count - error <= exact[item] <= count)
+
+    def test_merged_sketches_keep_their_bounds(self):
+        rng = random.Random(4)
+        streams = [[int(rng.paretovariate(1.2)) for _ in range(5000)] for _ in range(2)]
+        sketches = [SpaceSaving(50), SpaceSaving(50)]
+        for sketch, stream in zip(sketches, streams):
+            for item in stream:
+                sketch.add(item)
+        merged = SpaceSaving.from_dict(sketches[0].to_dict()).merge(sketches[1])
+        exact = Counter(streams[0] + streams[1])
+        for item, count, error in merged.top(50):
+            self.assertTrue(count - error <= exact[item] <= count)
+
+    def test_top_selling_products_answer_from_the_persisted_sketch(self):
+        self.addCleanup(top_products.reset)
+        products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000, stock=10) for i in range(3))
+        top_products.reset()
+        top_products.persist()
+        top_products.record({products[0].id: 5, products[1].id: 1})
+        top_products.record({products[1].id: 1})
+        top_products.persist()
+        top_products.reset()
+        self.assertEqual(get_top_selling_products(2), [(products[0].id, "Product 0", 5), (products[1].id, "Product 1", 2)])
+        self.assertEqual(get_most_ordered_products(1), [(products[1].id, "Product 1", 2)])
+
+    def test_a_missing_snapshot_is_seeded_from_the_rollups(self):
+        self.addCleanup(top_products.reset)
+        user = User.objects.create_user("shopper")
+        cart = Cart.objects.create(user=user)
+        products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000, stock=10) for i in range(3))
+        for product, quantity in ((products[2], 4), (products[1], 2)):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+            checkout_cart(user)
+        top_products.reset()
+        self.assertFalse(SketchSnapshot.objects.exists())
+        # The first checkout after deploy seeds the snapshot from the rollups, which already count it.
+        CartItem.objects.create(cart=cart, product=products[0], quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout_cart(user)
+        self.assertTrue(SketchSnapshot.objects.filter(name="top_products:quantity").exists())
+        self.assertEqual(
+            get_top_selling_products.uncached(3),
+            [(products[2].id, "Product 2", 4), (products[1].id, "Product 1", 2), (products[0].id, "Product 0", 1)],
+        )
+
+    def test_reads_write_nothing_even_before_a_snapshot_exists(self):
+        self.addCleanup(top_products.reset)
+        user = User.objects.create_user("shopper")
+        cart = Cart.objects.create(user=user)
+        products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000, stock=10) for i in range(2))
+        for product, quantity in ((products[1], 4), (products[0], 2)):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+            checkout_cart(user)
+        top_products.reset()
+        with CaptureQueriesContext(connection) as queries:
+            ranked = top_products.top("quantity", 2)
+        self.assertEqual([(item, count) for item, count, _ in ranked], [(products[1].id, 4), (products[0].id, 2)])
+        self.assertEqual([query["sql"] for query in queries.captured_queries if not query["sql"].startswith("SELECT")], [])
+        self.assertFalse(SketchSnapshot.objects.exists())
+
+
+class UniqueCustomerSketchTests(TestCase):
+    def test_hyperloglog_estimates_and_merges_within_its_error(self):
+        sketches = [HyperLogLog(12), HyperLogLog(12)]
+        for user_id in range(60000):
+            sketches[0].add(user_id)
+        for user_id in range(40000, 100000):
+            sketches[1].add(user_id)
+        self.assertAlmostEqual(sketches[0].count(), 60000, delta=60000 * 0.05)
+        merged = HyperLogLog.from_bytes(sketches[0].to_bytes()).merge(sketches[1])
+        self.assertAlmostEqual(merged.count(), 100000, delta=100000 * 0.05)
+        self.assertAlmostEqual(HyperLogLog.union(sketches).count(), merged.count())
+        with self.assertRaises(ValueError):
+            merged.merge(HyperLogLog(10))
+
+    def test_daily_sketches_match_exact_counts_by_period(self):
+        users = [User.objects.create_user(f"customer{i}") for i in range(30)]
+        start = date(2026, 2, 20)
+        rng = random.Random(5)
+        for offset in range(20):
+            for user in rng.sample(users, rng.randint(1, 12)):
+                order = create_order(user, 1000)
+                created_at = timezone.make_aware(datetime.combine(start + timedelta(days=offset), datetime.min.time()) + timedelta(hours=12))
+                Order.objects.filter(id=order.id).update(created_at=created_at)
+        rebuild_sales_rollups()
+
+        end = start + timedelta(days=19)
+        for period in ("day", "week", "month"):
+            estimated = get_unique_customers_by_period(period, start, end)
+            exact = get_unique_customers_by_period(period, start, end, exact=True)
+            self.assertEqual([day for day, _ in estimated], [day for day, _ in exact])
+            for (_, estimate), (_, count) in zip(estimated, exact):
+                self.assertAlmostEqual(estimate, count, delta=1)
+        self.assertEqual(get_total_unique_customers(exact=True), Order.objects.values("user_id").distinct().count())
+        self.assertAlmostEqual(get_total_unique_customers(), get_total_unique_customers(exact=True), delta=1)
+        self.assertAlmostEqual(count_unique_customers(start + timedelta(days=3), start + timedelta(days=9)),
+                               count_unique_customers(start + timedelta(days=3), start + timedelta(days=9), exact=True), delta=1)
+
+    def test_orders_update_the_sketch_as_a_rebuild_would(self):
+        users = [User.objects.create_user(f"customer{i}") for i in range(5)]
+        for user in users + users[:2]:
+            create_order(user, 1000)
+        incremental = list(DailyCustomers.objects.values_list("date", "registers"))
+        rebuild_sales_rollups()
+        self.assertEqual([(day, bytes(registers)) for day, registers in DailyCustomers.objects.values_list("date", "registers")],
+                         [(day, bytes(registers)) for day, registers in incremental])
+        self.assertEqual(get_total_unique_customers(), 5)
+
+
+class AnalyticsCacheTests(TestCase):
+    def test_results_are_reused_until_an_order_is_written(self):
+        user = User.objects.create_user("shopper")
+        create_order(user, 5000)
+        self.assertEqual(get_total_revenue(), 5000)
+        # A write that bypasses the order tables is not seen until an order write invalidates the cache.
+        DailySales.objects.update(revenue=0)
+        self.assertEqual(get_total_revenue(), 5000)
+        create_order(user, 2000)
+        self.assertEqual(get_total_revenue(), 2000)
+        self.assertEqual(get_total_revenue.uncached(), 2000)
+
+    def test_a_read_racing_the_checkout_commit_does_not_hide_the_sale(self):
+        user = User.objects.create_user("shopper")
+        product = Product.objects.create(name="Mug", description="", price=1000, stock=10)
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=3)
+        other = Product.objects.create(name="Bowl", description="", price=1000, stock=10)
+        top_products.reset()
+        top_products.persist()
+        top_products.record({other.id: 1})
+        self.assertEqual(get_top_selling_products(1), [(other.id, "Bowl", 1)])
+        record = top_products.record
+
+        def read_then_record(lines):
+            # Another request reads after the order write's commit-time bump, before the sketch has the sale.
+            get_top_selling_products(1)
+            record(lines)
+
+        with mock.patch.object(top_products, "record", side_effect=read_then_record):
+            with self.captureOnCommitCallbacks(execute=True):
+                checkout_cart(user)
+        self.assertEqual(get_top_selling_products(1), [(product.id, "Mug", 3)])
+
+    def test_concurrent_misses_share_one_build(self):
+        cache = AnalyticsCache(max_size=8, ttl=60)
+        builds = []
+
+        @cache.memoize
+        def slow_total(day):
+            builds.append(day)
+            time.sleep(0.2)
+            return 42
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(slow_total, [date(2026, 3, 1)] * 8))
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(builds, [date(2026, 3, 1)])
+        self.assertGreater(cache.stats()["collapsed"], 0)
+        cache.bump_version()
+        slow_total(date(2026, 3, 1))
+        self.assertEqual(len(builds), 2)
+
+    def test_failed_build_lets_a_waiter_retry(self):
+        cache = AnalyticsCache(max_size=8, ttl=60)
+        with self.assertRaises(ZeroDivisionError):
+            cache.get_or_set("ratio", lambda: 1 / 0)
+        self.assertEqual(cache.get_or_set("ratio", lambda: 0.5), 0.5)
+
+
+class RevenueTimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper")
+        # Orders on March 2nd (two), 3rd and 6th, leaving the 4th and 5th empty.
+        for day, hour, total in ((2, 9, 1000), (2, 15, 3000), (3, 11, 5000), (6, 23, 7000)):
+            order = create_order(self.user, total)
+            Order.objects.filter(id=order.id).update(created_at=timezone.make_aware(datetime(2026, 3, day, hour, 30)))
+        rebuild_sales_rollups()
+
+    def test_daily_series_fills_gaps_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            series = get_revenue_time_series.uncached(date(2026, 3, 1), date(2026, 3, 7))
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(
+            [(row["period"].date(), row["revenue"], row["orders"], row["average_order_value"]) for row in series],
+            [
+                (date(2026, 3, 1), 0, 0, 0.0), (date(2026, 3, 2), 4000, 2, 2000.0), (date(2026, 3, 3), 5000, 1, 5000.0),
+                (date(2026, 3, 4), 0, 0, 0.0), (date(2026, 3, 5), 0, 0, 0.0), (date(2026, 3, 6), 7000, 1, 7000.0),
+                (date(2026, 3, 7), 0, 0, 0.0),
+            ],
+        )
+
+    def test_hourly_and_weekly_series_match_the_range_totals(self):
+        start = timezone.make_aware(datetime(2026, 3, 2, 8))
+        end = timezone.make_aware(datetime(2026, 3, 2, 16))
+        hours = get_revenue_time_series(start, end, "hour")
+        self.assertEqual(len(hours), 8)
+        self.assertEqual([row["revenue"] for row in hours if row["orders"]], [1000, 3000])
+        weeks = get_revenue_time_series(date(2026, 3, 1), date(2026, 3, 8), "week")
+        # March 1st 2026 is a Sunday, so the range touches two weeks starting on Mondays.
+        self.assertEqual([(row["period"].date(), row["orders"]) for row in weeks], [(date(2026, 2, 23), 0), (date(2026, 3, 2), 4)])
+        self.assertEqual(sum(row["revenue"] for row in weeks), get_total_revenue_within_date_range(date(2026, 3, 1), date(2026, 3, 9)))
+
+    def test_endpoint_validates_its_parameters(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("finance", is_staff=True))
+        response = client.get("/shop/analytics/revenue/", {"start": "2026-03-02", "end": "2026-03-03"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["revenue"] for row in response.data["results"]], [4000, 5000])
+        self.assertEqual(client.get("/shop/analytics/revenue/", {"start": "2026-03-02", "end": "2026-03-03", "interval": "year"}).status_code, 400)
+        self.assertEqual(client.get("/shop/analytics/revenue/", {"start": "2026-03-02"}).status_code, 400)
+        self.assertEqual(client.get("/shop/analytics/revenue/", {"start": "2020-01-01", "end": "2026-01-01", "interval": "hour"}).status_code, 400)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper")
+        cart = Cart.objects.create(user=self.user)
+        products = Product.objects.bulk_create(Product(name=f"Product {i}", description="", price=1000 * (i + 1), stock=50) for i in range(3))
+        for lines in ((0, 1), (2,)):
+            for index in lines:
+                CartItem.objects.create(cart=cart, product=products[index], quantity=index + 1)
+            checkout_cart(self.user, payment_method="mobile_money")
+        run_due_jobs()
+        self.bare_order = create_order(self.user, 700)
+
+    def test_endpoint_streams_one_csv_row_per_order_line(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("finance", is_staff=True))
+        response = client.get("/shop/orders/export/", {"start": timezone.localdate().isoformat()})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), OrderItem.objects.count() + 1)
+        paid = [row for row in rows if row["payment_method"]]
+        self.assertEqual({row["payment_method"] for row in paid}, {"mobile_money"})
+        self.assertTrue(all(row["paid"] == row["total_price"] for row in paid))
+        bare = [row for row in rows if row["order_id"] == str(self.bare_order.id)]
+        self.assertEqual([(row["item_id"], row["paid"]) for row in bare], [("", "")])
+
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/shop/orders/export/").status_code, 403)
+
+    def test_npy_export_is_written_in_chunks_and_loads_back(self):
+        with tempfile.TemporaryFile() as file:
+            count = write_orders_npy(file, iter_order_export_rows(chunk_size=2), chunk_size=2)
+            file.seek(0)
+            exported = np.load(file)
+        self.assertEqual(count, OrderItem.objects.count() + 1)
+        self.assertEqual(len(exported), count)
+        self.assertEqual(list(exported["order_id"]), sorted(exported["order_id"]))
+        self.assertEqual(int(exported["quantity"].clip(min=0).sum()), sum(OrderItem.objects.values_list("quantity", flat=True)))
+        bare = exported[exported["order_id"] == self.bare_order.id][0]
+        self.assertEqual((bare["item_id"], bare["payment_method"]), (-1, ""))
+        self.assertTrue(np.isnat(bare["paid_at"]))
+
+
+class IdempotentCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("shopper", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.product = Product.objects.create(name="Mug", description="", price=1500, stock=10)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+
+    def test_retry_replays_first_response(self):
+        first = self.client.post("/shop/checkout/", HTTP_IDEMPOTENCY_KEY="abc")
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        retry = self.client.post("/shop/checkout/", HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get().stock, 8)
+
+    def test_an_error_response_releases_the_key(self):
+        CartItem.objects.all().delete()
+        failed = self.client.post("/shop/checkout/", HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(failed.status_code, 400)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        retry = self.client.post("/shop/checkout/", HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", retry)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.client.post("/shop/checkout/", HTTP_IDEMPOTENCY_KEY="abc")["Idempotent-Replayed"], "true")
+
+    def test_key_reused_on_another_endpoint_is_rejected(self):
+        self.client.post("/shop/checkout/", HTTP_IDEMPOTENCY_KEY="abc")
+        response = self.client.post("/shop/orders/", HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(response.status_code, 422)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.client.post("/shop/checkout/")
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.client.post("/shop/checkout/")
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class ConcurrentAddItemToCartTests(TransactionTestCase):
+    def test_parallel_adds_do_not_lose_updates(self):
+        cart = Cart.objects.create(user=User.objects.create_user("shopper"))
+        product = Product.objects.create(name="Mug", description="", price=1000, stock=10)
+        adds = 40
+
+        def add_one(_):
+            # The in-memory SQLite test database uses a shared cache, whose table locks fail at once instead of
+            # waiting out a busy timeout. An add that hit one rolled back and applied nothing, so it is retried.
+            try:
+                for attempt in itertools.count():
+                    try:
+                        return add_item_to_cart(cart, product, 1)
+                    except OperationalError as e:
+                        if "locked" not in str(e) or attempt == 100:
+                            raise
+                        time.sleep(0.005)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(add_one, range(adds)))
+
+        self.assertEqual(CartItem.objects.count(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, adds)
@@ -1,12 +1,21 @@
 from django.urls import path
-from .views import ProductListView, CartView, CheckoutView, OrderView, CategoryListView, ReviewView
+from .views import ProductListView, ProductSearchView, ProductFilterView, CartView, CartBatchView, CheckoutView, CheckoutStartView, OrderView, CategoryListView, ReviewView, TillChangeView, CatalogCacheStatsView, AnalyticsCacheStatsView, OrderExportView, RevenueTimeSeriesView
 
 urlpatterns = [
     # Define your shop-related URL patterns here
     path('products/', ProductListView.as_view(), name='product-list'),
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
+    path('products/filter/', ProductFilterView.as_view(), name='product-filter'),
     path('cart/', CartView.as_view(), name='cart'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
     path('checkout/', CheckoutView.as_view(), name='checkout'),
+    path('checkout/start/', CheckoutStartView.as_view(), name='checkout-start'),
     path('orders/', OrderView.as_view(), name='orders'),
+    path('orders/export/', OrderExportView.as_view(), name='orders-export'),
     path('categories/', CategoryListView.as_view(), name='categories'),
     path('reviews/', ReviewView.as_view(), name='reviews'),
+    path('tills/<int:till_id>/change/', TillChangeView.as_view(), name='till-change'),
+    path('catalog/cache/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
+    path('analytics/revenue/', RevenueTimeSeriesView.as_view(), name='analytics-revenue'),
+    path('analytics/cache/', AnalyticsCacheStatsView.as_view(), name='analytics-cache-stats'),
 ]
\ No newline at end of file
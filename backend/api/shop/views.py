@@ -1,10 +1,63 @@
+from datetime import date
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Product, Cart, Till
+from .cache import analytics_cache, catalog_cache
+from .exports import iter_order_export_rows, iter_orders_csv
+from .idempotency import idempotent
+from .money import to_minor
+from .search import search_products
+from .services import (
+    add_item_to_cart, apply_cart_operations, checkout_cart, create_review, filter_products, get_cart_store, get_cart_summary,
+    get_catalog_categories, get_catalog_product_page, get_product_rating_summary, get_revenue_time_series, give_change, iter_products,
+    list_order_history_page, list_reviews_page, release_cart_reservations, reserve_cart,
+)
+
+def _parse_int_param(request, name: str) -> int | None:
+    """ Reads an optional integer query parameter, raising ValidationError if it is malformed. """
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"Query parameter '{name}' must be an integer.")
 
-from .models import Product, Cart, CartItem, Order, OrderItem, Category, Review
-from .services import calculate_cart_total, clear_user_cart
+def _parse_money_param(request, name: str) -> int | None:
+    """ Reads an optional UGX amount query parameter, raising ValidationError if it is malformed. """
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return to_minor(value)
+    except ValidationError:
+        raise ValidationError(f"Query parameter '{name}' must be a whole UGX amount.")
+
+def _parse_date_param(request, name: str) -> date | None:
+    """ Reads an optional YYYY-MM-DD query parameter, raising ValidationError if it is malformed. """
+    value = request.query_params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(f"Query parameter '{name}' must be a date (YYYY-MM-DD).")
+
+def _stream_json_array(rows):
+    """ Encodes an iterable of rows as a JSON array one row at a time. """
+    encoder = DjangoJSONEncoder()
+    yield "["
+    for index, row in enumerate(rows):
+        if index:
+            yield ","
+        yield encoder.encode(row)
+    yield "]"
 
 # Create your views here.
 class HomeView(APIView):
@@ -16,55 +69,105 @@ class HomeView(APIView):
 class CheckoutView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
+    def post(self, request):
+        try:
+            order = checkout_cart(request.user, payment_method=request.data.get("payment_method", "cash"))
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"message": "Checkout successful", "order_id": order.id})
+
+class CheckoutStartView(APIView):
+    permission_classes = [IsAuthenticated]
+
     def post(self, request):
-        # Implement checkout logic here
+        # The same cart checkout_cart will sell, even if the user has more than one.
         cart = Cart.objects.filter(user=request.user).first()
-        if not cart:
+        if cart is None:
             return Response({"error": "Cart is empty"}, status=400)
+        try:
+            expires_at = reserve_cart(cart)
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"message": "Stock reserved", "expires_at": expires_at})
 
-        total_price = calculate_cart_total(cart)
-        order = Order.objects.create(user=request.user, total_price=total_price)
+class ProductListView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        for item in CartItem.objects.filter(cart=cart):
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
-            )
+    def get(self, request):
+        try:
+            cursor = _parse_int_param(request, "cursor")
+            page_size = _parse_int_param(request, "page_size")
+            if request.query_params.get("stream") in ("1", "true"):
+                # Stream the whole catalog after the cursor without materializing it in memory.
+                return StreamingHttpResponse(_stream_json_array(iter_products(after_id=cursor)), content_type="application/json")
+            product_data, next_cursor = get_catalog_product_page(after_id=cursor, page_size=page_size)
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"results": product_data, "next_cursor": next_cursor})
 
-        clear_user_cart(cart)
-        return Response({"message": "Checkout successful"})
+class ProductSearchView(APIView):
+    permission_classes = [IsAuthenticated]
 
-class ProductListView(APIView):
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "Query parameter 'q' is required"}, status=400)
+        try:
+            page = _parse_int_param(request, "page")
+            if page is None:
+                page = 1
+            page_size = _parse_int_param(request, "page_size")
+            if page < 1 or (page_size is not None and page_size < 1):
+                raise ValidationError("Page and page size must be positive integers.")
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+
+        results, has_next = search_products(query, page=page, page_size=page_size)
+        return Response({"results": results, "page": page, "next_page": page + 1 if has_next else None})
+
+class ProductFilterView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        products = Product.objects.all()
-        product_data = [{"id": p.id, "name": p.name, "description": p.description, "price": p.price, "stock": p.stock} for p in products]
-        return Response(product_data)
+        in_stock = request.query_params.get("in_stock")
+        try:
+            category_ids = [int(value) for value in request.query_params.getlist("category")]
+        except ValueError:
+            return Response({"error": "Category ids must be integers"}, status=400)
+        try:
+            result = filter_products(
+                category_ids=category_ids,
+                min_price=_parse_money_param(request, "min_price"),
+                max_price=_parse_money_param(request, "max_price"),
+                in_stock=None if in_stock in (None, "") else in_stock in ("1", "true"),
+                after_id=_parse_int_param(request, "cursor"),
+                page_size=_parse_int_param(request, "page_size"),
+            )
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(result)
 
 class CartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        items = CartItem.objects.filter(cart=cart)
-        item_data = [{"product_id": item.product.id, "quantity": item.quantity} for item in items]
-        total_price = calculate_cart_total(cart)
-        return Response({"items": item_data, "total_price": total_price})
+        return Response(get_cart_summary(request.user.id))
 
     def post(self, request):
         product_id = request.data.get("product_id")
         quantity = request.data.get("quantity", 1)
 
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            return Response({"error": "Quantity must be an integer"}, status=400)
+
         try:
             product = Product.objects.get(id=product_id)
             cart, created = Cart.objects.get_or_create(user=request.user)
-            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-            cart_item.quantity += quantity
-            cart_item.save()
-            return Response({"message": "Item added to cart"})
+            cart_item = add_item_to_cart(cart, product, quantity)
+            return Response({"message": "Item added to cart", "quantity": cart_item.quantity})
         except Product.DoesNotExist:
             return Response({"error": "Product does not exist"}, status=400)
         except ValidationError as e:
@@ -73,44 +176,126 @@ class CartView(APIView):
     def delete(self, request):
         try:
             cart = Cart.objects.get(user=request.user)
-            clear_user_cart(cart)
+            get_cart_store().clear(cart)
+            release_cart_reservations(cart)
             return Response({"message": "Cart cleared"})
         except Cart.DoesNotExist:
             return Response({"error": "Cart does not exist"}, status=400)
         
-class OrderView(APIView):
+class CartBatchView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        cart = Cart.objects.filter(user=request.user).first()
-        if not cart:
-            return Response({"error": "Cart is empty"}, status=400)
+        if not isinstance(request.data, dict):
+            return Response({"error": "Expected an object with an operations list."}, status=400)
+        try:
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            apply_cart_operations(cart, request.data.get("operations"))
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(get_cart_summary(request.user.id))
 
-        total_price = calculate_cart_total(cart)
-        order = Order.objects.create(user=request.user, total_price=total_price)
+class OrderView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        for item in CartItem.objects.filter(cart=cart):
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
+    def get(self, request):
+        try:
+            orders, next_cursor = list_order_history_page(
+                request.user.id,
+                cursor=request.query_params.get("cursor"),
+                page_size=_parse_int_param(request, "page_size"),
             )
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"results": orders, "next_cursor": next_cursor})
 
-        clear_user_cart(cart)
+    @idempotent
+    def post(self, request):
+        try:
+            order = checkout_cart(request.user, payment_method=request.data.get("payment_method", "cash"))
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
         return Response({"message": "Order placed successfully", "order_id": order.id})
 
+class TillChangeView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, till_id):
+        try:
+            change = give_change(
+                till_id,
+                request.data.get("amount_paid"),
+                request.data.get("total_cost"),
+                tendered=request.data.get("tendered"),
+            )
+        except Till.DoesNotExist:
+            return Response({"error": "Till does not exist"}, status=400)
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"change": change})
+
 class CategoryListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        categories = Category.objects.all()
-        category_data = [{"id": c.id, "name": c.name, "description": c.description} for c in categories]
-        return Response(category_data)
+        return Response(get_catalog_categories())
+
+class CatalogCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(catalog_cache.stats())
+
+class AnalyticsCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(analytics_cache.stats())
+
+class OrderExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            start, end = _parse_date_param(request, "start"), _parse_date_param(request, "end")
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        # Rows are read and encoded as the client downloads them, so the export never sits in memory.
+        response = StreamingHttpResponse(iter_orders_csv(iter_order_export_rows(start, end)), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="orders.csv"'
+        return response
+
+class RevenueTimeSeriesView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            start, end = _parse_date_param(request, "start"), _parse_date_param(request, "end")
+            if start is None or end is None:
+                raise ValidationError("Query parameters 'start' and 'end' are required.")
+            interval = request.query_params.get("interval", "day")
+            series = get_revenue_time_series(start, end, interval)
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"interval": interval, "results": series})
 
 class ReviewView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def get(self, request):
+        try:
+            product_id = _parse_int_param(request, "product_id")
+            if product_id is None:
+                return Response({"error": "Query parameter 'product_id' is required"}, status=400)
+            reviews, next_cursor = list_reviews_page(
+                product_id,
+                before_id=_parse_int_param(request, "cursor"),
+                page_size=_parse_int_param(request, "page_size"),
+            )
+        except ValidationError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"rating": get_product_rating_summary(product_id), "results": reviews, "next_cursor": next_cursor})
+
     def post(self, request):
         product_id = request.data.get("product_id")
         rating = request.data.get("rating")
@@ -118,12 +303,7 @@ class ReviewView(APIView):
 
         try:
             product = Product.objects.get(id=product_id)
-            review = Review.objects.create(
-                product=product,
-                user=request.user,
-                rating=rating,
-                comment=comment
-            )
+            review = create_review(product, request.user, rating, comment)
             return Response({"message": "Review submitted successfully", "review_id": review.id})
         except Product.DoesNotExist:
             return Response({"error": "Product does not exist"}, status=400)